@@ -1,22 +1,29 @@
 import os
-import functools
+import sys
+import time
+import asyncio
+import logging
+from typing import Optional
 from dotenv import load_dotenv
 
-from pathlib import Path
+load_dotenv()
 
-from llama_index.core import (
-    SimpleDirectoryReader,
-    StorageContext,
-    VectorStoreIndex,
-    load_index_from_storage,
-)
+# Caches de modèles (HuggingFace, NLTK) pointés vers le bundle local en mode hors
+# ligne strict, avant l'import des plugins et de LlamaIndex qui les lisent à l'import.
+# Un bundle manquant n'arrête le worker qu'au démarrage (require_bundle), pas à l'import
+from model_bundle import activate_bundle, log_startup_timings, require_bundle, timed  # noqa: E402
+
+activate_bundle()
 
 from livekit import agents
 from livekit.agents import (
     AgentSession,
     Agent,
+    ChatContext,
+    ChatMessage,
     RoomInputOptions,
     JobProcess,          
+    StopResponse,
 )
 from livekit.plugins import (
     elevenlabs,
@@ -28,94 +35,288 @@ from livekit.plugins import (
 
 from livekit.plugins.turn_detector.multilingual import MultilingualModel
 
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import Settings
+# Imports légers : LlamaIndex, HuggingFace et le client Google ne sont chargés
+# qu'au prewarm ou au premier usage (voir PRELOAD_MODULES)
+from faq_router import is_faq_candidate
+from fr_datetime import preload_date_parser
+from knowledge_base import (
+    EMBED_BACKEND,
+    RAG_MODE,
+    RAG_TOP_K,
+    LazyIndex,
+    create_retriever,
+    format_retrieved_chunks,
+    load_embed_model,
+)
+from semantic_cache import SemanticCache
+from tenants import Tenant, TenantConfig, TenantRegistry, UnknownTenantError
+from latency_tracing import TurnTracer, traced_tool
+from patients import require_patient_key_secret
+from speculation import SPECULATIVE_TOOLS, Speculation
+from tts_cache import PhraseCache, cached_tts_node
 
 from prompts import (
+    CACHED_PHRASES,
+    GREETING,
     INSTRUCTIONS,
+    UNKNOWN_TENANT_REPLY,
     book_appointment,
     reschedule_appointment,
     cancel_appointment,
+    find_available_slots,
 )
 
-load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Charger l'index RAG au prewarm ("1") ou seulement au premier appel de query_info ("0")
+RAG_PRELOAD = os.getenv("RAG_PRELOAD", "1") == "1"
 
-# ---------- RAG index initialisation ----------
-THIS_DIR = Path(__file__).parent
-PERSIST_DIR = THIS_DIR / "query-engine-storage"
-
-if not PERSIST_DIR.exists():
-    # First run: index all Markdown / text files in the "docs" folder
-    documents = SimpleDirectoryReader(THIS_DIR / "docs").load_data()
-    index = VectorStoreIndex.from_documents(documents)
-    index.storage_context.persist(persist_dir=PERSIST_DIR)
-else:
-    # Redémarrage: Re‑use the existing persisted index
-    storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-    index = load_index_from_storage(storage_context)
-# ----------------------------------------------
+# Voix ElevenLabs de l'agent (elle fait aussi partie de la clé du cache audio des phrases fixes)
+TTS_VOICE_ID = os.environ.get("ELEVEN_VOICE_ID", "FpvROcY4IGWevepmBWO2")
+TTS_MODEL = "eleven_flash_v2_5"
+
+# Modules lourds importés une seule fois dans le forkserver du worker et hérités
+# par chaque job process : ni le processus principal ni les jobs ne les réimportent
+PRELOAD_MODULES = [
+    "llama_index.core",
+    "mmap_vector_store",
+    "onnx_embedding" if EMBED_BACKEND == "onnx" else "llama_index.embeddings.huggingface",
+    "googleapiclient.discovery",
+    "google_auth_httplib2",
+    "dateparser",
+]
 
 # -------------------- PREWARM (one‑time per process) --------------------
 def prewarm(proc: JobProcess) -> None:
     """Load heavy resources once per process and store them in proc.userdata."""
     import gc
 
+    require_bundle()
+    # Sans secret, réservation, report et annulation échoueraient en plein appel
+    require_patient_key_secret()
+
     # Silero VAD weights (~15 MB) – loaded once, reused by all jobs in the process
-    proc.userdata["vad"] = silero.VAD.load()
+    with timed("silero-vad"):
+        proc.userdata["vad"] = silero.VAD.load()
 
     # Load the multilingual embedding model once per process
-    # Utiliser un modèle encore plus léger si nécessaire
-    Settings.embed_model = HuggingFaceEmbedding(
-        model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    )
+    # (le même modèle sert à construire l'index et à l'interroger)
+    with timed("embedding"):
+        embed_model = load_embed_model()
+
+    # Cabinet par défaut (.env, docs/) : index RAG chargé ici, ou paresseusement au
+    # premier appel de query_info, avec son cache sémantique des réponses
+    default_tenant = Tenant(TenantConfig.default(), embed_model, index=LazyIndex())
+    if RAG_PRELOAD:
+        with timed("rag-index"):
+            default_tenant.index.get()
+    log_startup_timings()
+
+    # Autres cabinets (tenants/<id>/) : chargés au premier appel, partagent le modèle d'embedding
+    proc.userdata["tenants"] = TenantRegistry(embed_model, default_tenant)
+
+    # Données françaises de dateparser, sinon chargées pendant le premier appel
+    with timed("dateparser-fr"):
+        preload_date_parser()
+
+    # Audio des phrases fixes (accueil, refus, réponses des outils), mappé en mémoire
+    proc.userdata["phrase_cache"] = PhraseCache(TTS_VOICE_ID, TTS_MODEL, CACHED_PHRASES)
+    proc.userdata["phrase_cache"].load()
 
     # Force garbage collection
     gc.collect()
 # -----------------------------------------------------------------------
 
-def create_query_info_tool(query_engine):
+def create_query_info_tool(
+    index: LazyIndex,
+    answer_cache: Optional[SemanticCache] = None,
+    mode: str = RAG_MODE,
+    speculation: Optional[Speculation] = None,
+):
+    query_engine = None
+    retriever = None
+    loaded = None
+
+    async def refresh_engines() -> None:
+        # Recrée query_engine / retriever au premier appel et après un rechargement à chaud
+        nonlocal query_engine, retriever, loaded
+        snapshot = await index.asnapshot()
+        if snapshot is not loaded:
+            loaded = snapshot
+            query_engine = None
+            retriever = create_retriever(loaded.index, loaded.lexical, top_k=RAG_TOP_K)
+
+    async def answer_with_synthesis(query_bundle: "QueryBundle") -> str:
+        nonlocal query_engine
+        await refresh_engines()
+        if query_engine is None and loaded.lexical is None:
+            query_engine = loaded.index.as_query_engine(use_async=True)
+        elif query_engine is None:
+            from llama_index.core.query_engine import RetrieverQueryEngine
+            query_engine = RetrieverQueryEngine.from_args(retriever, use_async=True)
+        return str(await query_engine.aquery(query_bundle))
+
+    async def answer_with_retrieval(query_bundle: "QueryBundle") -> str:
+        # Extraits bruts renvoyés au LLM de session : pas de second appel LLM
+        await refresh_engines()
+        return format_retrieved_chunks(await retriever.aretrieve(query_bundle))
+
+    async def answer_lexically(query: str) -> Optional[str]:
+        # Question par mots-clés résolue par l'index BM25 : ni embedding, ni cache sémantique
+        if mode != "retrieval":
+            return None
+        await refresh_engines()
+        exact_match = getattr(retriever, "exact_match", None)
+        nodes = exact_match(query) if exact_match is not None else None
+        return format_retrieved_chunks(nodes) if nodes else None
+
+    answer_query = answer_with_retrieval if mode == "retrieval" else answer_with_synthesis
+
+    async def embed_query(query: str):
+        if answer_cache is not None:
+            return await answer_cache.embed(query)
+        # Hors de la boucle d'événements : l'embedding est un calcul CPU bloquant
+        return await asyncio.to_thread(load_embed_model().get_query_embedding, query)
+
+    if speculation is not None:
+        async def answer_text(text: str, embedding) -> str:
+            from llama_index.core.schema import QueryBundle
+            return await answer_query(QueryBundle(query_str=text, embedding=embedding))
+
+        # Recherche lancée par anticipation sur la phrase en cours de l'appelant
+        speculation.register_retrieval(embed_query, answer_text, synthesis=mode != "retrieval")
+
     @agents.llm.function_tool
+    @traced_tool
     async def query_info(query: str) -> str:
         """Recherche d'information dans la base documentaire vectorielle."""
-        res = await query_engine.aquery(query)
-        return str(res)
+        from llama_index.core.schema import QueryBundle
+
+        started = time.perf_counter()
+        answer = await answer_lexically(query)
+        if answer is not None:
+            logger.info(f"query_info answered lexically in {(time.perf_counter() - started) * 1000:.0f} ms")
+            return answer
+
+        query_bundle = QueryBundle(query_str=query)
+        if answer_cache is not None and answer_cache.enabled:
+            # L'embedding calculé pour le cache est réutilisé par le retrieval en cas d'échec
+            query_bundle.embedding = await answer_cache.embed(query)
+            cached_answer = answer_cache.lookup(query_bundle.embedding)
+            if cached_answer is not None:
+                return cached_answer
+
+        answer = None
+        if speculation is not None and speculation.retrieval_enabled:
+            if query_bundle.embedding is None:
+                query_bundle.embedding = await embed_query(query)
+            answer = await speculation.claim_answer(query_bundle.embedding)
+        if answer is None:
+            answer = await answer_query(query_bundle)
+        if answer_cache is not None:
+            answer_cache.store(query_bundle.embedding, answer)
+        logger.info(f"query_info ({mode}) answered in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return answer
     return query_info
 
 class Assistant(Agent):
-    def __init__(self) -> None:
-        # Initialiser le query_engine une seule fois par session
-        self.query_engine = index.as_query_engine(use_async=True)
-
-        # Créer l'outil query_info avec le query_engine de la session
-        query_info_tool = create_query_info_tool(self.query_engine)
+    def __init__(
+        self,
+        index: LazyIndex,
+        answer_cache: Optional[SemanticCache] = None,
+        speculation: Optional[Speculation] = None,
+        phrase_cache: Optional[PhraseCache] = None,
+        instructions: str = INSTRUCTIONS,
+        greeting: str = GREETING,
+    ) -> None:
+        self._phrase_cache = phrase_cache
+        self._greeting = greeting
+        self._index = index
+        # Créer l'outil query_info avec l'index et le cache du processus
+        query_info_tool = create_query_info_tool(index, answer_cache, speculation=speculation)
 
         tools = [
             query_info_tool,
             book_appointment,
             reschedule_appointment,
             cancel_appointment,
+            find_available_slots,
         ]  # expose TOUS les outils au LLM
 
-        super().__init__(instructions=INSTRUCTIONS, tools=tools)
+        super().__init__(instructions=instructions, tools=tools)
+
+    def tts_node(self, text, model_settings):
+        # Phrases fixes servies depuis le cache audio, le reste synthétisé par ElevenLabs
+        if self._phrase_cache is None or not self._phrase_cache.enabled:
+            return Agent.default.tts_node(self, text, model_settings)
+        return cached_tts_node(self, text, model_settings, self._phrase_cache)
+
+    async def on_user_turn_completed(self, turn_ctx: ChatContext, new_message: ChatMessage) -> None:
+        # Question fréquente : la réponse de la FAQ est dite directement, sans LLM ni query_info
+        text = new_message.text_content or ""
+        if not self._index.is_loaded or not is_faq_candidate(text):
+            return
+        router = (await self._index.asnapshot()).faq_router
+        if router is None:
+            return
+
+        started = time.perf_counter()
+        # Embedding calculé hors de la boucle : l'audio et les autres appels du processus continuent
+        embedding = await asyncio.to_thread(load_embed_model().get_query_embedding, text)
+        entry, similarity = router.match(embedding)
+        if entry is None:
+            return
+        logger.info(
+            f"FAQ router answered from '{entry.section}' (similarity {similarity:.3f}) "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        # StopResponse écarte le tour : la question est ajoutée au contexte pour la suite de l'appel
+        chat_ctx = self.chat_ctx.copy()
+        chat_ctx.add_message(role="user", content=text)
+        await self.update_chat_ctx(chat_ctx)
+        self.session.say(entry.answer)
+        raise StopResponse()
 
     async def on_enter(self):
-        # Laisse le LLM commencer la conversation en se basant sur ses instructions.
-        # Le LLM utilisera le message de salutation défini dans prompts.py.
+        # Message d'accueil fixe (prompts.py ou tenant.json du cabinet), servi depuis le cache audio s'il y figure
         # "allow_interruptions=False" est conservé pour s'assurer que le message d'accueil n'est pas coupé.
-        await self.session.say(text="", allow_interruptions=False)
+        await self.session.say(self._greeting, allow_interruptions=False)
+
+
+async def refuse_call(ctx: agents.JobContext) -> None:
+    """Annonce à l'appelant que son cabinet n'est pas servi, puis raccroche."""
+    session = AgentSession(tts=elevenlabs.TTS(voice_id=TTS_VOICE_ID, model=TTS_MODEL))
+    await session.start(room=ctx.room, agent=Agent(instructions=""))
+    await session.say(UNKNOWN_TENANT_REPLY, allow_interruptions=False, add_to_chat_ctx=False)
+    await ctx.delete_room()
+    ctx.shutdown(reason="unknown tenant")
 
 
 async def entrypoint(ctx: agents.JobContext):
     # Establish the connection first so ctx.room is populated
     await ctx.connect()
 
+    # Cabinet de l'appel : son agenda sert aux outils pendant tout l'appel, son index
+    # se charge pendant l'accueil s'il ne l'est pas encore
+    tenants: TenantRegistry = ctx.proc.userdata["tenants"]
+    try:
+        tenant = tenants.acquire(tenants.resolve(ctx.job.metadata, ctx.room.name))
+    except (UnknownTenantError, ValueError) as e:
+        # Jamais d'agenda de repli : l'appel est refusé poliment
+        logger.error(f"Call refused: {e}")
+        await refuse_call(ctx)
+        return
+    tenant.preload()
+
+    async def release_tenant() -> None:
+        tenants.release(tenant)
+
+    ctx.add_shutdown_callback(release_tenant)
+
     session = AgentSession(
         stt=deepgram.STT(model="nova-3", language="multi"),
         llm=openai.LLM(model="gpt-4o-mini", temperature=0.2),
-        tts=elevenlabs.TTS(
-            voice_id=os.environ.get("ELEVEN_VOICE_ID", "FpvROcY4IGWevepmBWO2"),
-            model="eleven_flash_v2_5",
-        ),
+        tts=elevenlabs.TTS(voice_id=TTS_VOICE_ID, model=TTS_MODEL),
         vad=ctx.proc.userdata["vad"],
         turn_detection=MultilingualModel(),
     )
@@ -134,10 +335,28 @@ async def entrypoint(ctx: agents.JobContext):
     ) -> None:  # This callback is intentionally left empty for GDPR compliance.
         pass  # It no longer needs to be async as it doesn't perform any awaitable operations.
 
+    # Latence de chaque tour (STT, détection de fin de tour, LLM, outils, TTS) :
+    # uniquement des durées, jamais le contenu de la conversation
+    tracer = TurnTracer(session_id=ctx.job.id)
+    tracer.attach(session)
+
+    # Exécution spéculative des outils sur les transcriptions intermédiaires (optionnelle)
+    speculation = None
+    if SPECULATIVE_TOOLS:
+        speculation = Speculation(tracer=tracer)
+        speculation.attach(session)
+
     # Start the session
     await session.start(
         room=ctx.room,
-        agent=Assistant(),
+        agent=Assistant(
+            index=tenant.index,
+            answer_cache=tenant.answer_cache,
+            speculation=speculation,
+            phrase_cache=ctx.proc.userdata.get("phrase_cache"),
+            instructions=tenant.config.instructions,
+            greeting=tenant.config.greeting,
+        ),
         room_input_options=RoomInputOptions(
             # LiveKit Cloud enhanced noise cancellation
             # - For telephony applications, use `BVCTelephony` for best results
@@ -145,13 +364,43 @@ async def entrypoint(ctx: agents.JobContext):
         ),
     )
 
+    # Phrases fixes absentes du cache : synthétisées une fois, en tâche de fond
+    phrase_cache = ctx.proc.userdata.get("phrase_cache")
+    if phrase_cache is not None:
+        phrase_cache.fill_in_background(session.tts)
+
+
+async def build_phrase_cache() -> int:
+    """Synthétise hors ligne les phrases fixes absentes du cache audio."""
+    import aiohttp
+
+    async with aiohttp.ClientSession() as http_session:
+        tts = elevenlabs.TTS(voice_id=TTS_VOICE_ID, model=TTS_MODEL, http_session=http_session)
+        return await PhraseCache(TTS_VOICE_ID, TTS_MODEL, CACHED_PHRASES).fill(tts)
+
 
 # Lancement de l’agent vocal (uniquement si le script est exécuté directement)
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["profile-imports"]:
+        # python agent.py profile-imports : temps d'import par paquet, sans démarrer le worker
+        from import_profiler import main as profile_imports
+        profile_imports(sys.argv[2:], preload_modules=PRELOAD_MODULES)
+        sys.exit(0)
+
+    if sys.argv[1:2] == ["build-tts-cache"]:
+        # python agent.py build-tts-cache : audio des phrases fixes, avant le déploiement
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(build_phrase_cache())
+        sys.exit(0)
+
+    # MODEL_OFFLINE=1 sans bundle prêt ou secret patient absent : arrêt immédiat plutôt qu'à chaque prewarm
+    require_bundle()
+    require_patient_key_secret()
     agents.cli.run_app(
         agents.WorkerOptions(
             entrypoint_fnc=entrypoint,
             prewarm_fnc=prewarm,  # use the pre‑loaded resources
             num_idle_processes=1,  # Start with 1 process to avoid download race conditions
+            preload_modules=PRELOAD_MODULES,
         )
     )
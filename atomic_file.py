@@ -0,0 +1,22 @@
+"""
+Écriture atomique de fichiers.
+
+Module sans dépendance (ni numpy ni LlamaIndex) : le processus principal du
+worker peut l'importer sans payer l'import de LlamaIndex.
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+
+def atomic_write(path: Path, write) -> None:
+    """Écrit via un fichier temporaire puis `os.replace` (jamais de fichier partiel visible)."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
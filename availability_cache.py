@@ -0,0 +1,247 @@
+"""
+Cache local des disponibilités (free/busy) d'un calendrier.
+
+Les intervalles occupés d'une fenêtre glissante (par défaut 4 semaines) sont
+chargés une fois, puis tenus à jour par rafraîchissement incrémental
+(`events.list` avec `updatedMin`) et par nos propres écritures (création,
+report, annulation). `check_availability` répond alors depuis la mémoire et ne
+retombe sur l'API que hors fenêtre ou si le cache ne peut pas être rafraîchi.
+Les mêmes événements alimentent, si fourni, l'index des rendez-vous par patient
+(patients.py).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+TIMEZONE = ZoneInfo('Europe/Paris')
+
+# Fraîcheur maximale (secondes) des données avant rafraîchissement incrémental ; 0 désactive le cache
+DEFAULT_TTL = float(os.getenv('AVAILABILITY_CACHE_TTL', '30'))
+# Taille de la fenêtre (jours) chargée en mémoire à partir d'aujourd'hui
+DEFAULT_WINDOW_DAYS = int(os.getenv('AVAILABILITY_CACHE_DAYS', '28'))
+
+# Marge appliquée à `updatedMin` pour absorber le décalage d'horloge avec Google
+_SYNC_MARGIN = timedelta(seconds=60)
+
+Interval = Tuple[datetime, datetime, str]
+EventFetcher = Callable[[datetime, datetime, Optional[datetime]], Awaitable[List[Dict[str, Any]]]]
+
+
+def to_aware(dt: datetime) -> datetime:
+    """Interprète une date naïve comme une heure locale du cabinet (Europe/Paris)."""
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=TIMEZONE)
+    return dt
+
+
+def parse_event_time(value: Dict[str, str]) -> Optional[datetime]:
+    """Convertit un champ `start`/`end` de l'API Calendar en datetime avec fuseau."""
+    if not value:
+        return None
+    if 'dateTime' in value:
+        return to_aware(datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')))
+    if 'date' in value:
+        # Événement sur la journée entière : minuit heure locale
+        return datetime.fromisoformat(value['date']).replace(tzinfo=TIMEZONE)
+    return None
+
+
+class BusyIndex:
+    """Intervalles occupés triés par début, adressables par identifiant d'événement."""
+
+    def __init__(self):
+        self._intervals: List[Interval] = []
+        self._by_id: Dict[str, Interval] = {}
+        # Borne la remontée lors des recherches de chevauchement
+        self._max_duration = timedelta(0)
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def clear(self) -> None:
+        self._intervals.clear()
+        self._by_id.clear()
+        self._max_duration = timedelta(0)
+
+    def upsert(self, event_id: str, start: datetime, end: datetime) -> None:
+        self.remove(event_id)
+        interval = (to_aware(start), to_aware(end), event_id)
+        insort(self._intervals, interval)
+        self._by_id[event_id] = interval
+        self._max_duration = max(self._max_duration, interval[1] - interval[0])
+
+    def remove(self, event_id: str) -> None:
+        interval = self._by_id.pop(event_id, None)
+        if interval is not None:
+            del self._intervals[bisect_left(self._intervals, interval)]
+
+    def _candidates(self, start: datetime, end: datetime):
+        """Parcourt à rebours les intervalles pouvant chevaucher [start, end)."""
+        hi = bisect_left(self._intervals, (end,))
+        horizon = start - self._max_duration
+        for i in range(hi - 1, -1, -1):
+            interval = self._intervals[i]
+            if interval[0] < horizon:
+                break
+            if interval[1] > start:
+                yield interval
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """True si au moins un intervalle occupé chevauche [start, end)."""
+        start, end = to_aware(start), to_aware(end)
+        return next(self._candidates(start, end), None) is not None
+
+    def busy_between(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Intervalles occupés chevauchant [start, end), triés par début."""
+        start, end = to_aware(start), to_aware(end)
+        return sorted((s, e) for s, e, _ in self._candidates(start, end))
+
+
+class AvailabilityCache:
+    """
+    Cache en mémoire des créneaux occupés d'un calendrier.
+
+    Args:
+        fetch_events: Coroutine `(time_min, time_max, updated_min)` renvoyant les
+            événements bruts de l'API (événements supprimés inclus si `updated_min`)
+        ttl: Durée (secondes) pendant laquelle les données sont considérées fraîches
+        window_days: Nombre de jours chargés à partir d'aujourd'hui
+        patients: PatientIndex tenu à jour avec les mêmes événements (optionnel)
+    """
+
+    def __init__(
+        self,
+        fetch_events: EventFetcher,
+        ttl: float = DEFAULT_TTL,
+        window_days: int = DEFAULT_WINDOW_DAYS,
+        patients=None
+    ):
+        self._fetch_events = fetch_events
+        self.ttl = ttl
+        self.window_days = window_days
+        self.index = BusyIndex()
+        self.patients = patients
+        self.window_start: Optional[datetime] = None
+        self.window_end: Optional[datetime] = None
+        self._last_sync: Optional[datetime] = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.window_days > 0
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._last_sync is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        if self.window_start is None:
+            return False
+        return self.window_start <= to_aware(start) and to_aware(end) <= self.window_end
+
+    def invalidate(self) -> None:
+        """Force un rafraîchissement avant la prochaine réponse."""
+        self._fetched_at = 0.0
+
+    def apply_event(self, event: Dict[str, Any]) -> None:
+        """Répercute un événement (créé, modifié ou supprimé) dans l'index."""
+        event_id = event.get('id')
+        if not event_id:
+            return
+        start = parse_event_time(event.get('start'))
+        end = parse_event_time(event.get('end'))
+        if (
+            event.get('status') == 'cancelled'
+            or event.get('transparency') == 'transparent'
+            or start is None
+            or end is None
+        ):
+            self.index.remove(event_id)
+        else:
+            self.index.upsert(event_id, start, end)
+        if self.patients is not None:
+            self.patients.apply_event(event, start, end)
+
+    def remove_event(self, event_id: str) -> None:
+        self.index.remove(event_id)
+        if self.patients is not None:
+            self.patients.remove(event_id)
+
+    async def refresh(self) -> None:
+        """Charge la fenêtre complète, ou seulement les changements depuis la dernière synchro."""
+        async with self._lock:
+            if self.is_fresh:
+                return
+            today = datetime.now(TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+            sync_started = datetime.now(timezone.utc)
+
+            if self._last_sync is None or self.window_start != today:
+                window_end = today + timedelta(days=self.window_days)
+                events = await self._fetch_events(today, window_end, None)
+                self.index.clear()
+                if self.patients is not None:
+                    self.patients.clear()
+                self.window_start, self.window_end = today, window_end
+                logger.info(f"Availability cache seeded with {len(events)} events")
+            else:
+                events = await self._fetch_events(
+                    self.window_start, self.window_end, self._last_sync - _SYNC_MARGIN
+                )
+                if events:
+                    logger.info(f"Availability cache refreshed: {len(events)} changed events")
+
+            for event in events:
+                self.apply_event(event)
+            self._last_sync = sync_started
+            self._fetched_at = time.monotonic()
+
+    async def _ensure_covers(self, start: datetime, end: datetime) -> bool:
+        """Rafraîchit si nécessaire ; True si la mémoire peut répondre pour [start, end)."""
+        if not self.enabled:
+            return False
+        if not self.covers(start, end) or not self.is_fresh:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Availability cache refresh failed: {e}")
+                self.misses += 1
+                return False
+            if not self.covers(start, end):
+                self.misses += 1
+                return False
+        self.hits += 1
+        return True
+
+    async def is_available(self, start: datetime, end: datetime) -> Optional[bool]:
+        """
+        Répond depuis la mémoire si possible.
+
+        Returns:
+            True/False si le cache couvre le créneau, None s'il faut interroger l'API
+        """
+        if not await self._ensure_covers(start, end):
+            return None
+        return not self.index.overlaps(start, end)
+
+    async def busy_index(self, start: datetime, end: datetime) -> Optional[BusyIndex]:
+        """Index des créneaux occupés si le cache couvre [start, end), None sinon."""
+        if not await self._ensure_covers(start, end):
+            return None
+        return self.index
+
+    async def patient_appointments(self, key: str, start: datetime, end: datetime) -> Optional[List[Interval]]:
+        """Rendez-vous du patient qui commencent dans [start, end), None si le cache ne couvre pas la période."""
+        if self.patients is None or not await self._ensure_covers(start, end):
+            return None
+        return self.patients.find(key, start, end)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test de charge : N appels parallèles à `book_appointment` ne doivent pas
+ralentir les pipelines audio des autres appels du même processus.
+
+Chaque pipeline audio est simulé par une coroutine qui attend une trame toutes
+les 20 ms (comme le flux STT/TTS) et mesure son retard. L'API Google Calendar est
+remplacée par le faux client de fakes.py dont chaque `.execute()` bloque le thread
+appelant pendant une latence configurable, exactement comme googleapiclient.
+
+Usage :
+    python bench_calendar_concurrency.py --calls 20 --latency 0.3
+    python bench_calendar_concurrency.py --blocking   # comportement historique
+"""
+
+import os
+import argparse
+import asyncio
+import statistics
+import time
+
+# Clés patient des rendez-vous simulés (lues à l'import de patients.py)
+os.environ.setdefault("PATIENT_KEY_SECRET", "bench")
+
+import calendar_service  # noqa: E402
+from calendar_service import GoogleCalendarService  # noqa: E402
+from fakes import FakeCalendarApi, simulate_audio_stream  # noqa: E402
+from prompts import book_appointment  # noqa: E402
+
+
+async def run_load_test(calls: int, latency: float) -> dict:
+    stop = asyncio.Event()
+    lateness: list = []
+    pipelines = [asyncio.create_task(simulate_audio_stream(stop, lateness)) for _ in range(calls)]
+
+    async def one_booking(i: int) -> tuple:
+        start = time.perf_counter()
+        # Un créneau distinct par appel pour que chaque réservation aboutisse
+        answer = await book_appointment(f"le 2 juillet 2030 à {8 + i % 10}h{'30' if i >= 10 else '00'}",
+                                        f"Patient {i}", f"06{i:08d}")
+        return time.perf_counter() - start, "confirmé" in answer
+
+    await asyncio.sleep(0.2)  # laisser les pipelines démarrer
+    results = await asyncio.gather(*(one_booking(i) for i in range(calls)))
+    booking_times = [duration for duration, _ in results]
+    stop.set()
+    await asyncio.gather(*pipelines)
+
+    lateness_ms = sorted(x * 1000 for x in lateness)
+    return {
+        'booking_p50': statistics.median(booking_times),
+        'booking_max': max(booking_times),
+        'booked': sum(booked for _, booked in results),
+        'frame_p50_ms': statistics.median(lateness_ms),
+        'frame_p99_ms': lateness_ms[int(0.99 * (len(lateness_ms) - 1))],
+        'frame_max_ms': lateness_ms[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20, help="Nombre d'appels simultanés")
+    parser.add_argument('--latency', type=float, default=0.3, help="Latence simulée de l'API (s)")
+    parser.add_argument('--max-concurrency', type=int, default=8, help="Taille du pool de threads")
+    parser.add_argument('--blocking', action='store_true',
+                        help="Exécute les requêtes directement dans la boucle (ancien comportement)")
+    args = parser.parse_args()
+
+    service = GoogleCalendarService(
+        service=FakeCalendarApi(args.latency),
+        max_concurrency=args.max_concurrency
+    )
+    if args.blocking:
+        async def inline_execute(request):
+            return service._execute_blocking(request)
+        service._execute = inline_execute
+    calendar_service._calendar_service = service
+
+    mode = "bloquant (historique)" if args.blocking else "pool de threads borné"
+    print(f"🔧 {args.calls} réservations parallèles, latence API {args.latency}s, mode {mode}")
+    result = asyncio.run(run_load_test(args.calls, args.latency))
+    print(f"📅 Réservation : p50 {result['booking_p50']:.2f}s, max {result['booking_max']:.2f}s, "
+          f"{result['booked']}/{args.calls} confirmées")
+    if result['booked'] < args.calls:
+        print("⚠️  Des réservations ont échoué : les durées mesurent en partie des chemins d'erreur")
+    print(f"🎧 Retard des trames audio : p50 {result['frame_p50_ms']:.1f} ms, "
+          f"p99 {result['frame_p99_ms']:.1f} ms, max {result['frame_max_ms']:.1f} ms")
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark de l'analyse des dates de rendez-vous : fr_datetime contre dateparser.
+
+Un corpus de formulations réelles est analysé avec une date de référence fixe
+(mardi 20 octobre 2026, 11h17). Pour chaque analyseur : temps du premier appel
+(import et chargement des données de langue), temps moyen par expression
+reconnue par fr_datetime (les autres partent de toute façon chez dateparser), et
+exactitude par rapport au résultat attendu. Pour fr_datetime, le temps est
+mesuré cache vide puis cache chaud.
+
+Usage :
+    python bench_date_parser.py [--repeat 20] [--verbose]
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+import fr_datetime
+
+REFERENCE = datetime(2026, 10, 20, 11, 17, 5)  # un mardi
+# Expressions laissées à dateparser : le résultat attendu est le sien
+FALLBACK = object()
+
+CORPUS = [
+    ("demain à 15h", datetime(2026, 10, 21, 15, 0)),
+    ("mardi prochain 10h30", datetime(2026, 10, 27, 10, 30)),
+    ("le 2 juillet à 14h", datetime(2027, 7, 2, 14, 0)),
+    ("mardi à 10h", datetime(2026, 10, 27, 10, 0)),
+    ("ce mardi à 16h", datetime(2026, 10, 20, 16, 0)),
+    ("lundi à 9h", datetime(2026, 10, 26, 9, 0)),
+    ("aujourd'hui à 16h", datetime(2026, 10, 20, 16, 0)),
+    ("après-demain à 9h15", datetime(2026, 10, 22, 9, 15)),
+    ("le 25 décembre à 10h30", datetime(2026, 12, 25, 10, 30)),
+    ("25 décembre 10h30", datetime(2026, 12, 25, 10, 30)),
+    ("jeudi prochain à 14h", datetime(2026, 10, 22, 14, 0)),
+    ("samedi 14 novembre à 11h", datetime(2026, 11, 14, 11, 0)),
+    ("demain à midi", datetime(2026, 10, 21, 12, 0)),
+    ("demain 15:30", datetime(2026, 10, 21, 15, 30)),
+    ("le 1er novembre à 10h", datetime(2026, 11, 1, 10, 0)),
+    ("le 2/11 à 10h", datetime(2026, 11, 2, 10, 0)),
+    ("02/11/2026 10:00", datetime(2026, 11, 2, 10, 0)),
+    ("demain à 15 heures", datetime(2026, 10, 21, 15, 0)),
+    ("demain à 3h de l'après-midi", datetime(2026, 10, 21, 15, 0)),
+    ("mercredi 17h", datetime(2026, 10, 21, 17, 0)),
+    ("à 9h", datetime(2026, 10, 21, 9, 0)),
+    ("à 16h30", datetime(2026, 10, 20, 16, 30)),
+    ("le 3 mars 2027 à 8h", datetime(2027, 3, 3, 8, 0)),
+    ("le 20 octobre à 9h", datetime(2027, 10, 20, 9, 0)),
+    ("2026-10-23T14:00", datetime(2026, 10, 23, 14, 0)),
+    ("vendredi à 14h et demie", datetime(2026, 10, 23, 14, 30)),
+    ("demain à 9h du matin", datetime(2026, 10, 21, 9, 0)),
+    ("demain à 8h45", datetime(2026, 10, 21, 8, 45)),
+    ("Rendez-vous avec M. Dupont demain à 14h30", datetime(2026, 10, 21, 14, 30)),
+    ("déplacer de demain 14h à vendredi 16h", datetime(2026, 10, 23, 16, 0)),
+    ("demain", None),
+    ("le 2 juillet", None),
+    ("dans 2 heures", FALLBACK),
+    ("la semaine prochaine", FALLBACK),
+]
+
+
+def parse_with_dateparser(text: str):
+    import dateparser
+    settings = dict(fr_datetime.DATEPARSER_SETTINGS, RELATIVE_BASE=REFERENCE)
+    return dateparser.parse(text, languages=fr_datetime.DATEPARSER_LANGUAGES, settings=settings)
+
+
+def parse_with_fr_datetime(text: str):
+    return fr_datetime.parse_french_datetime(text, REFERENCE)
+
+
+def _timed_pass(parse, texts: list, repeat: int, clear_cache: bool = False) -> float:
+    """Temps moyen (ms) par expression."""
+    elapsed = 0.0
+    for _ in range(repeat):
+        if clear_cache:
+            fr_datetime.clear_cache()
+        started = time.perf_counter()
+        for text in texts:
+            parse(text)
+        elapsed += time.perf_counter() - started
+    return elapsed / (repeat * len(texts)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--verbose', action='store_true', help="Affiche le résultat de chaque expression")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    parse_with_dateparser(CORPUS[0][0])
+    dateparser_first = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    parse_with_fr_datetime(CORPUS[0][0])
+    fast_first = (time.perf_counter() - started) * 1000
+
+    correct = {'dateparser': 0, 'fr_datetime': 0}
+    for text, expected in CORPUS:
+        reference = parse_with_dateparser(text)
+        fast = parse_with_fr_datetime(text)
+        expected = reference if expected is FALLBACK else expected
+        correct['dateparser'] += reference == expected
+        correct['fr_datetime'] += fast == expected
+        if args.verbose or fast != expected:
+            mark = "✅" if fast == expected else "❌"
+            print(f"   {mark} {text!r:45} attendu {expected}, fr_datetime {fast}, dateparser {reference}")
+
+    recognized = [text for text, expected in CORPUS if expected is not FALLBACK]
+    dateparser_ms = _timed_pass(parse_with_dateparser, recognized, args.repeat)
+    cold_ms = _timed_pass(parse_with_fr_datetime, recognized, args.repeat, clear_cache=True)
+    warm_ms = _timed_pass(parse_with_fr_datetime, recognized, args.repeat)
+
+    print(f"📊 {len(CORPUS)} expressions ({len(recognized)} reconnues par fr_datetime), {args.repeat} répétitions")
+    print(f"   dateparser  : 1er appel {dateparser_first:.0f} ms, {dateparser_ms:.3f} ms/expression, "
+          f"exactes {correct['dateparser']}/{len(CORPUS)}")
+    print(f"   fr_datetime : 1er appel {fast_first:.1f} ms, {cold_ms:.3f} ms/expression (cache vide), "
+          f"{warm_ms:.4f} ms/expression (cache chaud), exactes {correct['fr_datetime']}/{len(CORPUS)}")
+    print(f"   accélération : x{dateparser_ms / cold_ms:.0f} (cache vide), x{dateparser_ms / warm_ms:.0f} (cache chaud)")
+
+
+if __name__ == "__main__":
+    main()
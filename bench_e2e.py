@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout de l'agent, hors ligne, sur des conversations scriptées.
+
+Chaque appel simulé rejoue un scénario (prise de rendez-vous, questions à la
+base documentaire, report, annulation) tour par tour comme le pipeline vocal :
+transcription finale et décision de fin de tour, premier token du LLM, outils
+de `Assistant` exécutés pour de vrai (service calendrier, analyse des dates,
+recherche de créneaux, query_info), second passage LLM puis premier audio TTS.
+Deepgram, OpenAI, ElevenLabs et Google Calendar sont remplacés par les doublures
+de fakes.py, à latence configurable ("médiane:p95" en secondes) ; le LLM suit
+le script au lieu de choisir les outils.
+
+L'appelant « parle » (--word-rate secondes par mot, une transcription
+intermédiaire par mot) avant chaque fin de tour, ce qui permet de mesurer
+l'exécution spéculative des outils (--speculative). book_appointment et
+reschedule_appointment annoncent leur traitement dès leur appel (phrase du
+cache audio) ; --no-ack mesure la latence sans cette annonce. --backend sqlite
+remplace l'agenda Google par la base SQLite locale (db_driver.py), chargée une
+fois depuis l'agenda factice.
+
+Rapport : débit (appels et tours par seconde), p50/p95/p99 par étape et de la
+latence de réponse (fin de parole -> premier audio), retard des trames audio
+(boucle d'événements bloquée), nombre et durée des requêtes à l'API Calendar
+par opération.
+
+Usage :
+    python bench_e2e.py --calls 20
+    python bench_e2e.py --calls 50 --calendar 0.2:0.6 --scenario booking
+    python bench_e2e.py --speculative   # outils lancés pendant que l'appelant parle
+    python bench_e2e.py --backend sqlite   # agenda local (CALENDAR_BACKEND=sqlite)
+    RAG_MODE=retrieval python bench_e2e.py --rag-index real   # vrai index (bundle de modèles requis)
+"""
+
+import os
+import inspect
+import argparse
+import asyncio
+import random
+import time
+import importlib
+from datetime import date, datetime, time as dt_time, timedelta
+
+# Clés patient des rendez-vous simulés
+os.environ.setdefault("PATIENT_KEY_SECRET", "bench")
+
+import calendar_service  # noqa: E402
+from agent import PRELOAD_MODULES, Assistant  # noqa: E402
+from calendar_service import GoogleCalendarService  # noqa: E402
+from db_driver import SqliteCalendarService  # noqa: E402
+from fr_datetime import preload_date_parser  # noqa: E402
+from fakes import FakeCalendarApi, FakeEmbedding, FakeIndex, FakeLLM, FakeSTT, FakeTTS, FakeTurnDetector, simulate_audio_stream  # noqa: E402
+from latency_tracing import LatencyStats, get_latency_sink, quantile  # noqa: E402
+from patients import patient_key, patient_properties  # noqa: E402
+from semantic_cache import SemanticCache  # noqa: E402
+from speculation import AVAILABILITY, QUERY_INFO, Speculation  # noqa: E402
+
+_MONTHS = ['janvier', 'février', 'mars', 'avril', 'mai', 'juin', 'juillet', 'août',
+           'septembre', 'octobre', 'novembre', 'décembre']
+
+
+class Turn:
+    """Tour scripté : phrase de l'appelant, outils appelés par le LLM et réponse prononcée."""
+
+    def __init__(self, user: str, tools=(), reply: str = ""):
+        self.user = user
+        self.tools = list(tools)
+        self.reply = reply
+
+
+SCENARIOS = {
+    'booking': [
+        Turn("Bonjour, je voudrais prendre rendez-vous.",
+             reply="Bien sûr. Pouvez-vous me donner vos prénom, nom, téléphone et e-mail ?"),
+        Turn("Je suis disponible le mardi et le jeudi, pas le matin.",
+             tools=[('find_available_slots', {'preferences': "le mardi et le jeudi, pas le matin"})],
+             reply="Voici les prochains créneaux libres."),
+        Turn("Alors {slot}, s'il vous plaît.",
+             tools=[('book_appointment', {'details': "{slot}", 'patient_name': "{name}", 'phone': "{phone}"})],
+             reply="Parfait, votre rendez-vous est confirmé."),
+    ],
+    'info': [
+        Turn("Quelle est l'adresse du cabinet ?",
+             tools=[('query_info', {'query': "adresse du cabinet"})],
+             reply="Le cabinet se trouve au 12, rue de la Santé à Paris."),
+        Turn("Et combien coûte une consultation ?",
+             tools=[('query_info', {'query': "combien coûte une consultation"})],
+             reply="Une consultation coûte 27,50 euros."),
+    ],
+    'reschedule': [
+        Turn("Je voudrais déplacer mon rendez-vous à {slot}.",
+             tools=[('reschedule_appointment', {'details': "{slot}", 'patient_name': "{name}", 'phone': "{phone}"})],
+             reply="Votre rendez-vous a été reporté."),
+    ],
+    'cancel': [
+        Turn("Je dois annuler mon prochain rendez-vous.",
+             tools=[('cancel_appointment', {'details': "mon prochain rendez-vous", 'patient_name': "{name}",
+                                            'phone': "{phone}"})],
+             reply="Votre rendez-vous a été annulé."),
+    ],
+}
+
+
+def slot_text(call: int) -> str:
+    """Créneau distinct par appel, en semaine, pour que chaque réservation aboutisse."""
+    day = date.today() + timedelta(days=6)
+    for _ in range(call // 8 + 1):
+        day += timedelta(days=1)
+        while day.weekday() >= 5:
+            day += timedelta(days=1)
+    return f"le {day.day} {_MONTHS[day.month - 1]} {day.year} à {9 + call % 8}h"
+
+
+def patient(call: int):
+    """Nom et téléphone du patient de l'appel simulé."""
+    return f"Patient {call}", f"06{call:08d}"
+
+
+def seed_calendar(api: FakeCalendarApi, count: int) -> None:
+    """Un rendez-vous existant par patient dans les 7 prochains jours, cible des reports et annulations."""
+    today = date.today()
+    for i in range(count):
+        start = datetime.combine(today + timedelta(days=1 + i % 5), dt_time(8, 0)) + timedelta(minutes=30 * (i // 5))
+        api.add_event("Rendez-vous Kinésithérapie", start, start + timedelta(minutes=30),
+                      private=patient_properties(patient_key(*patient(i)))['private'])
+
+
+def warm_up() -> None:
+    """Comme le worker : modules lourds préchargés et données de dateparser chargées avant le premier appel."""
+    for module in PRELOAD_MODULES:
+        importlib.import_module(module)
+    preload_date_parser()
+
+
+def _is_failure(result: str) -> bool:
+    return "erreur" in result.lower()
+
+
+class Pipeline:
+    """Doublures du pipeline vocal partagées par les appels simulés."""
+
+    def __init__(self, args):
+        seed = args.seed
+        self.stt = FakeSTT(args.stt, seed=seed)
+        self.turn_detector = FakeTurnDetector(args.eou, seed=seed + 1)
+        self.llm = FakeLLM(args.llm, seed=seed + 2)
+        self.tts = FakeTTS(args.tts, seed=seed + 3)
+
+
+class _AckRecorder:
+    """
+    Tient lieu de RunContext pour les outils : leur annonce, phrase du cache
+    audio, est audible dès qu'elle est demandée.
+    """
+
+    def __init__(self):
+        self.session = self
+        self.spoken_at = None
+
+    def say(self, text: str, **kwargs) -> None:
+        if self.spoken_at is None:
+            self.spoken_at = time.perf_counter()
+
+
+class _SpeculationRecorder:
+    """Reçoit les issues des exécutions spéculatives à la place d'un TurnTracer."""
+
+    def __init__(self, stats: LatencyStats):
+        self.stats = stats
+
+    def record_speculation(self, kind: str, outcome: str, saved=None) -> None:
+        self.stats.count_speculation(kind, outcome)
+        if saved is not None:
+            self.stats.add(f"speculation_saved:{kind}", saved)
+
+
+async def speak(utterance: str, word_rate: float, speculation) -> None:
+    """L'appelant parle : une transcription intermédiaire par mot prononcé."""
+    words = utterance.split()
+    for i in range(1, len(words) + 1):
+        await asyncio.sleep(word_rate)
+        if speculation is not None:
+            speculation.on_transcript(" ".join(words[:i]))
+
+
+async def run_call(call: int, scenario: str, tools: dict, pipeline: Pipeline, stats: LatencyStats,
+                   failures: list, args, speculation=None) -> int:
+    """Rejoue un scénario ; renvoie le nombre de tours joués."""
+    slot = slot_text(call)
+    patient_name, patient_phone = patient(call)
+    for turn in SCENARIOS[scenario]:
+        utterance = turn.user.format(slot=slot)
+        if args.word_rate:
+            await speak(utterance, args.word_rate, speculation)
+        # Fin de parole de l'appelant : transcription finale et décision de fin de tour en parallèle
+        speech_ended = time.perf_counter()
+
+        async def transcript() -> None:
+            await pipeline.stt.transcribe(utterance)
+            if speculation is not None:
+                speculation.on_transcript(utterance, is_final=True)
+            stats.add('transcript', time.perf_counter() - speech_ended)
+
+        await asyncio.gather(transcript(), pipeline.turn_detector.end_of_turn())
+        stats.add('turn_detection', time.perf_counter() - speech_ended)
+
+        started = time.perf_counter()
+        await pipeline.llm.first_token()
+        stats.add('llm_ttft', time.perf_counter() - started)
+
+        ack = _AckRecorder()
+        if turn.tools:
+            async def call_tool(name: str, arguments: dict) -> None:
+                tool_started = time.perf_counter()
+                kwargs = {key: value.format(slot=slot, name=patient_name, phone=patient_phone) for key, value in arguments.items()}
+                if args.ack and 'context' in inspect.signature(tools[name]).parameters:
+                    kwargs['context'] = ack
+                result = await tools[name](**kwargs)
+                stats.add(f'tool:{name}', time.perf_counter() - tool_started)
+                if _is_failure(result):
+                    failures.append((name, result))
+
+            # Les appels d'outil d'une même génération s'exécutent en parallèle
+            await asyncio.gather(*(call_tool(name, arguments) for name, arguments in turn.tools))
+            # Second passage du LLM avec les résultats des outils
+            await pipeline.llm.first_token()
+
+        started = time.perf_counter()
+        await pipeline.tts.first_audio(turn.reply)
+        stats.add('tts_ttfb', time.perf_counter() - started)
+        # Premier audio entendu : l'annonce de l'outil, sinon la réponse
+        heard = ack.spoken_at if ack.spoken_at is not None else time.perf_counter()
+        stats.add('response', heard - speech_ended)
+        if speculation is not None:
+            # Réponse ajoutée à la conversation : fin du tour
+            speculation.end_turn()
+
+        if args.think:
+            await asyncio.sleep(args.think)
+    return len(SCENARIOS[scenario])
+
+
+async def run_benchmark(args, index, answer_cache=None) -> dict:
+    scenarios = list(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    pipeline = Pipeline(args)
+    stats = LatencyStats(window=10**9)
+    failures: list = []
+    stop = asyncio.Event()
+    lateness: list = []
+    streams = [asyncio.create_task(simulate_audio_stream(stop, lateness)) for _ in range(args.calls)]
+    rng = random.Random(args.seed)
+
+    async def one_call(call: int) -> int:
+        # Arrivées étalées sur --ramp secondes
+        await asyncio.sleep(rng.uniform(0, args.ramp))
+        speculation = None
+        if args.speculative:
+            speculation = Speculation(tools={QUERY_INFO, AVAILABILITY}, tracer=_SpeculationRecorder(stats))
+            speculation.activate()
+        assistant = Assistant(index=index, answer_cache=answer_cache, speculation=speculation)
+        tools = {tool.info.name: tool for tool in assistant.tools}
+        try:
+            return await run_call(call, scenarios[call % len(scenarios)], tools, pipeline, stats, failures,
+                                  args, speculation)
+        finally:
+            if speculation is not None:
+                speculation.close()
+
+    await asyncio.sleep(0.1)  # laisser les flux audio démarrer
+    started = time.perf_counter()
+    turns = sum(await asyncio.gather(*(one_call(i) for i in range(args.calls))))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*streams)
+
+    return {'elapsed': elapsed, 'turns': turns, 'stats': stats, 'failures': failures,
+            'lateness_ms': sorted(x * 1000 for x in lateness)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=20, help="Nombre d'appels simultanés")
+    parser.add_argument('--scenario', choices=['all', *SCENARIOS], default='all')
+    parser.add_argument('--ramp', type=float, default=1.0, help="Étalement des débuts d'appel (s)")
+    parser.add_argument('--think', type=float, default=0.0, help="Pause de l'appelant entre deux tours (s)")
+    parser.add_argument('--word-rate', type=float, default=0.25,
+                        help="Durée d'un mot prononcé (s) : une transcription intermédiaire par mot, 0 = pas de parole simulée")
+    parser.add_argument('--speculative', action='store_true',
+                        help="Exécution spéculative de query_info et de la lecture d'agenda (SPECULATIVE_TOOLS)")
+    parser.add_argument('--no-ack', dest='ack', action='store_false',
+                        help="Sans annonce des outils de prise et de report de rendez-vous")
+    parser.add_argument('--stt', default="0.15:0.35", help="Fin de parole -> transcription finale")
+    parser.add_argument('--eou', default="0.5:0.9", help="Fin de parole -> décision de fin de tour")
+    parser.add_argument('--llm', default="0.35:0.9", help="Premier token du LLM")
+    parser.add_argument('--tts', default="0.2:0.45", help="Premier paquet audio TTS")
+    parser.add_argument('--calendar', default="0.15:0.4", help="Requête à l'API Calendar")
+    parser.add_argument('--rag', default="0.03:0.08", help="Recherche dans l'index factice")
+    parser.add_argument('--synthesis', default="0.6:1.2", help="LLM de synthèse (RAG_MODE=synthesis, index factice)")
+    parser.add_argument('--embed', default="0.01:0.03", help="Embedding d'une requête (index factice)")
+    parser.add_argument('--rag-index', choices=['fake', 'real'], default='fake')
+    parser.add_argument('--backend', choices=['google', 'sqlite'], default='google', help="Agenda servi aux outils")
+    parser.add_argument('--max-concurrency', type=int, default=None, help="Pool de threads du service calendrier")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    warm_up()
+    api = FakeCalendarApi(args.calendar, seed=args.seed)
+    seed_calendar(api, args.calls)
+    service_kwargs = {'max_concurrency': args.max_concurrency} if args.max_concurrency else {}
+    service = GoogleCalendarService(service=api, **service_kwargs)
+    if args.backend == 'sqlite':
+        # Base éphémère chargée depuis l'agenda factice, sans synchronisation pendant la mesure
+        service = SqliteCalendarService(':memory:', google=service, sync_interval=0)
+        asyncio.run(service.sync_once())
+    calendar_service._calendar_service = service
+
+    if args.rag_index == 'real':
+        from knowledge_base import LazyIndex
+        index = LazyIndex()
+        index.get()
+        answer_cache = None
+    else:
+        index = FakeIndex(latency=args.rag, synthesis_latency=args.synthesis, seed=args.seed)
+        # Cache de réponses désactivé : sert seulement à fournir l'embedding des requêtes
+        answer_cache = SemanticCache(FakeEmbedding(latency=args.embed, seed=args.seed), max_entries=0)
+
+    print(f"🔧 {args.calls} appels simultanés, scénario {args.scenario}, agenda {args.backend}, index {args.rag_index}, "
+          f"latences STT {args.stt} / fin de tour {args.eou} / LLM {args.llm} / TTS {args.tts} / Calendar {args.calendar}")
+    result = asyncio.run(run_benchmark(args, index, answer_cache))
+    service.close()
+
+    stats, lateness = result['stats'], result['lateness_ms']
+    print(f"🚀 {args.calls} appels, {result['turns']} tours en {result['elapsed']:.1f}s : "
+          f"{args.calls / result['elapsed']:.2f} appels/s, {result['turns'] / result['elapsed']:.2f} tours/s")
+    print(stats.format_table())
+    print(f"🎧 Retard des trames audio : p50 {quantile(lateness, 0.5):.1f} ms, "
+          f"p99 {quantile(lateness, 0.99):.1f} ms, max {lateness[-1]:.1f} ms")
+    # Hors session, les durées des requêtes Calendar vont à l'agrégat du processus
+    print(f"📅 Requêtes Calendar : {sum(api.requests.values())}")
+    if api.requests:
+        print(get_latency_sink().stats.format_table())
+    if result['failures']:
+        print(f"⚠️  {len(result['failures'])} outils en erreur, ex : {result['failures'][0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark des backends d'embedding : HuggingFace fp32 (PyTorch) contre ONNX
+Runtime fp32 et int8.
+
+Chaque backend est chargé dans un processus neuf (comme un job process du
+worker LiveKit) : temps de chargement, RSS après chargement, latence d'une
+requête isolée (p50/p95). Le rappel compare ensuite, pour chaque question, les
+k passages de la FAQ les plus proches selon le backend à ceux du modèle fp32 de
+référence.
+
+Usage :
+    python bench_embeddings.py [--queries 50] [--top-k 3]
+"""
+
+import argparse
+import multiprocessing as mp
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+
+from bench_vector_store import _memory_kb
+from knowledge_base import DOCS_DIR, EMBED_MODEL_NAME
+
+BACKENDS = ('torch', 'onnx-fp32', 'onnx-int8')
+
+QUESTIONS = [
+    "Combien coûte une consultation ?",
+    "Quels documents dois-je apporter ?",
+    "Quelle est l'adresse du cabinet ?",
+    "Est-ce que je peux payer par chèque ?",
+    "Faut-il apporter une serviette ?",
+    "Quel est le taux de remboursement de l'Assurance Maladie ?",
+    "Comment prendre rendez-vous ?",
+    "Quelles informations dois-je donner pour réserver ?",
+]
+
+
+def faq_passages(path: Path = DOCS_DIR / "patient_faq.txt") -> list:
+    """Un passage par ligne de la FAQ, préfixé par le titre de sa section."""
+    passages, section = [], ""
+    for line in path.read_text(encoding='utf-8').splitlines():
+        line = line.strip()
+        if line.startswith('## '):
+            section = line[3:]
+        elif line.startswith('- '):
+            passages.append(f"{section} : {line[2:]}")
+    return passages
+
+
+def _load(backend: str):
+    if backend == 'torch':
+        from knowledge_base import create_embed_model
+        return create_embed_model('torch')
+    from onnx_embedding import OnnxEmbedding
+    return OnnxEmbedding.from_pretrained(EMBED_MODEL_NAME, quantized=backend == 'onnx-int8')
+
+
+def _worker(backend: str, queries: int, results) -> None:
+    started = time.perf_counter()
+    model = _load(backend)
+    load_time = time.perf_counter() - started
+    memory = _memory_kb()
+
+    model.get_query_embedding("échauffement")
+    latencies = []
+    for i in range(queries):
+        started = time.perf_counter()
+        model.get_query_embedding(QUESTIONS[i % len(QUESTIONS)])
+        latencies.append(time.perf_counter() - started)
+
+    results.put({
+        'load': load_time,
+        'latencies': latencies,
+        'passages': model.get_text_embedding_batch(faq_passages()),
+        'questions': [model.get_query_embedding(q) for q in QUESTIONS],
+        **memory,
+    })
+
+
+def run(backend: str, queries: int) -> dict:
+    ctx = mp.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=_worker, args=(backend, queries, results))
+    process.start()
+    measure = results.get()
+    process.join()
+    return measure
+
+
+def top_k(questions: np.ndarray, passages: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(questions @ passages.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--top-k', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"📊 {EMBED_MODEL_NAME} - {len(faq_passages())} passages de FAQ, {len(QUESTIONS)} questions")
+    measures = {backend: run(backend, args.queries) for backend in BACKENDS}
+
+    reference = top_k(np.array(measures['torch']['questions']), np.array(measures['torch']['passages']), args.top_k)
+    for backend, measure in measures.items():
+        latencies = sorted(measure['latencies'])
+        found = top_k(np.array(measure['questions']), np.array(measure['passages']), args.top_k)
+        recall = statistics.mean(len(set(r) & set(f)) / args.top_k for r, f in zip(reference, found))
+        top1 = statistics.mean(float(r[0] == f[0]) for r, f in zip(reference, found))
+        cosine = float(np.mean(np.sum(
+            np.array(measure['passages']) * np.array(measures['torch']['passages']), axis=1
+        )))
+        print(f"   {backend:>9} : chargement {measure['load']:.2f}s, RSS {measure['rss'] / 1024:.0f} Mo, "
+              f"requête p50 {latencies[len(latencies) // 2] * 1000:.1f} ms / "
+              f"p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:.1f} ms, "
+              f"rappel@{args.top_k} {recall:.2f}, top-1 identique {top1:.2f}, cosinus vs fp32 {cosine:.4f}")
+
+
+if __name__ == "__main__":
+    main()
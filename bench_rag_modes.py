@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Comparaison de la latence par tour de `query_info` : mode "synthesis"
+(query engine LlamaIndex + LLM de synthèse) contre mode "retrieval" (extraits
+bruts renvoyés au LLM de session).
+
+Pour chaque question : durée de l'outil, puis délai avant le premier token du
+LLM de session (gpt-4o-mini) qui formule la réponse à partir du résultat de
+l'outil. La latence d'un tour avant TTS = outil + premier token.
+
+Nécessite OPENAI_API_KEY (synthèse LlamaIndex et LLM de session).
+
+Usage :
+    python bench_rag_modes.py [--repeat 3]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from agent import create_query_info_tool
+from knowledge_base import LazyIndex
+from prompts import INSTRUCTIONS
+
+QUESTIONS = [
+    "Combien coûte une consultation ?",
+    "Quels documents dois-je apporter ?",
+    "Quelle est l'adresse du cabinet ?",
+    "Est-ce que je peux payer par chèque ?",
+    "Faut-il apporter une serviette ?",
+    "Quel est le taux de remboursement de l'Assurance Maladie ?",
+]
+
+
+async def session_llm_ttft(client: AsyncOpenAI, question: str, tool_result: str) -> float:
+    """Délai avant le premier token du LLM de session qui formule la réponse."""
+    started = time.perf_counter()
+    stream = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        temperature=0.2,
+        stream=True,
+        messages=[
+            {"role": "system", "content": INSTRUCTIONS},
+            {"role": "user", "content": question},
+            {"role": "system", "content": f"Résultat de query_info : {tool_result}"},
+        ],
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            ttft = time.perf_counter() - started
+            await stream.close()
+            return ttft
+    return time.perf_counter() - started
+
+
+async def run_mode(mode: str, index: LazyIndex, client: AsyncOpenAI, repeat: int) -> dict:
+    query_info = create_query_info_tool(index, answer_cache=None, mode=mode)
+    tool_times, llm_times, turn_times = [], [], []
+    for _ in range(repeat):
+        for question in QUESTIONS:
+            started = time.perf_counter()
+            result = await query_info(question)
+            tool_time = time.perf_counter() - started
+            llm_time = await session_llm_ttft(client, question, result)
+            tool_times.append(tool_time)
+            llm_times.append(llm_time)
+            turn_times.append(tool_time + llm_time)
+    return {'tool': tool_times, 'llm': llm_times, 'turn': turn_times}
+
+
+def _p(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))] * 1000
+
+
+async def main_async(repeat: int) -> None:
+    index = LazyIndex()
+    await index.aget()
+    client = AsyncOpenAI()
+
+    print(f"📊 {len(QUESTIONS)} questions × {repeat} répétitions")
+    for mode in ('synthesis', 'retrieval'):
+        result = await run_mode(mode, index, client, repeat)
+        print(f"   {mode:>9} : outil p50 {_p(result['tool'], 0.5):.0f} ms, "
+              f"1er token LLM p50 {_p(result['llm'], 0.5):.0f} ms, "
+              f"tour p50 {_p(result['turn'], 0.5):.0f} ms / p95 {_p(result['turn'], 0.95):.0f} ms "
+              f"(moyenne {statistics.mean(result['turn']) * 1000:.0f} ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv()
+    asyncio.run(main_async(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
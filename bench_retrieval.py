@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Comparaison des recherches de `query_info` : vectorielle, lexicale (BM25) et
+hybride, sur des questions de la FAQ dont la réponse attendue est connue.
+
+Pour chaque recherche : taux de succès (la réponse attendue figure dans le
+premier extrait / dans les top-k), latence p50/p95 et nombre d'embeddings de
+requête calculés. Avec l'hybride, les questions par mots-clés résolues par
+l'index lexical ne calculent aucun embedding.
+
+Nécessite l'index publié (python indexer.py) et le modèle d'embedding.
+
+Usage :
+    python bench_retrieval.py [--repeat 5] [--top-k 4] [--alpha 0.5]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Dict, List
+
+from llama_index.core.callbacks import CBEventType
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+from bm25_index import HybridRetriever
+from knowledge_base import RAG_HYBRID_ALPHA, RAG_TOP_K, LazyIndex, generation_dir, load_embed_model, load_lexical_index
+
+# (question de l'appelant, texte attendu dans l'extrait qui y répond)
+QUESTIONS = [
+    ("tarif", "27,50"),
+    ("Combien coûte une consultation ?", "27,50"),
+    ("serviette", "2,50"),
+    ("Faut-il apporter une serviette ?", "2,50"),
+    ("carte vitale", "Carte d'Assurance Maladie"),
+    ("Quels documents dois-je apporter ?", "Carte d'Assurance Maladie"),
+    ("adresse du cabinet", "rue de la Santé"),
+    ("Où se trouve le cabinet ?", "rue de la Santé"),
+    ("Est-ce que je peux payer par chèque ?", "carte bancaire"),
+    ("remboursement", "70 %"),
+    ("Quel est le taux de remboursement de l'Assurance Maladie ?", "70 %"),
+    ("Comment prendre rendez-vous ?", "Par téléphone"),
+]
+
+
+class EmbeddingCounter(BaseCallbackHandler):
+    """Compte les embeddings calculés par le modèle."""
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.calls = 0
+
+    def on_event_start(self, event_type: CBEventType, payload=None, event_id: str = "", parent_id: str = "", **kwargs: Any) -> str:
+        if event_type == CBEventType.EMBEDDING:
+            self.calls += 1
+        return event_id
+
+    def on_event_end(self, event_type: CBEventType, payload=None, event_id: str = "", **kwargs: Any) -> None:
+        pass
+
+    def start_trace(self, trace_id=None) -> None:
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None) -> None:
+        pass
+
+
+def _plain(text: str) -> str:
+    # La FAQ utilise des espaces insécables fines ("27,50 €") et des apostrophes typographiques
+    return " ".join(text.replace("’", "'").split())
+
+
+def _p(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))] * 1000
+
+
+async def run_retriever(search: Callable, counter: EmbeddingCounter, repeat: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    hits_first = hits_top = 0
+    counter.calls = 0
+    for _ in range(repeat):
+        for question, expected in QUESTIONS:
+            started = time.perf_counter()
+            texts = [_plain(text) for text in await search(question)]
+            latencies.append(time.perf_counter() - started)
+            hits_first += bool(texts) and expected in texts[0]
+            hits_top += any(expected in text for text in texts)
+    total = repeat * len(QUESTIONS)
+    return {
+        'hit@1': hits_first / total,
+        'hit@k': hits_top / total,
+        'latencies': latencies,
+        'embeddings': counter.calls,
+    }
+
+
+async def main_async(repeat: int, top_k: int, alpha: float) -> None:
+    lazy_index = LazyIndex()
+    loaded = await lazy_index.asnapshot()
+    index = loaded.index
+    lexical = loaded.lexical or load_lexical_index(
+        generation_dir(lazy_index.persist_dir, loaded.generation), index.docstore
+    )
+    counter = EmbeddingCounter()
+    load_embed_model().callback_manager.add_handler(counter)
+
+    vector = index.as_retriever(similarity_top_k=top_k)
+    hybrid = HybridRetriever(index.as_retriever(similarity_top_k=top_k), lexical, index.docstore, top_k, alpha)
+
+    async def search_vector(question: str) -> List[str]:
+        return [result.node.get_content() for result in await vector.aretrieve(question)]
+
+    async def search_bm25(question: str) -> List[str]:
+        return [index.docstore.get_node(node_id).get_content() for node_id, _, _ in lexical.search(question, top_k)]
+
+    async def search_hybrid(question: str) -> List[str]:
+        return [result.node.get_content() for result in await hybrid.aretrieve(question)]
+
+    print(f"📊 {len(QUESTIONS)} questions × {repeat} répétitions, top-{top_k}, "
+          f"{len(lexical)} extraits, alpha {alpha}")
+    for name, search in (('vector', search_vector), ('bm25', search_bm25), ('hybrid', search_hybrid)):
+        result = await run_retriever(search, counter, repeat)
+        print(f"   {name:>6} : hit@1 {result['hit@1']:.0%}, hit@{top_k} {result['hit@k']:.0%}, "
+              f"p50 {_p(result['latencies'], 0.5):.1f} ms / p95 {_p(result['latencies'], 0.95):.1f} ms, "
+              f"{result['embeddings']} embeddings")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top-k', type=int, default=RAG_TOP_K)
+    parser.add_argument('--alpha', type=float, default=RAG_HYBRID_ALPHA, help="Poids des vecteurs dans l'hybride")
+    args = parser.parse_args()
+
+    asyncio.run(main_async(args.repeat, args.top_k, args.alpha))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Benchmark mémoire / latence : vector store JSON (SimpleVectorStore) contre la
+matrice NumPy mappée en mémoire (MmapVectorStore).
+
+Lance N processus simultanés (comme les job processes du worker LiveKit) qui
+chargent chacun le store puis exécutent des requêtes top-k. Rapporte par
+processus le temps de chargement, la RSS, la PSS (mémoire partagée répartie
+entre processus, Linux uniquement) et la latence des requêtes.
+
+Usage :
+    python bench_vector_store.py                       # store de query-engine-storage
+    python bench_vector_store.py --synthetic 50000     # store synthétique de 50 000 vecteurs
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from knowledge_base import resolve_store_dir
+from mmap_vector_store import (
+    IDS_FILE,
+    JSON_VECTOR_STORE_FILE,
+    VECTORS_FILE,
+    MmapVectorStore,
+    export_from_json_store,
+    export_to_json_store,
+    has_mmap_vectors,
+    write_vectors,
+)
+
+
+def _memory_kb() -> dict:
+    """RSS et PSS du processus courant (kB), depuis /proc/self/smaps_rollup."""
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    memory[key.lower()] = int(value.split()[0])
+    except OSError:
+        import resource
+        memory['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return memory
+
+
+def _worker(store_format: str, persist_dir: str, queries: int, barrier, results) -> None:
+    from llama_index.core.vector_stores import SimpleVectorStore
+    from llama_index.core.vector_stores.types import VectorStoreQuery
+
+    started = time.perf_counter()
+    if store_format == 'json':
+        store = SimpleVectorStore.from_persist_path(str(Path(persist_dir) / JSON_VECTOR_STORE_FILE))
+        dim = len(next(iter(store.data.embedding_dict.values())))
+    else:
+        store = MmapVectorStore.from_persist_dir(Path(persist_dir))
+        dim = store.matrix.shape[1]
+    load_time = time.perf_counter() - started
+
+    rng = np.random.default_rng()
+    latencies = []
+    for _ in range(queries):
+        query = VectorStoreQuery(query_embedding=rng.standard_normal(dim).tolist(), similarity_top_k=4)
+        started = time.perf_counter()
+        store.query(query)
+        latencies.append(time.perf_counter() - started)
+
+    # Mesure prise quand tous les processus ont chargé leur store
+    barrier.wait()
+    results.put({'load': load_time, 'latency_ms': statistics.median(latencies) * 1000, **_memory_kb()})
+    barrier.wait()
+
+
+def run(store_format: str, persist_dir: Path, processes: int, queries: int) -> list:
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(processes)
+    results = ctx.Queue()
+    workers = [
+        ctx.Process(target=_worker, args=(store_format, str(persist_dir), queries, barrier, results))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    measures = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return measures
+
+
+def make_synthetic_store(directory: Path, size: int, dim: int, dtype: str) -> None:
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((size, dim), dtype=np.float32)
+    node_ids = [f"node-{i}" for i in range(size)]
+    with open(directory / JSON_VECTOR_STORE_FILE, 'w') as f:
+        json.dump({'embedding_dict': {n: v.tolist() for n, v in zip(node_ids, matrix)},
+                   'text_id_to_ref_doc_id': {}, 'metadata_dict': {}}, f)
+    write_vectors(directory, node_ids, matrix, dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--persist-dir', type=Path, default=Path(__file__).parent / "query-engine-storage")
+    parser.add_argument('--synthetic', type=int, default=0, help="Taille d'un store synthétique (0 = store réel)")
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        persist_dir = resolve_store_dir(args.persist_dir)
+        if args.synthetic:
+            persist_dir = Path(tmp)
+            print(f"🔧 Génération d'un store synthétique de {args.synthetic} vecteurs ({args.dim} dimensions)...")
+            make_synthetic_store(persist_dir, args.synthetic, args.dim, args.dtype)
+        elif not has_mmap_vectors(persist_dir):
+            export_from_json_store(persist_dir, args.dtype)
+        elif not (persist_dir / JSON_VECTOR_STORE_FILE).exists():
+            # Génération publiée sans store JSON (RAG_VECTOR_FORMAT=mmap) : copie de comparaison hors de l'index
+            for name in (VECTORS_FILE, IDS_FILE):
+                shutil.copy(persist_dir / name, tmp)
+            export_to_json_store(persist_dir, Path(tmp))
+            persist_dir = Path(tmp)
+
+        print(f"📊 {args.processes} processus, {args.queries} requêtes top-4 chacun")
+        for store_format in ('json', 'mmap'):
+            measures = run(store_format, persist_dir, args.processes, args.queries)
+            rss = statistics.mean(m['rss'] for m in measures) / 1024
+            pss = statistics.mean(m.get('pss', m['rss']) for m in measures) / 1024
+            load = statistics.mean(m['load'] for m in measures)
+            latency = statistics.median(m['latency_ms'] for m in measures)
+            print(f"   {store_format:>4} : chargement {load:.3f}s, RSS {rss:.1f} Mo, "
+                  f"PSS {pss:.1f} Mo par processus, requête p50 {latency:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Index lexical BM25 de la base documentaire et retriever hybride.
+
+Les questions courtes des appelants sont souvent des mots-clés ("tarif",
+"serviette", "carte vitale") : un index inversé y répond plus vite et plus
+précisément que la seule recherche vectorielle. L'index est construit avec
+chaque génération de `query-engine-storage` (voir indexer.py) et persisté à
+côté des vecteurs (`bm25_index.json`).
+
+`HybridRetriever` interroge d'abord l'index lexical : si un extrait contient
+tous les termes de la question et se détache nettement des autres, il est
+renvoyé seul, sans calcul d'embedding. Sinon les scores BM25 (normalisés par
+le meilleur) et les similarités cosinus sont fusionnés par moyenne pondérée.
+"""
+
+import re
+import json
+import math
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+
+from fr_datetime import normalize_text
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25_index.json"
+# Paramètres BM25 usuels : saturation de la fréquence et normalisation par la longueur
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Un extrait lexical est renvoyé seul si son score dépasse d'autant le suivant
+LEXICAL_MARGIN = 1.5
+
+# Mots vides du français parlé (questions des appelants), sans accents
+_STOPWORDS = frozenset("""
+    a afin ai au aux avec avez avoir c ca ce ces cet cette combien comment d dans de des dois doit du
+    elle en est et etre faut il ils j je l la le les leur lui m ma me mes moi mon n ne nous on ou
+    par pas peut peux pour pouvez puis qu quand que quel quelle quelles quels qui quoi s sa se ses
+    si son sont sur t ta te tes toi ton tu un une vos votre vous y
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Termes indexés : minuscules sans accents, sans mots vides, pluriels ramenés au singulier."""
+    terms = []
+    for token in _TOKEN_RE.findall(normalize_text(text)):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token[-1] in "sx":
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+class BM25Index:
+    """
+    Index inversé BM25 : terme -> (numéro d'extrait, fréquence).
+
+    Args:
+        node_ids: Identifiants des extraits (nœuds LlamaIndex), dans l'ordre des numéros
+        doc_lengths: Nombre de termes de chaque extrait
+        postings: Liste des (numéro d'extrait, fréquence) de chaque terme
+    """
+
+    def __init__(self, node_ids: List[str], doc_lengths: List[int], postings: Dict[str, List[Tuple[int, int]]]):
+        self.node_ids = node_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]]) -> "BM25Index":
+        """Construit l'index à partir de (identifiant, texte) de chaque extrait."""
+        node_ids: List[str] = []
+        doc_lengths: List[int] = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for node_id, text in documents:
+            terms = tokenize(text)
+            for term, frequency in Counter(terms).items():
+                postings.setdefault(term, []).append((len(node_ids), frequency))
+            node_ids.append(node_id)
+            doc_lengths.append(len(terms))
+        return cls(node_ids, doc_lengths, postings)
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[BaseNode]) -> "BM25Index":
+        # Même texte que celui embarqué (métadonnées comprises, ex: nom du fichier)
+        return cls.build((node.node_id, node.get_content(metadata_mode=MetadataMode.EMBED)) for node in nodes)
+
+    def save(self, persist_dir: Path) -> None:
+        payload = {
+            "node_ids": self.node_ids,
+            "doc_lengths": self.doc_lengths,
+            "postings": self.postings,
+        }
+        data = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        atomic_write(Path(persist_dir) / BM25_FILE, lambda f: f.write(data))
+        logger.info(f"Wrote BM25 index ({len(self.node_ids)} chunks, {len(self.postings)} terms)")
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "BM25Index":
+        with open(Path(persist_dir) / BM25_FILE, encoding='utf-8') as f:
+            payload = json.load(f)
+        postings = {term: [tuple(posting) for posting in entries] for term, entries in payload["postings"].items()}
+        return cls(payload["node_ids"], payload["doc_lengths"], postings)
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.node_ids) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float, bool]]:
+        """
+        Extraits les mieux classés pour une question.
+
+        Returns:
+            (identifiant, score BM25, tous les termes présents) par score décroissant
+        """
+        terms = set(tokenize(query))
+        scores: Dict[int, float] = {}
+        matched: Counter = Counter()
+        for term in terms:
+            idf = self._idf(term)
+            for doc, frequency in self.postings.get(term, ()):
+                length_norm = 1 - BM25_B + BM25_B * self.doc_lengths[doc] / (self.avg_length or 1.0)
+                scores[doc] = scores.get(doc, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * length_norm)
+                matched[doc] += 1
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.node_ids[doc], score, matched[doc] == len(terms)) for doc, score in ranked]
+
+
+def has_bm25_index(persist_dir: Path) -> bool:
+    return (Path(persist_dir) / BM25_FILE).exists()
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever lexical + vectoriel.
+
+    Args:
+        vector_retriever: Retriever vectoriel de l'index (top-k par similarité cosinus)
+        lexical: Index BM25 de la même génération
+        docstore: Docstore de l'index (texte des extraits trouvés par BM25)
+        top_k: Nombre d'extraits renvoyés
+        alpha: Poids de la similarité vectorielle dans la fusion (0 = BM25 seul)
+    """
+
+    def __init__(self, vector_retriever: BaseRetriever, lexical: BM25Index, docstore, top_k: int, alpha: float):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.lexical = lexical
+        self.docstore = docstore
+        self.top_k = top_k
+        self.alpha = alpha
+
+    def _nodes(self, scored: List[Tuple[str, float]]) -> List[NodeWithScore]:
+        return [NodeWithScore(node=self.docstore.get_node(node_id), score=score) for node_id, score in scored]
+
+    def exact_match(self, query: str) -> Optional[List[NodeWithScore]]:
+        """
+        Extrait qui répond seul à une question par mots-clés, sans embedding.
+
+        Returns:
+            L'extrait (score 1.0) s'il contient tous les termes de la question et
+            dépasse nettement le suivant, sinon None
+        """
+        ranked = self.lexical.search(query, top_k=2)
+        if not ranked or not ranked[0][2]:
+            return None
+        if len(ranked) > 1 and ranked[0][1] < LEXICAL_MARGIN * ranked[1][1]:
+            return None
+        return self._nodes([(ranked[0][0], 1.0)])
+
+    def _fuse(self, query: str, vector_nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        lexical = self.lexical.search(query, top_k=self.top_k * 2)
+        best = lexical[0][1] if lexical else 0.0
+        scores: Dict[str, float] = {}
+        nodes: Dict[str, NodeWithScore] = {}
+        for result in vector_nodes:
+            scores[result.node.node_id] = self.alpha * (result.score or 0.0)
+            nodes[result.node.node_id] = result
+        for node_id, score, _ in lexical:
+            scores[node_id] = scores.get(node_id, 0.0) + (1 - self.alpha) * score / best
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.top_k]
+        return [
+            NodeWithScore(node=nodes[node_id].node, score=score) if node_id in nodes
+            else self._nodes([(node_id, score)])[0]
+            for node_id, score in ranked
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        exact = self.exact_match(query_bundle.query_str)
+        if exact is not None:
+            return exact
+        return self._fuse(query_bundle.query_str, self.vector_retriever.retrieve(query_bundle))
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        exact = self.exact_match(query_bundle.query_str)
+        if exact is not None:
+            return exact
+        return self._fuse(query_bundle.query_str, await self.vector_retriever.aretrieve(query_bundle))
@@ -1,29 +1,262 @@
 """
-Service Google Calendar pour l'agent vocal.
-Utilise un compte de service Google pour l'authentification.
+Service d'agenda pour l'agent vocal.
+
+`CalendarBackend` décrit l'agenda tel que l'utilisent les outils de l'agent ;
+`GoogleCalendarService` l'implémente avec l'API Google Calendar (compte de
+service Google), `SqliteCalendarService` (db_driver.py) avec une base SQLite
+locale, éventuellement synchronisée avec Google. CALENDAR_BACKEND choisit le
+moteur de `get_calendar_service`.
+
+Un worker qui sert plusieurs cabinets (voir tenants.py) associe à chaque appel
+l'agenda de son cabinet avec `use_calendar_service` : les outils continuent
+d'appeler `get_calendar_service()`.
 """
 
 import os
 import json
+import time
+import asyncio
 import logging
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from typing import AsyncIterator, Callable, Dict, List, Optional, Any, Tuple
 from googleapiclient.errors import HttpError
 
+from availability_cache import DEFAULT_WINDOW_DAYS, AvailabilityCache, BusyIndex, parse_event_time, to_aware
+from fr_datetime import parse_french_datetime
+from latency_tracing import record_calendar_request
+from patients import PATIENT_KEY_PROPERTY, PatientIndex, event_patient_key, patient_properties
+
 logger = logging.getLogger(__name__)
 
-class GoogleCalendarService:
-    """Service pour interagir avec Google Calendar via un compte de service."""
+# Délai maximum (secondes) d'un appel à l'API Calendar avant abandon
+DEFAULT_TIMEOUT = float(os.getenv('GOOGLE_CALENDAR_TIMEOUT', '10'))
+# Nombre maximum d'appels HTTP simultanés vers l'API Calendar (par processus)
+DEFAULT_MAX_CONCURRENCY = int(os.getenv('GOOGLE_CALENDAR_MAX_CONCURRENCY', '4'))
+# Moteur d'agenda : "google" (API Google Calendar) ou "sqlite" (base locale, voir db_driver.py)
+CALENDAR_BACKEND = os.getenv('CALENDAR_BACKEND', 'google')
+# Nombre maximum de requêtes regroupées dans une requête batch (limite de l'API Calendar)
+BATCH_MAX_REQUESTS = 50
+# Taille des pages lues par get_appointments (l'API en accepte 2500 au plus)
+APPOINTMENTS_PAGE_SIZE = 250
+
+# Masques de champs : seuls les champs utilisés sont téléchargés
+_APPOINTMENT_FIELDS = 'nextPageToken,items(id,summary,start,end,description,status,extendedProperties/private)'
+_CONFLICT_FIELDS = 'items(id,status,transparency)'
+_SYNC_FIELDS = (
+    'nextPageToken,'
+    'items(id,status,summary,description,start,end,transparency,extendedProperties/private)'
+)
+
+
+class CalendarTimeout(TimeoutError):
+    """Requête Calendar expirée ; `pending` est la requête toujours en cours dans son thread."""
+
+    def __init__(self, message: str, pending: asyncio.Future):
+        super().__init__(message)
+        self.pending = pending
+
+
+class SlotTakenError(ValueError):
+    """Créneau déjà occupé dans l'agenda au moment de l'écriture."""
+
+    def __init__(self, message: str = "Ce créneau est déjà occupé"):
+        super().__init__(message)
+
+
+def _operation_name(request: Any) -> str:
+    """Nom court d'une requête googleapiclient pour les métriques (ex: "events.patch")."""
+    method_id = getattr(request, 'methodId', None) or type(request).__name__
+    return method_id.removeprefix('calendar.')
+
+
+def _event_times(start_datetime: datetime, end_datetime: datetime) -> Dict[str, Any]:
+    """Champs start/end d'un événement, en heure du cabinet."""
+    return {
+        'start': {
+            'dateTime': start_datetime.isoformat(),
+            'timeZone': 'Europe/Paris',
+        },
+        'end': {
+            'dateTime': end_datetime.isoformat(),
+            'timeZone': 'Europe/Paris',
+        },
+    }
+
+
+class CalendarBackend(ABC):
+    """
+    Agenda du cabinet tel que l'utilisent les outils de l'agent.
+    
+    Les dates naïves sont en heure du cabinet ; les rendez-vous sont renvoyés
+    sous forme de dict ('id', 'title', 'start', 'end', 'status'...) avec des
+    dates ISO 8601.
+    """
+    
+    @abstractmethod
+    async def create_appointment(
+        self,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        description: str = "",
+        attendee_email: str = None,
+        patient_key: str = None
+    ) -> Dict[str, Any]:
+        """Crée un rendez-vous, rattaché au patient si `patient_key` est fourni ; ValueError si le créneau est pris ou en cas d'erreur."""
+    
+    @abstractmethod
+    async def check_availability(
+        self,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        prefetched: Optional[BusyIndex] = None
+    ) -> bool:
+        """True si le créneau est libre (False en cas d'erreur, par sécurité)."""
+    
+    @abstractmethod
+    async def get_busy_intervals(self, start_datetime: datetime, end_datetime: datetime) -> BusyIndex:
+        """Créneaux occupés d'une période ; ValueError si l'agenda est inaccessible."""
+    
+    @abstractmethod
+    def get_appointments(
+        self,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        max_results: Optional[int] = None,
+        page_size: int = APPOINTMENTS_PAGE_SIZE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Rendez-vous d'une période (par défaut les 7 prochains jours), par heure de
+        début, lus page par page au fil de l'itération (générateur asynchrone) :
+        l'appelant peut s'arrêter avant la fin sans lire les pages suivantes.
+        """
+    
+    @abstractmethod
+    async def find_patient_appointments(
+        self,
+        patient_key: str,
+        start_date: datetime = None,
+        end_date: datetime = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rendez-vous d'un patient (voir patients.py) qui commencent dans la période,
+        par heure de début ; par défaut à partir de maintenant, sur la fenêtre du
+        cache des disponibilités. ValueError si l'agenda est inaccessible.
+        """
+    
+    @abstractmethod
+    async def cancel_appointment(self, event_id: str) -> bool:
+        """Annule un rendez-vous ; False en cas d'échec."""
     
-    def __init__(self):
-        self.service = None
-        self.calendar_id = os.getenv('GOOGLE_CALENDAR_ID', 'primary')
-        self._initialize_service()
+    @abstractmethod
+    async def reschedule_appointment(
+        self,
+        event_id: str,
+        new_start_datetime: datetime,
+        new_end_datetime: datetime
+    ) -> Dict[str, Any]:
+        """Reporte un rendez-vous ; ValueError s'il est introuvable ou en cas d'erreur."""
+    
+    @abstractmethod
+    async def reschedule_appointments(
+        self,
+        moves: List[Tuple[str, datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        """Reporte plusieurs rendez-vous ; un résultat par rendez-vous ('status' 'updated' ou 'error')."""
+    
+    async def refresh_availability(self) -> None:
+        """Rafraîchit les disponibilités tenues en mémoire, s'il y en a."""
+    
+    async def prefetch_busy_intervals(
+        self,
+        start_datetime: datetime,
+        end_datetime: datetime
+    ) -> Optional[BusyIndex]:
+        """
+        Lit par anticipation les créneaux occupés d'une période (exécution spéculative).
+        
+        Returns:
+            Les créneaux occupés lus, ou None si `check_availability` répondra
+            directement depuis un cache local
+        """
+        return await self.get_busy_intervals(start_datetime, end_datetime)
+    
+    def parse_datetime_from_text(self, text: str) -> Optional[datetime]:
+        """
+        Parse une date/heure depuis du texte en français.
+        
+        Les formulations courantes sont reconnues par fr_datetime (expressions
+        précompilées, résultats mémorisés) ; dateparser ne sert qu'en dernier recours.
+        
+        Args:
+            text: Texte contenant la date/heure (ex: "demain à 15h", "le 25 décembre à 10h30")
+        
+        Returns:
+            datetime object ou None si le parsing échoue
+        """
+        try:
+            parsed_date = parse_french_datetime(text)
+            
+            if parsed_date:
+                logger.info(f"Successfully parsed '{text}' to '{parsed_date}'")
+                return parsed_date
+            else:
+                logger.warning(f"Could not parse datetime from text: {text}")
+                return None
+        except Exception as e:
+            logger.error(f"Error parsing datetime: {e}")
+            return None
+    
+    def close(self) -> None:
+        """Libère les ressources du service."""
+
+
+class GoogleCalendarService(CalendarBackend):
+    """Service pour interagir avec Google Calendar via un compte de service.
+
+    Les appels HTTP de googleapiclient sont bloquants : ils sont exécutés dans un
+    pool de threads borné pour ne jamais bloquer la boucle d'événements du worker
+    (STT/TTS des autres appels du même processus). Chaque thread du pool garde
+    son propre client HTTP, dont la connexion keep-alive est réutilisée d'une
+    requête à l'autre ; les opérations indépendantes en nombre passent par une
+    requête batch (`patch_appointments`). Durée et nombre de requêtes par
+    opération : voir latency_tracing.py (étapes "calendar:<opération>").
+    """
+    
+    def __init__(
+        self,
+        service: Any = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        calendar_id: Optional[str] = None
+    ):
+        self.service = service
+        self.calendar_id = calendar_id or os.getenv('GOOGLE_CALENDAR_ID', 'primary')
+        self.timeout = timeout
+        self._credentials = None
+        self._thread_local = threading.local()
+        # Le pool borné fait office de plafond de concurrence vers l'API
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix='google-calendar'
+        )
+        # Créneaux occupés et rendez-vous par patient tenus en mémoire
+        self.patients = PatientIndex()
+        self.availability_cache = AvailabilityCache(self.list_events, patients=self.patients)
+        if self.service is None:
+            self._initialize_service()
     
     def _initialize_service(self):
         """Initialise le service Google Calendar avec les credentials du compte de service."""
+        # Imports différés : le client Google n'est chargé qu'au premier appel au calendrier
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
+
         try:
             # Récupération du chemin vers le fichier de credentials
             credentials_path = os.getenv('GOOGLE_SERVICE_ACCOUNT_FILE')
@@ -34,26 +267,211 @@ class GoogleCalendarService:
                 raise FileNotFoundError(f"Service account file not found: {credentials_path}")
             
             # Chargement des credentials
-            credentials = service_account.Credentials.from_service_account_file(
+            self._credentials = service_account.Credentials.from_service_account_file(
                 credentials_path,
                 scopes=['https://www.googleapis.com/auth/calendar']
             )
             
             # Construction du service
-            self.service = build('calendar', 'v3', credentials=credentials)
+            self.service = build('calendar', 'v3', credentials=self._credentials)
             logger.info("Google Calendar service initialized successfully")
             
         except Exception as e:
             logger.error(f"Failed to initialize Google Calendar service: {e}")
             raise
     
+    def _thread_http(self) -> Optional[Any]:
+        """
+        Retourne le client HTTP du thread courant (httplib2 n'est pas thread-safe).
+        
+        Créé une fois par thread du pool : sa connexion HTTPS keep-alive et le jeton
+        d'accès sont réutilisés par toutes les requêtes suivantes du thread.
+        """
+        if self._credentials is None:
+            return None
+        http = getattr(self._thread_local, 'http', None)
+        if http is None:
+            import httplib2
+            import google_auth_httplib2
+
+            http = google_auth_httplib2.AuthorizedHttp(
+                self._credentials,
+                http=httplib2.Http(timeout=self.timeout)
+            )
+            self._thread_local.http = http
+        return http
+    
+    def _execute_blocking(self, request: Any) -> Any:
+        """Exécute une requête googleapiclient dans un thread du pool."""
+        http = self._thread_http()
+        if http is None:
+            return request.execute()
+        return request.execute(http=http)
+    
+    def _execute_batch_blocking(self, requests: List[Any]) -> List[Any]:
+        """Exécute des requêtes en une seule requête HTTP batch ; une réponse ou une exception par requête."""
+        results: List[Any] = [None] * len(requests)
+        
+        def _collect(request_id: str, response: Any, exception: Optional[Exception]) -> None:
+            results[int(request_id)] = exception if exception is not None else response
+        
+        batch = self.service.new_batch_http_request(callback=_collect)
+        for i, request in enumerate(requests):
+            batch.add(request, request_id=str(i))
+        http = self._thread_http()
+        if http is None:
+            batch.execute()
+        else:
+            batch.execute(http=http)
+        return results
+    
+    async def _run_blocking(self, operation: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """Exécute un appel HTTP bloquant dans le pool, avec délai maximum et mesure de durée."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        try:
+            # shield : la requête expirée reste attendable (voir _outcome_after_timeout)
+            return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Google Calendar request timed out after {self.timeout}s")
+            raise CalendarTimeout("Google Calendar request timed out", future)
+        finally:
+            record_calendar_request(operation, time.perf_counter() - started)
+    
+    async def _outcome_after_timeout(self, timeout: CalendarTimeout, event_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Issue d'une écriture expirée : le délai n'interrompt pas le thread de la
+        requête, l'écriture a donc pu aboutir côté Google. La réponse de la requête
+        est attendue encore un délai, puis l'événement est relu.
+        
+        Returns:
+            L'événement écrit (réponse de la requête ou relecture), {} s'il n'existe
+            pas (ou plus), None si l'issue reste inconnue
+        
+        Raises:
+            HttpError: si la requête expirée a finalement été refusée par l'API
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(timeout.pending), timeout=self.timeout) or {}
+        except asyncio.TimeoutError:
+            pass
+        try:
+            event = await self._execute(self.service.events().get(calendarId=self.calendar_id, eventId=event_id))
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                return {}
+            logger.error(f"Could not check appointment {event_id} after a timeout: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Could not check appointment {event_id} after a timeout: {e}")
+            return None
+        return {} if event.get('status') == 'cancelled' else event
+    
+    async def _slot_taken(self, start_datetime: datetime, end_datetime: datetime, ignore_id: Optional[str] = None) -> bool:
+        """
+        Vérification en direct d'un créneau juste avant une écriture : le cache des
+        disponibilités peut dater de AVAILABILITY_CACHE_TTL secondes et un autre
+        worker a pu réserver le créneau entre-temps.
+        
+        Args:
+            ignore_id: Événement à ne pas compter (celui que l'on déplace)
+        """
+        result = await self._execute(self.service.events().list(
+            calendarId=self.calendar_id,
+            timeMin=to_aware(start_datetime).isoformat(),
+            timeMax=to_aware(end_datetime).isoformat(),
+            singleEvents=True,
+            fields=_CONFLICT_FIELDS,
+        ))
+        return any(
+            event.get('id') != ignore_id
+            and event.get('status') != 'cancelled'
+            and event.get('transparency') != 'transparent'
+            for event in result.get('items', [])
+        )
+    
+    async def _execute(self, request: Any) -> Any:
+        """
+        Exécute une requête googleapiclient sans bloquer la boucle d'événements.
+        
+        Args:
+            request: Requête construite (ex: service.events().insert(...))
+        
+        Returns:
+            La réponse décodée de l'API
+        
+        Raises:
+            TimeoutError: si l'API ne répond pas dans le délai configuré
+        """
+        return await self._run_blocking(_operation_name(request), self._execute_blocking, request)
+    
+    async def _execute_batch(self, requests: List[Any]) -> List[Any]:
+        """
+        Exécute des requêtes indépendantes par requêtes batch de BATCH_MAX_REQUESTS.
+        
+        Returns:
+            Pour chaque requête, dans l'ordre : la réponse décodée ou l'exception levée
+        """
+        chunks = [requests[i:i + BATCH_MAX_REQUESTS] for i in range(0, len(requests), BATCH_MAX_REQUESTS)]
+        results = await asyncio.gather(
+            *(self._run_blocking('batch', self._execute_batch_blocking, chunk) for chunk in chunks)
+        )
+        return [result for chunk_results in results for result in chunk_results]
+    
+    async def list_events(
+        self,
+        time_min: datetime,
+        time_max: datetime,
+        updated_min: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Récupère tous les événements bruts d'une période (toutes les pages).
+        
+        Args:
+            time_min: Début de la période
+            time_max: Fin de la période
+            updated_min: Si fourni, uniquement les événements modifiés depuis
+                cette date, y compris les événements supprimés
+        
+        Returns:
+            Liste des ressources événement de l'API
+        """
+        params = {
+            'calendarId': self.calendar_id,
+            'timeMin': time_min.isoformat(),
+            'timeMax': time_max.isoformat(),
+            'singleEvents': True,
+            'maxResults': 2500,
+            'fields': _SYNC_FIELDS,
+        }
+        if updated_min is not None:
+            params['updatedMin'] = updated_min.isoformat()
+            params['showDeleted'] = True
+        
+        events: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+            result = await self._execute(self.service.events().list(**params))
+            events.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return events
+    
+    def close(self) -> None:
+        """Libère le pool de threads du service."""
+        self._executor.shutdown(wait=False)
+    
     async def create_appointment(
         self, 
         title: str,
         start_datetime: datetime,
         end_datetime: datetime,
         description: str = "",
-        attendee_email: str = None
+        attendee_email: str = None,
+        patient_key: str = None
     ) -> Dict[str, Any]:
         """
         Crée un rendez-vous dans Google Calendar.
@@ -64,36 +482,47 @@ class GoogleCalendarService:
             end_datetime: Date et heure de fin
             description: Description du rendez-vous
             attendee_email: Email du patient (optionnel)
+            patient_key: Clé du patient (propriété étendue privée, optionnelle)
         
         Returns:
             Dict contenant les détails du rendez-vous créé
         """
         try:
-            # Construction de l'événement
+            # Construction de l'événement ; identifiant choisi ici pour pouvoir le
+            # relire si la création dépasse le délai
             event = {
+                'id': uuid.uuid4().hex,
                 'summary': title,
                 'description': description,
-                'start': {
-                    'dateTime': start_datetime.isoformat(),
-                    'timeZone': 'Europe/Paris',
-                },
-                'end': {
-                    'dateTime': end_datetime.isoformat(),
-                    'timeZone': 'Europe/Paris',
-                },
+                **_event_times(start_datetime, end_datetime),
             }
             
             # Ajout de l'invité si fourni
             if attendee_email:
                 event['attendees'] = [{'email': attendee_email}]
             
+            if patient_key:
+                event['extendedProperties'] = patient_properties(patient_key)
+            
+            if await self._slot_taken(start_datetime, end_datetime):
+                logger.info(f"Slot {start_datetime} - {end_datetime} was taken in the meantime")
+                self.availability_cache.invalidate()
+                raise SlotTakenError()
+            
             # Création de l'événement
-            created_event = self.service.events().insert(
-                calendarId=self.calendar_id,
-                body=event
-            ).execute()
+            try:
+                created_event = await self._execute(self.service.events().insert(
+                    calendarId=self.calendar_id,
+                    body=event
+                ))
+            except CalendarTimeout as timeout:
+                created_event = await self._outcome_after_timeout(timeout, event['id'])
+                if not created_event:
+                    raise
+                logger.info(f"Appointment {event['id']} was created despite the timeout")
             
             logger.info(f"Appointment created successfully: {created_event.get('id')}")
+            self.availability_cache.apply_event(created_event)
             
             return {
                 'id': created_event.get('id'),
@@ -107,20 +536,26 @@ class GoogleCalendarService:
         except HttpError as e:
             logger.error(f"HTTP error creating appointment: {e}")
             if e.resp.status == 409:
-                raise ValueError("Ce créneau est déjà occupé")
+                raise SlotTakenError()
             elif e.resp.status == 403:
                 raise ValueError("Permissions insuffisantes pour créer le rendez-vous")
             else:
                 raise ValueError(f"Erreur lors de la création du rendez-vous: {e}")
         
+        except ValueError:
+            raise
+        
         except Exception as e:
             logger.error(f"Unexpected error creating appointment: {e}")
+            # L'écriture a pu aboutir côté Google (ex: délai dépassé)
+            self.availability_cache.invalidate()
             raise ValueError("Une erreur inattendue s'est produite lors de la création du rendez-vous")
     
     async def check_availability(
         self, 
         start_datetime: datetime, 
-        end_datetime: datetime
+        end_datetime: datetime,
+        prefetched: Optional[BusyIndex] = None
     ) -> bool:
         """
         Vérifie si un créneau est disponible.
@@ -128,11 +563,24 @@ class GoogleCalendarService:
         Args:
             start_datetime: Date et heure de début du créneau
             end_datetime: Date et heure de fin du créneau
+            prefetched: Créneaux occupés du jour lus par anticipation pendant que
+                l'appelant parlait (voir `prefetch_busy_intervals`)
         
         Returns:
             True si le créneau est libre, False sinon
         """
         try:
+            # Réponse depuis le cache local si la fenêtre chargée couvre le créneau
+            cached = await self.availability_cache.is_available(start_datetime, end_datetime)
+            if cached is not None:
+                logger.info(f"Availability check (cache): {start_datetime} - {end_datetime} = {'Available' if cached else 'Busy'}")
+                return cached
+            
+            if prefetched is not None:
+                is_available = not prefetched.overlaps(start_datetime, end_datetime)
+                logger.info(f"Availability check (prefetched): {start_datetime} - {end_datetime} = {'Available' if is_available else 'Busy'}")
+                return is_available
+            
             # Requête freebusy pour vérifier la disponibilité
             freebusy_query = {
                 'timeMin': start_datetime.isoformat(),
@@ -140,7 +588,7 @@ class GoogleCalendarService:
                 'items': [{'id': self.calendar_id}]
             }
             
-            result = self.service.freebusy().query(body=freebusy_query).execute()
+            result = await self._execute(self.service.freebusy().query(body=freebusy_query))
             busy_times = result.get('calendars', {}).get(self.calendar_id, {}).get('busy', [])
             
             # Si pas de créneaux occupés, le créneau est libre
@@ -158,65 +606,218 @@ class GoogleCalendarService:
             logger.error(f"Unexpected error checking availability: {e}")
             return False
     
-    async def get_appointments(
+    async def get_busy_intervals(
         self, 
-        start_date: datetime = None, 
-        end_date: datetime = None,
-        max_results: int = 10
-    ) -> List[Dict[str, Any]]:
+        start_datetime: datetime, 
+        end_datetime: datetime
+    ) -> BusyIndex:
         """
-        Récupère la liste des rendez-vous.
+        Récupère en une seule requête tous les créneaux occupés d'une période.
         
         Args:
-            start_date: Date de début de la recherche (par défaut: aujourd'hui)
-            end_date: Date de fin de la recherche (par défaut: dans 7 jours)
-            max_results: Nombre maximum de résultats
+            start_datetime: Début de la période
+            end_datetime: Fin de la période
         
         Returns:
-            Liste des rendez-vous
+            BusyIndex des créneaux occupés (celui du cache local s'il couvre la période)
         """
+        cached = await self.availability_cache.busy_index(start_datetime, end_datetime)
+        if cached is not None:
+            return cached
+        
         try:
-            # Dates par défaut
-            if not start_date:
-                start_date = datetime.now()
-            if not end_date:
-                end_date = start_date + timedelta(days=7)
+            freebusy_query = {
+                'timeMin': start_datetime.isoformat(),
+                'timeMax': end_datetime.isoformat(),
+                'items': [{'id': self.calendar_id}]
+            }
+            result = await self._execute(self.service.freebusy().query(body=freebusy_query))
+            busy_times = result.get('calendars', {}).get(self.calendar_id, {}).get('busy', [])
             
-            # Récupération des événements
-            events_result = self.service.events().list(
-                calendarId=self.calendar_id,
-                timeMin=start_date.isoformat(),
-                timeMax=end_date.isoformat(),
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
+            index = BusyIndex()
+            for i, busy in enumerate(busy_times):
+                index.upsert(f"busy-{i}", parse_event_time({'dateTime': busy['start']}),
+                             parse_event_time({'dateTime': busy['end']}))
+            logger.info(f"Retrieved {len(index)} busy intervals between {start_datetime} and {end_datetime}")
+            return index
             
-            events = events_result.get('items', [])
+        except HttpError as e:
+            logger.error(f"HTTP error retrieving busy intervals: {e}")
+            raise ValueError("Impossible de consulter l'agenda pour le moment")
+        
+        except Exception as e:
+            logger.error(f"Unexpected error retrieving busy intervals: {e}")
+            raise ValueError("Une erreur inattendue s'est produite lors de la consultation de l'agenda")
+    
+    async def refresh_availability(self) -> None:
+        """
+        Rafraîchit le cache local des disponibilités pendant un autre travail
+        (analyse de la date demandée). Sans effet si le cache est désactivé ou
+        encore frais ; un échec est seulement journalisé, la vérification
+        interrogera alors l'API.
+        """
+        if not self.availability_cache.enabled:
+            return
+        try:
+            await self.availability_cache.refresh()
+        except Exception as e:
+            logger.warning(f"Availability cache refresh failed: {e}")
+    
+    async def prefetch_busy_intervals(
+        self, 
+        start_datetime: datetime, 
+        end_datetime: datetime
+    ) -> Optional[BusyIndex]:
+        """
+        Lit par anticipation les créneaux occupés d'une période (exécution spéculative).
+        
+        Si le cache local couvre la période, il est simplement rafraîchi et la
+        vérification qui suivra y répondra ; sinon la période est lue par freebusy.
+        
+        Returns:
+            None si le cache local couvre la période, sinon les créneaux occupés lus
+        """
+        if await self.availability_cache.busy_index(start_datetime, end_datetime) is not None:
+            return None
+        return await self.get_busy_intervals(start_datetime, end_datetime)
+    
+    async def get_appointments(
+        self, 
+        start_date: datetime = None, 
+        end_date: datetime = None,
+        max_results: Optional[int] = None,
+        page_size: int = APPOINTMENTS_PAGE_SIZE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Parcourt les rendez-vous d'une période, page par page.
+        
+        Chaque page n'est demandée que lorsque l'appelant a consommé la
+        précédente, avec un masque de champs : la mémoire reste bornée à une
+        page, même sur plusieurs mois d'agenda. En cas d'erreur, l'itération
+        s'arrête (l'erreur est journalisée).
+        
+        Args:
+            start_date: Date de début de la recherche (par défaut: maintenant)
+            end_date: Date de fin de la recherche (par défaut: dans 7 jours)
+            max_results: Nombre maximum de rendez-vous (par défaut: tous)
+            page_size: Nombre de rendez-vous par requête
+        
+        Yields:
+            Rendez-vous ('id', 'title', 'start', 'end', 'description', 'status', 'patient_key')
+        """
+        # Dates par défaut
+        if not start_date:
+            start_date = datetime.now()
+        if not end_date:
+            end_date = start_date + timedelta(days=7)
+        
+        params = {
+            'calendarId': self.calendar_id,
+            'timeMin': start_date.isoformat(),
+            'timeMax': end_date.isoformat(),
+            'singleEvents': True,
+            'orderBy': 'startTime',
+            'fields': _APPOINTMENT_FIELDS,
+        }
+        remaining = max_results
+        page_token = None
+        count = 0
+        while remaining is None or remaining > 0:
+            # Dernière page : pas plus que le nombre de rendez-vous encore attendus
+            params['maxResults'] = page_size if remaining is None else min(page_size, remaining)
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                result = await self._execute(self.service.events().list(**params))
+            except HttpError as e:
+                logger.error(f"HTTP error retrieving appointments: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Unexpected error retrieving appointments: {e}")
+                break
             
-            # Formatage des résultats
-            appointments = []
-            for event in events:
-                appointment = {
+            for event in result.get('items', []):
+                count += 1
+                if remaining is not None:
+                    remaining -= 1
+                yield {
                     'id': event.get('id'),
                     'title': event.get('summary', 'Sans titre'),
                     'start': event.get('start', {}).get('dateTime'),
                     'end': event.get('end', {}).get('dateTime'),
                     'description': event.get('description', ''),
-                    'status': event.get('status', 'confirmed')
+                    'status': event.get('status', 'confirmed'),
+                    'patient_key': event_patient_key(event)
                 }
-                appointments.append(appointment)
-            
-            logger.info(f"Retrieved {len(appointments)} appointments")
-            return appointments
             
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                break
+        
+        logger.info(f"Retrieved {count} appointments")
+    
+    async def find_patient_appointments(
+        self, 
+        patient_key: str, 
+        start_date: datetime = None, 
+        end_date: datetime = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Récupère les rendez-vous d'un patient.
+        
+        Réponse depuis l'index local (tenu à jour avec le cache des disponibilités)
+        si la fenêtre chargée couvre la période ; sinon une requête filtrée par
+        Google sur la propriété étendue du patient.
+        
+        Args:
+            patient_key: Clé du patient (voir patients.patient_key)
+            start_date: Début de la période (par défaut: maintenant)
+            end_date: Fin de la période (par défaut: fin de la fenêtre du cache)
+        
+        Returns:
+            Rendez-vous ('id', 'start', 'end') triés par heure de début
+        """
+        start_date = start_date or datetime.now()
+        # Par défaut, jusqu'à la fin de la fenêtre chargée par le cache (minuit)
+        end_date = end_date or datetime.combine(start_date.date(), datetime.min.time()) + timedelta(days=DEFAULT_WINDOW_DAYS)
+        
+        cached = await self.availability_cache.patient_appointments(patient_key, start_date, end_date)
+        if cached is not None:
+            logger.info(f"Retrieved {len(cached)} patient appointments (index)")
+            return [
+                {'id': event_id, 'start': start.isoformat(), 'end': end.isoformat()}
+                for start, end, event_id in cached
+            ]
+        
+        try:
+            events_result = await self._execute(self.service.events().list(
+                calendarId=self.calendar_id,
+                timeMin=start_date.isoformat(),
+                timeMax=end_date.isoformat(),
+                privateExtendedProperty=f"{PATIENT_KEY_PROPERTY}={patient_key}",
+                singleEvents=True,
+                orderBy='startTime'
+            ))
         except HttpError as e:
-            logger.error(f"HTTP error retrieving appointments: {e}")
-            return []
+            logger.error(f"HTTP error retrieving patient appointments: {e}")
+            raise ValueError("Impossible de consulter l'agenda pour le moment")
         
         except Exception as e:
-            logger.error(f"Unexpected error retrieving appointments: {e}")
-            return []
+            logger.error(f"Unexpected error retrieving patient appointments: {e}")
+            raise ValueError("Une erreur inattendue s'est produite lors de la consultation de l'agenda")
+        
+        appointments = []
+        for event in events_result.get('items', []):
+            start = parse_event_time(event.get('start'))
+            # timeMin porte sur la fin : un rendez-vous déjà commencé n'est pas retenu
+            if start is not None and start >= to_aware(start_date):
+                appointments.append({
+                    'id': event.get('id'),
+                    'start': event.get('start', {}).get('dateTime'),
+                    'end': event.get('end', {}).get('dateTime'),
+                })
+        logger.info(f"Retrieved {len(appointments)} patient appointments")
+        return appointments
     
     async def cancel_appointment(self, event_id: str) -> bool:
         """
@@ -229,22 +830,30 @@ class GoogleCalendarService:
             True si l'annulation a réussi, False sinon
         """
         try:
-            self.service.events().delete(
-                calendarId=self.calendar_id,
-                eventId=event_id
-            ).execute()
+            try:
+                await self._execute(self.service.events().delete(
+                    calendarId=self.calendar_id,
+                    eventId=event_id
+                ))
+            except CalendarTimeout as timeout:
+                # La suppression renvoie une réponse vide : {} signifie supprimé
+                if await self._outcome_after_timeout(timeout, event_id) != {}:
+                    raise
             
             logger.info(f"Appointment {event_id} cancelled successfully")
+            self.availability_cache.remove_event(event_id)
             return True
             
         except HttpError as e:
             logger.error(f"HTTP error cancelling appointment: {e}")
             if e.resp.status == 404:
                 logger.warning(f"Appointment {event_id} not found")
+                self.availability_cache.remove_event(event_id)
             return False
         
         except Exception as e:
             logger.error(f"Unexpected error cancelling appointment: {e}")
+            self.availability_cache.invalidate()
             return False
     
     async def reschedule_appointment(
@@ -265,30 +874,27 @@ class GoogleCalendarService:
             Dict contenant les détails du rendez-vous reporté
         """
         try:
-            # Récupération de l'événement existant
-            event = self.service.events().get(
-                calendarId=self.calendar_id,
-                eventId=event_id
-            ).execute()
+            if await self._slot_taken(new_start_datetime, new_end_datetime, ignore_id=event_id):
+                logger.info(f"Slot {new_start_datetime} - {new_end_datetime} was taken in the meantime")
+                self.availability_cache.invalidate()
+                raise SlotTakenError()
             
-            # Mise à jour des dates
-            event['start'] = {
-                'dateTime': new_start_datetime.isoformat(),
-                'timeZone': 'Europe/Paris',
-            }
-            event['end'] = {
-                'dateTime': new_end_datetime.isoformat(),
-                'timeZone': 'Europe/Paris',
-            }
-            
-            # Mise à jour de l'événement
-            updated_event = self.service.events().update(
-                calendarId=self.calendar_id,
-                eventId=event_id,
-                body=event
-            ).execute()
+            # Une seule requête : seuls les champs start/end sont envoyés
+            try:
+                updated_event = await self._execute(self.service.events().patch(
+                    calendarId=self.calendar_id,
+                    eventId=event_id,
+                    body=_event_times(new_start_datetime, new_end_datetime)
+                ))
+            except CalendarTimeout as timeout:
+                updated_event = await self._outcome_after_timeout(timeout, event_id)
+                moved = updated_event and parse_event_time(updated_event.get('start')) == to_aware(new_start_datetime)
+                if not moved:
+                    raise
+                logger.info(f"Appointment {event_id} was rescheduled despite the timeout")
             
             logger.info(f"Appointment {event_id} rescheduled successfully")
+            self.availability_cache.apply_event(updated_event)
             
             return {
                 'id': updated_event.get('id'),
@@ -305,43 +911,104 @@ class GoogleCalendarService:
             else:
                 raise ValueError(f"Erreur lors du report: {e}")
         
+        except ValueError:
+            raise
+        
         except Exception as e:
             logger.error(f"Unexpected error rescheduling appointment: {e}")
+            self.availability_cache.invalidate()
             raise ValueError("Une erreur inattendue s'est produite lors du report")
     
-    def parse_datetime_from_text(self, text: str) -> Optional[datetime]:
+    async def patch_appointments(self, patches: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
         """
-        Parse une date/heure depuis du texte en français en utilisant dateparser.
+        Modifie plusieurs rendez-vous indépendants en requêtes batch (ex: déplacement
+        en masse depuis l'administration, ajout de rappels).
         
         Args:
-            text: Texte contenant la date/heure (ex: "demain à 15h", "le 25 décembre à 10h30")
+            patches: (ID de l'événement, champs à modifier) pour chaque rendez-vous
         
         Returns:
-            datetime object ou None si le parsing échoue
+            Un résultat par rendez-vous, dans l'ordre : 'status' vaut 'updated' ou 'error'
         """
-        import dateparser
-        
+        requests = [
+            self.service.events().patch(calendarId=self.calendar_id, eventId=event_id, body=body)
+            for event_id, body in patches
+        ]
         try:
-            # 'fr' indique à dateparser d'interpréter les dates en français
-            # PREFER_DATES_FROM: 'future' évite d'interpréter "samedi" comme le samedi passé
-            parsed_date = dateparser.parse(text, languages=['fr'], settings={'PREFER_DATES_FROM': 'future'})
-            
-            if parsed_date:
-                logger.info(f"Successfully parsed '{text}' to '{parsed_date}'")
-                return parsed_date
-            else:
-                logger.warning(f"Could not parse datetime from text: {text}")
-                return None
+            responses = await self._execute_batch(requests)
         except Exception as e:
-            logger.error(f"Error parsing datetime with dateparser: {e}")
-            return None
+            logger.error(f"Unexpected error in batch update: {e}")
+            # Une partie des modifications a pu aboutir côté Google
+            self.availability_cache.invalidate()
+            raise ValueError("Une erreur inattendue s'est produite lors de la mise à jour des rendez-vous")
+        
+        results = []
+        for (event_id, _), response in zip(patches, responses):
+            if isinstance(response, Exception):
+                logger.error(f"Batch update of appointment {event_id} failed: {response}")
+                if isinstance(response, HttpError) and response.resp.status == 404:
+                    self.availability_cache.remove_event(event_id)
+                results.append({'id': event_id, 'status': 'error', 'error': str(response)})
+                continue
+            self.availability_cache.apply_event(response)
+            results.append({
+                'id': response.get('id'),
+                'title': response.get('summary'),
+                'start': response.get('start', {}).get('dateTime'),
+                'end': response.get('end', {}).get('dateTime'),
+                'status': 'updated'
+            })
+        logger.info(f"Batch updated {sum(r['status'] == 'updated' for r in results)}/{len(results)} appointments")
+        return results
+    
+    async def reschedule_appointments(
+        self, 
+        moves: List[Tuple[str, datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Reporte plusieurs rendez-vous en requêtes batch.
+        
+        Args:
+            moves: (ID de l'événement, nouveau début, nouvelle fin) pour chaque rendez-vous
+        
+        Returns:
+            Un résultat par rendez-vous (voir `patch_appointments`)
+        """
+        return await self.patch_appointments(
+            [(event_id, _event_times(start, end)) for event_id, start, end in moves]
+        )
+
+def create_calendar_service(calendar_id: Optional[str] = None, practitioner: Optional[str] = None) -> CalendarBackend:
+    """
+    Instancie le service d'agenda selon CALENDAR_BACKEND.
+
+    Args:
+        calendar_id: Agenda Google (défaut : GOOGLE_CALENDAR_ID)
+        practitioner: Praticien de la base SQLite (défaut : CALENDAR_PRACTITIONER)
+    """
+    if CALENDAR_BACKEND == 'sqlite':
+        from db_driver import create_sqlite_calendar_service
+        return create_sqlite_calendar_service(calendar_id, practitioner)
+    return GoogleCalendarService(calendar_id=calendar_id)
+
 
 # Instance globale du service (singleton)
 _calendar_service = None
+# Service de l'appel en cours, s'il diffère du singleton (cabinet d'un worker multi-cabinets)
+_session_calendar: ContextVar[Optional[CalendarBackend]] = ContextVar("calendar_service", default=None)
+
+
+def use_calendar_service(service: Optional[CalendarBackend]) -> None:
+    """Associe un service d'agenda au contexte courant (appel et tâches qu'il crée)."""
+    _session_calendar.set(service)
+
 
-def get_calendar_service() -> GoogleCalendarService:
-    """Retourne l'instance du service Google Calendar (singleton)."""
+def get_calendar_service() -> CalendarBackend:
+    """Retourne le service d'agenda de l'appel en cours, sinon l'instance globale (singleton)."""
     global _calendar_service
+    service = _session_calendar.get()
+    if service is not None:
+        return service
     if _calendar_service is None:
-        _calendar_service = GoogleCalendarService()
+        _calendar_service = create_calendar_service()
     return _calendar_service
\ No newline at end of file
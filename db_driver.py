@@ -0,0 +1,547 @@
+"""
+Agenda local SQLite du cabinet (CALENDAR_BACKEND=sqlite).
+
+Les rendez-vous sont indexés par praticien et heure de début : vérifier un
+créneau ou lister une période est une requête par plage d'index, sans appel
+réseau (bien moins d'une milliseconde). La base est partagée par les
+processus du worker (mode WAL) ; chaque écriture vérifie le chevauchement et
+écrit dans la même transaction, si bien que deux appels simultanés ne peuvent
+pas réserver le même créneau. Les requêtes s'exécutent dans un thread dédié
+par service : l'attente du verrou d'écriture d'un autre processus ne bloque
+jamais la boucle d'événements (audio des appels en cours).
+
+Chaque rendez-vous porte la clé du patient (patients.py), indexée avec l'heure
+de début : les rendez-vous d'un patient se lisent aussi en une recherche.
+
+Synchronisation optionnelle avec Google Calendar (CALENDAR_SYNC_INTERVAL > 0),
+en tâche de fond : les modifications locales sont envoyées à Google, puis les
+événements modifiés côté Google (agenda tenu par le secrétariat) sont
+rapatriés. Une modification locale pas encore envoyée l'emporte. Un rendez-vous
+refusé par Google parce que le créneau y est déjà pris est marqué en conflit
+(`push_conflict`) et signalé une fois : il n'est renvoyé qu'après une nouvelle
+modification locale (report, annulation).
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from availability_cache import DEFAULT_WINDOW_DAYS, TIMEZONE, BusyIndex, parse_event_time, to_aware
+from calendar_service import APPOINTMENTS_PAGE_SIZE, CalendarBackend, GoogleCalendarService, SlotTakenError
+from patients import event_patient_key
+
+logger = logging.getLogger(__name__)
+
+# Fichier de la base SQLite (":memory:" = base éphémère du processus)
+CALENDAR_DB_PATH = os.getenv('CALENDAR_DB_PATH', './calendar.db')
+# Praticien dont l'agenda est servi
+CALENDAR_PRACTITIONER = os.getenv('CALENDAR_PRACTITIONER', 'cabinet')
+# Intervalle (secondes) de synchronisation avec Google Calendar (0 = désactivée)
+CALENDAR_SYNC_INTERVAL = float(os.getenv('CALENDAR_SYNC_INTERVAL', '0'))
+# Attente maximale (ms) du verrou d'écriture tenu par un autre processus (dans le thread de la base)
+BUSY_TIMEOUT_MS = 2000
+# Un envoi vers Google interrompu (processus arrêté) est repris après ce délai (secondes)
+PUSH_CLAIM_TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id TEXT PRIMARY KEY,
+    practitioner TEXT NOT NULL,
+    start_ts REAL NOT NULL,
+    end_ts REAL NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    description TEXT NOT NULL DEFAULT '',
+    attendee_email TEXT,
+    patient_key TEXT,
+    status TEXT NOT NULL DEFAULT 'confirmed',
+    google_id TEXT UNIQUE,
+    -- 1 : modification locale à envoyer à Google
+    dirty INTEGER NOT NULL DEFAULT 1,
+    -- Envoi vers Google en cours depuis (timestamp)
+    pushing_since REAL,
+    -- 1 : créneau déjà pris côté Google, plus renvoyé jusqu'à la prochaine modification locale
+    push_conflict INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS appointments_by_start ON appointments (practitioner, start_ts);
+CREATE INDEX IF NOT EXISTS appointments_to_push ON appointments (practitioner) WHERE dirty = 1;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+"""
+
+# Rendez-vous qui chevauchent [:start, :end[. La borne basse sur start_ts (plus
+# long rendez-vous connu) garde la recherche dans une plage de l'index.
+_OVERLAP = """
+    practitioner = :practitioner AND status = 'confirmed' AND id != :exclude
+    AND start_ts < :end
+    AND start_ts >= :start - coalesce((SELECT value FROM meta WHERE key = 'max_duration'), 0)
+    AND end_ts > :start
+"""
+
+
+def _timestamp(dt: datetime) -> float:
+    return to_aware(dt).timestamp()
+
+
+def _local(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, TIMEZONE)
+
+
+def _appointment(row: sqlite3.Row, status: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        'id': row['id'],
+        'title': row['title'] or 'Sans titre',
+        'start': _local(row['start_ts']).isoformat(),
+        'end': _local(row['end_ts']).isoformat(),
+        'description': row['description'],
+        'status': status or row['status'],
+        'patient_key': row['patient_key'],
+    }
+
+
+class SqliteCalendarService(CalendarBackend):
+    """
+    Agenda d'un praticien dans une base SQLite locale.
+
+    Args:
+        path: Fichier de la base (créé au besoin)
+        practitioner: Praticien dont l'agenda est servi
+        google: Service Google Calendar avec lequel synchroniser (optionnel)
+        sync_interval: Intervalle de synchronisation (secondes, 0 = désactivée)
+    """
+
+    def __init__(
+        self,
+        path: str = CALENDAR_DB_PATH,
+        practitioner: str = CALENDAR_PRACTITIONER,
+        google: Optional[GoogleCalendarService] = None,
+        sync_interval: float = CALENDAR_SYNC_INTERVAL
+    ):
+        self.path = path
+        self.practitioner = practitioner
+        self.google = google
+        self.sync_interval = sync_interval
+        self._sync_task: Optional[asyncio.Task] = None
+        # Un seul thread par connexion : les requêtes sont sérialisées hors de la boucle d'événements
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="calendar-db")
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(_SCHEMA)
+        # Base créée avant l'ajout de la clé patient
+        columns = {row['name'] for row in self._db.execute("PRAGMA table_info(appointments)")}
+        if 'patient_key' not in columns:
+            self._db.execute("ALTER TABLE appointments ADD COLUMN patient_key TEXT")
+        if 'push_conflict' not in columns:
+            self._db.execute("ALTER TABLE appointments ADD COLUMN push_conflict INTEGER NOT NULL DEFAULT 0")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS appointments_by_patient ON appointments (patient_key, start_ts) "
+            "WHERE patient_key IS NOT NULL"
+        )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE : verrou d'écriture pris avant la vérification du créneau
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._db
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Exécute des requêtes SQLite (bloquantes) dans le thread de la base."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _fetchone(self, sql: str, params: Any = ()) -> Optional[sqlite3.Row]:
+        return await self._run(lambda: self._db.execute(sql, params).fetchone())
+
+    async def _fetchall(self, sql: str, params: Any = ()) -> List[sqlite3.Row]:
+        return await self._run(lambda: self._db.execute(sql, params).fetchall())
+
+    async def _rowcount(self, sql: str, params: Any = ()) -> int:
+        return await self._run(lambda: self._db.execute(sql, params).rowcount)
+
+    def _params(self, start: float, end: float, exclude: str = '') -> Dict[str, Any]:
+        return {'practitioner': self.practitioner, 'start': start, 'end': end, 'exclude': exclude}
+
+    @staticmethod
+    def _track_duration(db: sqlite3.Connection, duration: float) -> None:
+        db.execute(
+            "INSERT INTO meta (key, value) VALUES ('max_duration', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)",
+            (duration,)
+        )
+
+    # -------------------- CalendarBackend --------------------
+
+    async def create_appointment(
+        self,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        description: str = "",
+        attendee_email: str = None,
+        patient_key: str = None
+    ) -> Dict[str, Any]:
+        self._ensure_sync()
+        start, end = _timestamp(start_datetime), _timestamp(end_datetime)
+        appointment_id = uuid.uuid4().hex
+
+        def insert() -> None:
+            with self._transaction() as db:
+                if db.execute(f"SELECT 1 FROM appointments WHERE {_OVERLAP} LIMIT 1", self._params(start, end)).fetchone():
+                    raise SlotTakenError()
+                db.execute(
+                    "INSERT INTO appointments "
+                    "(id, practitioner, start_ts, end_ts, title, description, attendee_email, patient_key) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (appointment_id, self.practitioner, start, end, title, description, attendee_email, patient_key)
+                )
+                self._track_duration(db, end - start)
+
+        try:
+            await self._run(insert)
+        except sqlite3.Error as e:
+            logger.error(f"Database error creating appointment: {e}")
+            raise ValueError("Une erreur inattendue s'est produite lors de la création du rendez-vous")
+
+        logger.info(f"Appointment created successfully: {appointment_id}")
+        return {
+            'id': appointment_id,
+            'title': title,
+            'start': _local(start).isoformat(),
+            'end': _local(end).isoformat(),
+            'html_link': None,
+            'status': 'created'
+        }
+
+    async def check_availability(
+        self,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        prefetched: Optional[BusyIndex] = None
+    ) -> bool:
+        # Lecture locale : les créneaux lus par anticipation n'apportent rien
+        self._ensure_sync()
+        try:
+            row = await self._fetchone(
+                f"SELECT 1 FROM appointments WHERE {_OVERLAP} LIMIT 1",
+                self._params(_timestamp(start_datetime), _timestamp(end_datetime))
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Database error checking availability: {e}")
+            return False
+        is_available = row is None
+        logger.info(f"Availability check (sqlite): {start_datetime} - {end_datetime} = {'Available' if is_available else 'Busy'}")
+        return is_available
+
+    async def get_busy_intervals(self, start_datetime: datetime, end_datetime: datetime) -> BusyIndex:
+        self._ensure_sync()
+        try:
+            rows = await self._fetchall(
+                f"SELECT id, start_ts, end_ts FROM appointments WHERE {_OVERLAP}",
+                self._params(_timestamp(start_datetime), _timestamp(end_datetime))
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Database error retrieving busy intervals: {e}")
+            raise ValueError("Impossible de consulter l'agenda pour le moment")
+        index = BusyIndex()
+        for row in rows:
+            index.upsert(row['id'], _local(row['start_ts']), _local(row['end_ts']))
+        return index
+
+    async def get_appointments(
+        self,
+        start_date: datetime = None,
+        end_date: datetime = None,
+        max_results: Optional[int] = None,
+        page_size: int = APPOINTMENTS_PAGE_SIZE
+    ) -> AsyncIterator[Dict[str, Any]]:
+        self._ensure_sync()
+        start_date = start_date or datetime.now()
+        end_date = end_date or start_date + timedelta(days=7)
+        params = self._params(_timestamp(start_date), _timestamp(end_date))
+        # Pagination par clé (début, id) : aucun curseur ouvert entre deux pages
+        after = (float('-inf'), '')
+        remaining = max_results
+        count = 0
+        while remaining is None or remaining > 0:
+            limit = page_size if remaining is None else min(page_size, remaining)
+            try:
+                rows = await self._fetchall(
+                    f"SELECT * FROM appointments WHERE {_OVERLAP} AND (start_ts, id) > (:after_ts, :after_id) "
+                    "ORDER BY start_ts, id LIMIT :limit",
+                    {**params, 'after_ts': after[0], 'after_id': after[1], 'limit': limit}
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Database error retrieving appointments: {e}")
+                break
+            for row in rows:
+                yield _appointment(row)
+            count += len(rows)
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < limit:
+                break
+            after = (rows[-1]['start_ts'], rows[-1]['id'])
+        logger.info(f"Retrieved {count} appointments")
+
+    async def find_patient_appointments(
+        self,
+        patient_key: str,
+        start_date: datetime = None,
+        end_date: datetime = None
+    ) -> List[Dict[str, Any]]:
+        self._ensure_sync()
+        start_date = start_date or datetime.now()
+        end_date = end_date or start_date + timedelta(days=DEFAULT_WINDOW_DAYS)
+        try:
+            rows = await self._fetchall(
+                "SELECT * FROM appointments WHERE patient_key = ? AND start_ts >= ? AND start_ts < ? "
+                "AND practitioner = ? AND status = 'confirmed' ORDER BY start_ts",
+                (patient_key, _timestamp(start_date), _timestamp(end_date), self.practitioner)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Database error retrieving patient appointments: {e}")
+            raise ValueError("Impossible de consulter l'agenda pour le moment")
+        logger.info(f"Retrieved {len(rows)} patient appointments")
+        return [_appointment(row) for row in rows]
+
+    async def cancel_appointment(self, event_id: str) -> bool:
+        self._ensure_sync()
+        try:
+            cancelled = await self._rowcount(
+                "UPDATE appointments SET status = 'cancelled', dirty = 1, push_conflict = 0 "
+                "WHERE id = ? AND practitioner = ? AND status = 'confirmed'",
+                (event_id, self.practitioner)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Database error cancelling appointment: {e}")
+            return False
+        if cancelled == 0:
+            logger.warning(f"Appointment {event_id} not found")
+            return False
+        logger.info(f"Appointment {event_id} cancelled successfully")
+        return True
+
+    def _move(self, event_id: str, start: float, end: float) -> sqlite3.Row:
+        """Déplace un rendez-vous dans sa propre transaction (thread de la base)."""
+        with self._transaction() as db:
+            return self._move_in(db, event_id, start, end)
+
+    def _move_in(self, db: sqlite3.Connection, event_id: str, start: float, end: float) -> sqlite3.Row:
+        row = db.execute(
+            "SELECT * FROM appointments WHERE id = ? AND practitioner = ? AND status = 'confirmed'",
+            (event_id, self.practitioner)
+        ).fetchone()
+        if row is None:
+            raise ValueError("Rendez-vous non trouvé")
+        if db.execute(f"SELECT 1 FROM appointments WHERE {_OVERLAP} LIMIT 1", self._params(start, end, event_id)).fetchone():
+            raise SlotTakenError()
+        db.execute(
+            "UPDATE appointments SET start_ts = ?, end_ts = ?, dirty = 1, push_conflict = 0 WHERE id = ?",
+            (start, end, event_id)
+        )
+        self._track_duration(db, end - start)
+        return db.execute("SELECT * FROM appointments WHERE id = ?", (event_id,)).fetchone()
+
+    async def reschedule_appointment(
+        self,
+        event_id: str,
+        new_start_datetime: datetime,
+        new_end_datetime: datetime
+    ) -> Dict[str, Any]:
+        self._ensure_sync()
+        try:
+            row = await self._run(self._move, event_id, _timestamp(new_start_datetime), _timestamp(new_end_datetime))
+        except sqlite3.Error as e:
+            logger.error(f"Database error rescheduling appointment: {e}")
+            raise ValueError("Une erreur inattendue s'est produite lors du report")
+        logger.info(f"Appointment {event_id} rescheduled successfully")
+        return _appointment(row, status='rescheduled')
+
+    async def reschedule_appointments(
+        self,
+        moves: List[Tuple[str, datetime, datetime]]
+    ) -> List[Dict[str, Any]]:
+        self._ensure_sync()
+        results = []
+        for event_id, start, end in moves:
+            try:
+                row = await self._run(self._move, event_id, _timestamp(start), _timestamp(end))
+                results.append(_appointment(row, status='updated'))
+            except (ValueError, sqlite3.Error) as e:
+                logger.error(f"Rescheduling appointment {event_id} failed: {e}")
+                results.append({'id': event_id, 'status': 'error', 'error': str(e)})
+        logger.info(f"Rescheduled {sum(r['status'] == 'updated' for r in results)}/{len(results)} appointments")
+        return results
+
+    def close(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+        if self.google is not None:
+            self.google.close()
+        # Requêtes en cours terminées avant la fermeture de la connexion
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+    # -------------------- synchronisation avec Google --------------------
+
+    def _ensure_sync(self) -> None:
+        # Démarrée au premier usage, dans la boucle d'événements du processus
+        if self.google is None or self.sync_interval <= 0 or self._sync_task is not None:
+            return
+        # Contexte vierge : les requêtes de synchronisation ne sont pas attribuées au tour en cours
+        self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop(), context=contextvars.Context())
+
+    async def _sync_loop(self) -> None:
+        while True:
+            try:
+                pushed, pulled = await self.sync_once()
+                if pushed or pulled:
+                    logger.info(f"Google Calendar sync: {pushed} pushed, {pulled} pulled")
+            except Exception as e:
+                logger.warning(f"Google Calendar sync failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def sync_once(self) -> Tuple[int, int]:
+        """Envoie les modifications locales à Google puis rapatrie celles de Google."""
+        return await self._push(), await self._pull()
+
+    async def _push(self) -> int:
+        now = time.time()
+        # Réservation des lignes à envoyer : un autre processus ne les enverra pas en double
+        rows = await self._fetchall(
+            "UPDATE appointments SET pushing_since = ? "
+            "WHERE practitioner = ? AND dirty = 1 AND push_conflict = 0 "
+            "AND (pushing_since IS NULL OR pushing_since < ?) "
+            "RETURNING *",
+            (now, self.practitioner, now - PUSH_CLAIM_TIMEOUT)
+        )
+
+        pushed = 0
+        for row in rows:
+            google_id = row['google_id']
+            start, end = _local(row['start_ts']), _local(row['end_ts'])
+            try:
+                if row['status'] == 'cancelled':
+                    if google_id is not None and not await self.google.cancel_appointment(google_id):
+                        raise ValueError("annulation refusée par Google")
+                elif google_id is None:
+                    created = await self.google.create_appointment(
+                        row['title'], start, end, row['description'], row['attendee_email'], row['patient_key']
+                    )
+                    google_id = created['id']
+                else:
+                    await self.google.reschedule_appointment(google_id, start, end)
+            except SlotTakenError:
+                # Renvoyer le même créneau échouerait à chaque synchronisation : à arbitrer par le cabinet
+                logger.error(
+                    f"Appointment {row['id']} ({start:%Y-%m-%d %H:%M}) conflicts with an event in Google Calendar: "
+                    "not pushed again until it is changed locally"
+                )
+                # Ligne modifiée pendant l'envoi : la nouvelle version sera envoyée
+                await self._rowcount(
+                    "UPDATE appointments SET push_conflict = (start_ts = ? AND end_ts = ? AND status = ?), "
+                    "pushing_since = NULL WHERE id = ?",
+                    (row['start_ts'], row['end_ts'], row['status'], row['id'])
+                )
+                continue
+            except Exception as e:
+                logger.warning(f"Could not push appointment {row['id']} to Google Calendar: {e}")
+                await self._rowcount("UPDATE appointments SET pushing_since = NULL WHERE id = ?", (row['id'],))
+                continue
+
+            await self._run(self._record_push, row, google_id)
+            pushed += 1
+        return pushed
+
+    def _record_push(self, row: sqlite3.Row, google_id: str) -> None:
+        with self._transaction() as db:
+            # Événement déjà rapatrié par un autre processus avant l'enregistrement de son ID
+            db.execute("DELETE FROM appointments WHERE google_id = ? AND id != ?", (google_id, row['id']))
+            # Ligne modifiée pendant l'envoi : elle reste à envoyer
+            db.execute(
+                "UPDATE appointments SET google_id = ?, pushing_since = NULL, "
+                "dirty = NOT (start_ts = ? AND end_ts = ? AND status = ?) WHERE id = ?",
+                (google_id, row['start_ts'], row['end_ts'], row['status'], row['id'])
+            )
+
+    async def _pull(self) -> int:
+        # Une marque par praticien et agenda Google : la base peut être partagée par plusieurs cabinets
+        watermark = f"google_synced_at:{self.practitioner}:{self.google.calendar_id}"
+        synced = await self._fetchone("SELECT value FROM meta WHERE key = ?", (watermark,))
+        # Marge pour le décalage d'horloge avec Google
+        updated_min = datetime.fromisoformat(synced['value']) - timedelta(seconds=60) if synced else None
+        today = datetime.now(TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        sync_started = datetime.now(timezone.utc)
+        events = await self.google.list_events(today, today + timedelta(days=DEFAULT_WINDOW_DAYS), updated_min)
+
+        def apply() -> int:
+            with self._transaction() as db:
+                # Événements déjà à jour (envoyés par cette synchronisation, marge d'horloge) ignorés
+                applied = sum(self._apply_remote(db, event) for event in events)
+                db.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (watermark, sync_started.isoformat())
+                )
+            return applied
+
+        return await self._run(apply)
+
+    def _apply_remote(self, db: sqlite3.Connection, event: Dict[str, Any]) -> bool:
+        """Reporte un événement Google dans la base. Renvoie True si la base a changé."""
+        row = db.execute("SELECT * FROM appointments WHERE google_id = ?", (event['id'],)).fetchone()
+        if row is not None and row['dirty']:
+            return False
+        if event.get('status') == 'cancelled':
+            if row is None or row['status'] == 'cancelled':
+                return False
+            db.execute("UPDATE appointments SET status = 'cancelled' WHERE id = ?", (row['id'],))
+            return True
+        start, end = parse_event_time(event.get('start')), parse_event_time(event.get('end'))
+        if start is None or end is None:
+            return False
+        values = (
+            start.timestamp(), end.timestamp(), event.get('summary') or '', event.get('description') or '',
+            event_patient_key(event)
+        )
+        if row is None:
+            db.execute(
+                "INSERT INTO appointments "
+                "(start_ts, end_ts, title, description, patient_key, id, practitioner, google_id, dirty) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (*values, uuid.uuid4().hex, self.practitioner, event['id'])
+            )
+        elif (
+            (row['start_ts'], row['end_ts'], row['title'], row['description'], row['patient_key']) == values
+            and row['status'] == 'confirmed'
+        ):
+            return False
+        else:
+            db.execute(
+                "UPDATE appointments SET start_ts = ?, end_ts = ?, title = ?, description = ?, patient_key = ?, "
+                "status = 'confirmed' WHERE id = ?",
+                (*values, row['id'])
+            )
+        self._track_duration(db, values[1] - values[0])
+        return True
+
+def create_sqlite_calendar_service(
+    calendar_id: Optional[str] = None,
+    practitioner: Optional[str] = None
+) -> SqliteCalendarService:
+    """Service de `get_calendar_service`, synchronisé avec Google si CALENDAR_SYNC_INTERVAL > 0."""
+    google = GoogleCalendarService(calendar_id=calendar_id) if CALENDAR_SYNC_INTERVAL > 0 else None
+    return SqliteCalendarService(practitioner=practitioner or CALENDAR_PRACTITIONER, google=google)
@@ -0,0 +1,155 @@
+"""
+Pipeline d'embedding par lots, parallélisé sur un pool de processus CPU.
+
+Les extraits sont soumis au fil de la lecture des documents ; ils sont regroupés
+en lots de EMBED_BATCH_SIZE et répartis sur EMBED_WORKERS processus qui chargent
+chacun le modèle d'embedding une fois. Le nombre de lots en vol est borné, et
+chaque lot terminé est remis à `on_embedded` (indexer.py l'écrit sur disque) :
+les embeddings en mémoire restent bornés quel que soit le volume du corpus.
+"""
+
+import os
+import time
+import logging
+import multiprocessing as mp
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from knowledge_base import EMBED_BACKEND, load_embed_model
+
+logger = logging.getLogger(__name__)
+
+# Nombre de processus d'embedding (0 = nombre de cœurs)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0")) or os.cpu_count() or 1
+# Nombre d'extraits embarqués par lot
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+
+_worker_model = None
+
+
+def _init_worker(threads: int) -> None:
+    """Charge le modèle une fois par processus, en limitant ses threads pour éviter la sursouscription."""
+    global _worker_model
+    if EMBED_BACKEND == "onnx":
+        os.environ.setdefault("EMBED_ONNX_THREADS", str(threads))
+    else:
+        import torch
+        torch.set_num_threads(threads)
+    _worker_model = load_embed_model()
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_model.get_text_embedding_batch(texts)
+
+
+class EmbeddingPipeline:
+    """
+    Embarque les nœuds soumis par lots, en parallèle, avec un nombre de lots en vol borné.
+
+    Usage :
+        with EmbeddingPipeline(on_embedded=store) as pipeline:
+            for node in nodes:
+                pipeline.submit(node)
+        print(pipeline.throughput)
+
+    Args:
+        workers: Nombre de processus d'embedding
+        batch_size: Nombre d'extraits par lot
+        on_embedded: Appelé avec chaque lot de nœuds dès que leurs embeddings sont remplis
+    """
+
+    def __init__(
+        self,
+        workers: int = EMBED_WORKERS,
+        batch_size: int = EMBED_BATCH_SIZE,
+        on_embedded: Optional[Callable[[List[BaseNode]], None]] = None
+    ):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.on_embedded = on_embedded
+        self.max_in_flight = 2 * self.workers
+        self.embedded = 0
+        self._batch: List[BaseNode] = []
+        self._pending: Dict[Future, List[BaseNode]] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+
+    def __enter__(self) -> "EmbeddingPipeline":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.finish()
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=exc_type is not None)
+
+    @property
+    def elapsed(self) -> float:
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.perf_counter()) - self._started
+
+    @property
+    def throughput(self) -> float:
+        """Extraits embarqués par seconde."""
+        return self.embedded / self.elapsed if self.elapsed else 0.0
+
+    def submit(self, node: BaseNode) -> None:
+        """Ajoute un nœud sans embedding ; son champ `embedding` sera rempli d'ici `finish()`."""
+        if self._started is None:
+            self._started = time.perf_counter()
+        self._batch.append(node)
+        if len(self._batch) >= self.batch_size:
+            self._dispatch(self._batch)
+            self._batch = []
+
+    def finish(self) -> None:
+        """Embarque le dernier lot partiel et attend tous les lots en vol."""
+        if self._batch:
+            if self._pool is None:
+                # Moins d'un lot au total : pas la peine de démarrer le pool
+                self._assign(self._batch, load_embed_model().get_text_embedding_batch(self._texts(self._batch)))
+            else:
+                self._dispatch(self._batch)
+            self._batch = []
+        while self._pending:
+            self._collect(wait(self._pending).done)
+        self._finished = time.perf_counter()
+        if self.embedded:
+            logger.info(f"Embedded {self.embedded} chunks in {self.elapsed:.2f}s ({self.throughput:.1f} chunks/s)")
+
+    @staticmethod
+    def _texts(nodes: List[BaseNode]) -> List[str]:
+        return [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+
+    def _assign(self, nodes: List[BaseNode], embeddings: List[List[float]]) -> None:
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+        self.embedded += len(nodes)
+        if self.on_embedded is not None:
+            self.on_embedded(nodes)
+
+    def _dispatch(self, nodes: List[BaseNode]) -> None:
+        if self.workers == 1:
+            self._assign(nodes, load_embed_model().get_text_embedding_batch(self._texts(nodes)))
+            return
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+        self._pending[self._pool.submit(_embed_batch, self._texts(nodes))] = nodes
+        if len(self._pending) >= self.max_in_flight:
+            self._collect(wait(self._pending, return_when=FIRST_COMPLETED).done)
+
+    def _collect(self, futures) -> None:
+        for future in futures:
+            self._assign(self._pending.pop(future), future.result())
@@ -0,0 +1,511 @@
+"""
+Doublures locales des services externes de l'agent vocal, pour les benchmarks.
+
+- `FakeCalendarApi` : faux client googleapiclient en mémoire qui implémente les
+  endpoints `events` (insert, get, list, update, patch, delete) et `freebusy`.
+  Comme googleapiclient, chaque `.execute()` bloque le thread appelant pendant
+  la latence simulée de l'API.
+- `FakeSTT`, `FakeTurnDetector`, `FakeLLM`, `FakeTTS` : étapes du pipeline vocal
+  réduites à leur latence (transcription finale, décision de fin de tour,
+  premier token, premier paquet audio).
+- `FakeIndex` : remplaçant de `LazyIndex` qui répond depuis la FAQ de docs/
+  par recouvrement de mots, sans modèle d'embedding ; `FakeEmbedding` fournit
+  des embeddings de requête (sac de mots haché).
+
+Les latences sont décrites par une médiane et un p95 (loi log-normale) pour
+reproduire la queue de distribution des vrais services.
+"""
+
+import copy
+import math
+import zlib
+import time
+import random
+import asyncio
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from googleapiclient.errors import HttpError
+
+from availability_cache import parse_event_time, to_aware
+
+FRAME_SECONDS = 0.02
+# Quantile d'ordre 0.95 de la loi normale centrée réduite
+_Z95 = 1.645
+
+
+class Latency:
+    """Latence simulée : médiane et p95 (secondes) d'une loi log-normale."""
+
+    def __init__(self, median: float, p95: Optional[float] = None):
+        self.median = median
+        self.p95 = median if p95 is None else max(p95, median)
+        self._sigma = math.log(self.p95 / self.median) / _Z95 if self.median > 0 else 0.0
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "Latency"]) -> "Latency":
+        """"0.3" (constante) ou "0.3:0.8" (médiane:p95)."""
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls(float(spec))
+        median, _, p95 = str(spec).partition(':')
+        return cls(float(median), float(p95) if p95 else None)
+
+    def sample(self, rng: random.Random) -> float:
+        if self._sigma == 0.0:
+            return self.median
+        return self.median * math.exp(rng.gauss(0.0, self._sigma))
+
+    def __repr__(self) -> str:
+        return f"{self.median}:{self.p95}"
+
+
+class _LatencyStub:
+    def __init__(self, latency: Union[str, float, Latency] = 0.0, seed: Optional[int] = None):
+        self.latency = Latency.parse(latency)
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    async def _wait(self) -> float:
+        self.calls += 1
+        delay = self.latency.sample(self.rng)
+        await asyncio.sleep(delay)
+        return delay
+
+
+class FakeSTT(_LatencyStub):
+    """Transcription finale disponible `latency` secondes après la fin de parole."""
+
+    async def transcribe(self, utterance: str) -> str:
+        await self._wait()
+        return utterance
+
+
+class FakeTurnDetector(_LatencyStub):
+    """Décision de fin de tour (silence VAD + modèle de fin de tour)."""
+
+    async def end_of_turn(self) -> None:
+        await self._wait()
+
+
+class FakeLLM(_LatencyStub):
+    """Génération dont seul le délai avant le premier token est simulé ; le script décide des outils."""
+
+    async def first_token(self) -> None:
+        await self._wait()
+
+
+class FakeTTS(_LatencyStub):
+    """Synthèse dont seul le délai avant le premier paquet audio est simulé."""
+
+    async def first_audio(self, text: str) -> None:
+        await self._wait()
+
+
+async def simulate_audio_stream(stop: asyncio.Event, lateness: list) -> None:
+    """Simule un flux audio : une trame attendue toutes les 20 ms, retard mesuré."""
+    loop = asyncio.get_running_loop()
+    expected = loop.time()
+    while not stop.is_set():
+        expected += FRAME_SECONDS
+        await asyncio.sleep(max(0.0, expected - loop.time()))
+        lateness.append(max(0.0, loop.time() - expected))
+
+
+# -------------------- Google Calendar --------------------
+
+def _http_error(status: int, reason: str) -> HttpError:
+    import httplib2
+
+    return HttpError(httplib2.Response({'status': status, 'reason': reason}), reason.encode())
+
+
+def _rfc3339_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _parse_bound(value: str) -> datetime:
+    # Google exige un décalage horaire ; une date naïve est lue en heure du cabinet
+    return to_aware(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+def _parse_fields(fields: str) -> Dict[str, Any]:
+    """Masque de champs ("items(id,start),nextPageToken") -> arbre {champ: sous-arbre ou None}."""
+    tree: Dict[str, Any] = {}
+    stack = [tree]
+    name = ''
+
+    def flush() -> None:
+        nonlocal name
+        if name:
+            node = stack[-1]
+            parts = name.strip().split('/')
+            for part in parts[:-1]:
+                node = node.setdefault(part, {})
+            node.setdefault(parts[-1], None)
+        name = ''
+
+    for char in fields:
+        if char == ',':
+            flush()
+        elif char == '(':
+            parts = name.strip().split('/')
+            node = stack[-1]
+            for part in parts:
+                if node.get(part) is None:
+                    node[part] = {}
+                node = node[part]
+            stack.append(node)
+            name = ''
+        elif char == ')':
+            flush()
+            stack.pop()
+        else:
+            name += char
+    flush()
+    return tree
+
+
+def _select(value: Any, tree: Optional[Dict[str, Any]]) -> Any:
+    """Applique un masque de champs à une réponse, comme le paramètre `fields` de l'API."""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_select(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _select(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+class _FakeRequest:
+    def __init__(self, api: "FakeCalendarApi", method: str, fn: Callable[[], Any]):
+        self._api = api
+        self._method = method
+        self._fn = fn
+        self.methodId = f"calendar.{method}"
+
+    def execute(self, http=None, num_retries: int = 0):
+        self._api._before_request(self._method)
+        time.sleep(self._api.latency.sample(self._api.rng))  # bloquant, comme httplib2
+        return self._run()
+
+    def _run(self):
+        with self._api.lock:
+            return copy.deepcopy(self._fn())
+
+
+class _FakeBatch:
+    """Requête batch : une seule requête HTTP (latence et comptage "batch") pour toutes les requêtes ajoutées."""
+
+    def __init__(self, api: "FakeCalendarApi", callback: Optional[Callable] = None):
+        self._api = api
+        self._callback = callback
+        self._requests: List[Tuple[str, _FakeRequest, Optional[Callable]]] = []
+
+    def add(self, request: _FakeRequest, callback: Optional[Callable] = None, request_id: Optional[str] = None):
+        self._requests.append((request_id or str(len(self._requests) + 1), request, callback))
+
+    def execute(self, http=None):
+        self._api._before_request('batch')
+        time.sleep(self._api.latency.sample(self._api.rng))
+        for request_id, request, callback in self._requests:
+            response, exception = None, None
+            try:
+                response = request._run()
+            except HttpError as e:
+                exception = e
+            (callback or self._callback)(request_id, response, exception)
+
+
+class _FakeEvents:
+    def __init__(self, api: "FakeCalendarApi"):
+        self._api = api
+
+    def _get_live(self, event_id: str) -> Dict[str, Any]:
+        event = self._api.store.get(event_id)
+        if event is None or event['status'] == 'cancelled':
+            raise _http_error(404, 'Not Found')
+        return event
+
+    def insert(self, calendarId, body, **kwargs):
+        def run():
+            self._api.sequence += 1
+            # Identifiant fourni par le client, comme l'accepte l'API
+            event_id = body.get('id') or f"evt{self._api.sequence}"
+            if event_id in self._api.store:
+                raise _http_error(409, 'The requested identifier already exists.')
+            event = copy.deepcopy(body)
+            event.update(id=event_id, status='confirmed', updated=_rfc3339_now(),
+                         etag=f'"{self._api.sequence}"', htmlLink=f"https://calendar.test/{event_id}")
+            self._api.store[event_id] = event
+            return event
+        return _FakeRequest(self._api, 'events.insert', run)
+
+    def get(self, calendarId, eventId, **kwargs):
+        return _FakeRequest(self._api, 'events.get', lambda: self._get_live(eventId))
+
+    def update(self, calendarId, eventId, body, **kwargs):
+        def run():
+            self._get_live(eventId)
+            event = copy.deepcopy(body)
+            event.update(id=eventId, status=body.get('status', 'confirmed'), updated=_rfc3339_now())
+            self._api.store[eventId] = event
+            return event
+        return _FakeRequest(self._api, 'events.update', run)
+
+    def patch(self, calendarId, eventId, body, **kwargs):
+        def run():
+            event = self._get_live(eventId)
+            event.update(copy.deepcopy(body))
+            event['updated'] = _rfc3339_now()
+            return event
+        return _FakeRequest(self._api, 'events.patch', run)
+
+    def delete(self, calendarId, eventId, **kwargs):
+        def run():
+            # Comme Google : l'événement supprimé reste visible avec showDeleted
+            event = self._get_live(eventId)
+            event.update(status='cancelled', updated=_rfc3339_now())
+            return ''
+        return _FakeRequest(self._api, 'events.delete', run)
+
+    def list(self, calendarId, timeMin=None, timeMax=None, updatedMin=None, showDeleted=False,
+             singleEvents=False, maxResults=250, orderBy=None, pageToken=None, privateExtendedProperty=None,
+             fields=None, **kwargs):
+        def run():
+            # Filtre "propriété=valeur" sur les propriétés étendues privées
+            private_filter = tuple(privateExtendedProperty.split('=', 1)) if privateExtendedProperty else None
+            time_min = _parse_bound(timeMin) if timeMin else None
+            time_max = _parse_bound(timeMax) if timeMax else None
+            updated_min = _parse_bound(updatedMin) if updatedMin else None
+            items = []
+            for event in self._api.store.values():
+                if event['status'] == 'cancelled' and not showDeleted:
+                    continue
+                start, end = parse_event_time(event.get('start')), parse_event_time(event.get('end'))
+                if time_min is not None and end <= time_min:
+                    continue
+                if time_max is not None and start >= time_max:
+                    continue
+                if updated_min is not None and _parse_bound(event['updated']) < updated_min:
+                    continue
+                if private_filter is not None:
+                    private = event.get('extendedProperties', {}).get('private', {})
+                    if private.get(private_filter[0]) != private_filter[1]:
+                        continue
+                items.append(event)
+            if orderBy == 'startTime':
+                items.sort(key=lambda e: parse_event_time(e['start']))
+            offset = int(pageToken or 0)
+            page = items[offset:offset + maxResults]
+            result = {'kind': 'calendar#events', 'updated': _rfc3339_now(), 'items': page}
+            if offset + maxResults < len(items):
+                result['nextPageToken'] = str(offset + maxResults)
+            return _select(result, _parse_fields(fields)) if fields else result
+        return _FakeRequest(self._api, 'events.list', run)
+
+
+class _FakeFreeBusy:
+    def __init__(self, api: "FakeCalendarApi"):
+        self._api = api
+
+    def query(self, body):
+        def run():
+            start, end = _parse_bound(body['timeMin']), _parse_bound(body['timeMax'])
+            busy = []
+            for event in self._api.store.values():
+                if event['status'] == 'cancelled' or event.get('transparency') == 'transparent':
+                    continue
+                event_start, event_end = parse_event_time(event['start']), parse_event_time(event['end'])
+                if event_start < end and event_end > start:
+                    busy.append({'start': event_start.isoformat(), 'end': event_end.isoformat()})
+            busy.sort(key=lambda interval: interval['start'])
+            return {
+                'kind': 'calendar#freeBusy',
+                'timeMin': body['timeMin'],
+                'timeMax': body['timeMax'],
+                'calendars': {item['id']: {'busy': busy} for item in body['items']},
+            }
+        return _FakeRequest(self._api, 'freebusy.query', run)
+
+
+class FakeCalendarApi:
+    """
+    Faux client googleapiclient : un calendrier en mémoire derrière `events()` et `freebusy()`.
+
+    Args:
+        latency: Latence de chaque requête (secondes, "médiane:p95" ou Latency)
+        seed: Graine du tirage des latences
+    """
+
+    def __init__(self, latency: Union[str, float, Latency] = 0.0, seed: Optional[int] = None):
+        self.latency = Latency.parse(latency)
+        self.rng = random.Random(seed)
+        self.store: Dict[str, Dict[str, Any]] = {}
+        self.sequence = 0
+        self.lock = threading.Lock()
+        # Nombre de requêtes exécutées par méthode (ex: "events.list")
+        self.requests: Counter = Counter()
+        # Hook optionnel appelé avant chaque requête (ex: injecter une HttpError)
+        self.on_request: Optional[Callable[[str], None]] = None
+
+    def _before_request(self, method: str) -> None:
+        with self.lock:
+            self.requests[method] += 1
+        if self.on_request is not None:
+            self.on_request(method)
+
+    def add_event(self, summary: str, start: datetime, end: datetime, private: Optional[Dict[str, str]] = None) -> str:
+        """Ajoute directement un événement (jeu de données initial, sans latence ni comptage)."""
+        with self.lock:
+            self.sequence += 1
+            event_id = f"evt{self.sequence}"
+            self.store[event_id] = {
+                'id': event_id, 'summary': summary, 'status': 'confirmed', 'updated': _rfc3339_now(),
+                'start': {'dateTime': start.isoformat(), 'timeZone': 'Europe/Paris'},
+                'end': {'dateTime': end.isoformat(), 'timeZone': 'Europe/Paris'},
+            }
+            if private:
+                self.store[event_id]['extendedProperties'] = {'private': dict(private)}
+        return event_id
+
+    def events(self):
+        return _FakeEvents(self)
+
+    def freebusy(self):
+        return _FakeFreeBusy(self)
+
+    def new_batch_http_request(self, callback: Optional[Callable] = None) -> _FakeBatch:
+        return _FakeBatch(self, callback)
+
+
+# -------------------- RAG --------------------
+
+def _words(text: str) -> set:
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c if c.isalnum() else ' ' for c in text if not unicodedata.combining(c))
+    return {word for word in text.split() if len(word) > 2}
+
+
+class FakeEmbedding:
+    """Embedding par sac de mots haché (mots de plus de 2 lettres, sans accents), à latence simulée."""
+
+    def __init__(self, dim: int = 256, latency: Union[str, float, Latency] = 0.0, seed: Optional[int] = None):
+        self.dim = dim
+        self.latency = Latency.parse(latency)
+        self.rng = random.Random(seed)
+
+    def get_query_embedding(self, query: str) -> list:
+        # Calcul bloquant simulé, comme un vrai modèle (appelé depuis un thread par l'agent)
+        time.sleep(self.latency.sample(self.rng))
+        vector = [0.0] * self.dim
+        for word in _words(query):
+            vector[zlib.crc32(word.encode()) % self.dim] += 1.0
+        return vector
+
+    async def aget_query_embedding(self, query: str) -> list:
+        return await asyncio.to_thread(self.get_query_embedding, query)
+
+
+class _FakeRetriever:
+    def __init__(self, index: "FakeIndex", top_k: int):
+        self._index = index
+        self._top_k = top_k
+
+    def retrieve(self, query_bundle):
+        from llama_index.core.schema import NodeWithScore, TextNode
+
+        query = _words(query_bundle.query_str)
+        scored = [
+            (len(query & words) / (len(query) or 1), passage)
+            for passage, words in self._index.passages
+        ]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [NodeWithScore(node=TextNode(text=passage), score=score) for score, passage in scored[:self._top_k]]
+
+    async def aretrieve(self, query_bundle):
+        await asyncio.sleep(self._index.latency.sample(self._index.rng))
+        return self.retrieve(query_bundle)
+
+
+class _FakeQueryEngine:
+    def __init__(self, index: "FakeIndex"):
+        self._retriever = _FakeRetriever(index, top_k=2)
+        self._index = index
+
+    async def aquery(self, query_bundle) -> str:
+        nodes = await self._retriever.aretrieve(query_bundle)
+        # Synthèse simulée : un second appel LLM
+        await asyncio.sleep(self._index.synthesis_latency.sample(self._index.rng))
+        return " ".join(node.node.get_content() for node in nodes)
+
+
+class FakeIndex:
+    """
+    Remplaçant de `LazyIndex` : FAQ de docs/ découpée en passages, recherche par mots communs.
+
+    Args:
+        latency: Latence d'une recherche (embedding de la requête + top-k)
+        synthesis_latency: Latence de la synthèse en mode "synthesis"
+    """
+
+    def __init__(
+        self,
+        docs_dir: Optional[Path] = None,
+        latency: Union[str, float, Latency] = 0.0,
+        synthesis_latency: Union[str, float, Latency] = 0.0,
+        seed: Optional[int] = None,
+    ):
+        docs_dir = docs_dir or Path(__file__).parent / "docs"
+        self.latency = Latency.parse(latency)
+        self.synthesis_latency = Latency.parse(synthesis_latency)
+        self.rng = random.Random(seed)
+        self.generation: Optional[str] = "fake"
+        # Pas d'index lexical : recherche par mots communs uniquement
+        self.lexical = None
+        self.faq_router = None
+        self.passages = []
+        for path in sorted(docs_dir.glob("*.txt")) + sorted(docs_dir.glob("*.md")):
+            section = ""
+            for line in path.read_text(encoding='utf-8').splitlines():
+                line = line.strip()
+                if line.startswith('#'):
+                    section = line.lstrip('# ')
+                elif line:
+                    passage = f"{section} : {line.lstrip('- ')}"
+                    self.passages.append((passage, _words(passage)))
+
+    @property
+    def is_loaded(self) -> bool:
+        return True
+
+    def add_reload_listener(self, listener: Callable[[], None]) -> None:
+        pass
+
+    @property
+    def index(self) -> "FakeIndex":
+        # Sert aussi d'instantané (LoadedIndex) : index, lexical et faq_router
+        return self
+
+    def snapshot(self) -> "FakeIndex":
+        return self
+
+    async def asnapshot(self) -> "FakeIndex":
+        return self
+
+    def get(self) -> "FakeIndex":
+        return self
+
+    async def aget(self) -> "FakeIndex":
+        return self
+
+    def as_retriever(self, similarity_top_k: int = 4) -> _FakeRetriever:
+        return _FakeRetriever(self, similarity_top_k)
+
+    def as_query_engine(self, **kwargs) -> _FakeQueryEngine:
+        return _FakeQueryEngine(self)
@@ -0,0 +1,195 @@
+"""
+Routage des questions fréquentes vers une réponse de la FAQ, sans RAG.
+
+À l'indexation (indexer.py), chaque ligne de réponse de la FAQ de docs/ (une
+puce sous un titre de section) devient une entrée. Ses formulations — le texte
+de la réponse et les questions types de `faq_paraphrases.json`, associées par
+un extrait du texte de la réponse — sont embarquées une fois et stockées dans
+une matrice normalisée à côté de l'index (`faq_vectors.npy`).
+
+Les questions types sont propres à chaque base documentaire : le fichier est lu
+à côté du dossier docs/ (`faq_paraphrases.json` à la racine du dépôt,
+`tenants/<id>/faq_paraphrases.json` pour un cabinet). Sans ce fichier, aucune
+réponse n'est routée : un cabinet ne reçoit jamais les réponses de la FAQ d'un
+autre.
+
+Au tour de parole, la transcription est embarquée puis comparée à toutes les
+formulations en un seul produit matriciel. Au-delà du seuil, et si aucune autre
+entrée n'est presque aussi proche, la réponse de la FAQ est dite directement :
+ni décision du LLM, ni `query_info`, ni synthèse. Seules les entrées qui ont
+des questions types sont routées ; le reste passe par le LLM comme avant.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from fr_datetime import normalize_text
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+ROUTER_FILE = "faq_router.json"
+ROUTER_VECTORS_FILE = "faq_vectors.npy"
+# Questions types de chaque réponse de la FAQ (clé : extrait du texte de la réponse),
+# à côté du dossier docs/ qu'elles décrivent
+PARAPHRASES_FILE = "faq_paraphrases.json"
+
+# Routeur actif (1) ou désactivé (0)
+FAQ_ROUTER_ENABLED = os.getenv("FAQ_ROUTER", "1") == "1"
+# Similarité cosinus minimale entre la transcription et une formulation
+FAQ_ROUTER_THRESHOLD = float(os.getenv("FAQ_ROUTER_THRESHOLD", "0.88"))
+# Écart minimal avec la meilleure formulation d'une autre entrée (question ambiguë sinon)
+FAQ_ROUTER_MARGIN = float(os.getenv("FAQ_ROUTER_MARGIN", "0.05"))
+# Au-delà de ce nombre de mots, la phrase n'est pas une question de FAQ (ex: prise de rendez-vous)
+FAQ_ROUTER_MAX_WORDS = int(os.getenv("FAQ_ROUTER_MAX_WORDS", "15"))
+
+
+class FAQEntry:
+    """Réponse de la FAQ : titre de section et texte dit à l'appelant."""
+
+    def __init__(self, section: str, answer: str):
+        self.section = section
+        self.answer = answer
+
+    def __repr__(self) -> str:
+        return f"FAQEntry({self.section!r}, {self.answer!r})"
+
+
+def iter_faq_entries(docs_dir: Path) -> Iterator[FAQEntry]:
+    """Réponses des fichiers texte/Markdown de docs/ : une entrée par puce, avec le titre de sa section."""
+    for path in sorted(Path(docs_dir).glob("*.txt")) + sorted(Path(docs_dir).glob("*.md")):
+        section = ""
+        for line in path.read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line.startswith('#'):
+                section = line.lstrip('# ')
+            elif line.startswith('- ') and section:
+                yield FAQEntry(section, line[2:].strip())
+
+
+def paraphrases_file(docs_dir: Path) -> Path:
+    """Questions types de la base documentaire docs_dir, sans repli sur celles d'une autre base."""
+    return Path(docs_dir).resolve().parent / PARAPHRASES_FILE
+
+
+def has_paraphrases(docs_dir: Path) -> bool:
+    return paraphrases_file(docs_dir).exists()
+
+
+def load_paraphrases(path: Path) -> Dict[str, List[str]]:
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def match_paraphrases(entries: List[FAQEntry], paraphrases: Dict[str, List[str]]) -> List[Tuple[FAQEntry, List[str]]]:
+    """Associe les questions types aux réponses dont le texte contient leur clé."""
+    matched = []
+    unused = set(paraphrases)
+    for entry in entries:
+        answer = normalize_text(entry.answer)
+        questions = []
+        for key, forms in paraphrases.items():
+            if normalize_text(key) in answer:
+                questions.extend(forms)
+                unused.discard(key)
+        if questions:
+            matched.append((entry, [entry.answer] + questions))
+    for key in sorted(unused):
+        logger.warning(f"FAQ paraphrases '{key}' match no answer in docs/")
+    return matched
+
+
+class FAQRouter:
+    """
+    Matrice des formulations embarquées et réponse de chacune.
+
+    Args:
+        entries: Réponses routables
+        vectors: Embeddings normalisés des formulations (une ligne par formulation)
+        row_entries: Numéro d'entrée de chaque ligne de `vectors`
+        threshold: Similarité cosinus minimale
+        margin: Écart minimal avec une autre entrée
+    """
+
+    def __init__(
+        self,
+        entries: List[FAQEntry],
+        vectors: np.ndarray,
+        row_entries: np.ndarray,
+        threshold: float = FAQ_ROUTER_THRESHOLD,
+        margin: float = FAQ_ROUTER_MARGIN
+    ):
+        self.entries = entries
+        self.vectors = vectors
+        self.row_entries = row_entries
+        self.threshold = threshold
+        self.margin = margin
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, docs_dir: Path, embed_model: Any) -> "FAQRouter":
+        """Extrait les réponses de docs/ et embarque leurs formulations (routeur vide sans questions types)."""
+        routed = match_paraphrases(list(iter_faq_entries(docs_dir)), load_paraphrases(paraphrases_file(docs_dir)))
+        texts = [text for _, forms in routed for text in forms]
+        row_entries = np.array([i for i, (_, forms) in enumerate(routed) for _ in forms], dtype=np.int32)
+        vectors = np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32) if texts \
+            else np.zeros((0, 0), dtype=np.float32)
+        if len(vectors):
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return cls([entry for entry, _ in routed], vectors, row_entries)
+
+    def save(self, persist_dir: Path) -> None:
+        persist_dir = Path(persist_dir)
+        payload = {
+            "entries": [{"section": entry.section, "answer": entry.answer} for entry in self.entries],
+            "row_entries": self.row_entries.tolist(),
+        }
+        atomic_write(persist_dir / ROUTER_VECTORS_FILE, lambda f: np.save(f, self.vectors))
+        atomic_write(persist_dir / ROUTER_FILE, lambda f: f.write(json.dumps(payload, ensure_ascii=False).encode('utf-8')))
+        logger.info(f"Wrote FAQ router ({len(self.entries)} answers, {len(self.row_entries)} phrasings)")
+
+    @classmethod
+    def load(cls, persist_dir: Path) -> "FAQRouter":
+        persist_dir = Path(persist_dir)
+        with open(persist_dir / ROUTER_FILE, encoding='utf-8') as f:
+            payload = json.load(f)
+        entries = [FAQEntry(entry["section"], entry["answer"]) for entry in payload["entries"]]
+        vectors = np.load(persist_dir / ROUTER_VECTORS_FILE)
+        return cls(entries, vectors, np.asarray(payload["row_entries"], dtype=np.int32))
+
+    def match(self, query_embedding: List[float]) -> Tuple[Optional[FAQEntry], float]:
+        """
+        Réponse de la FAQ pour une question embarquée.
+
+        Returns:
+            (entrée, similarité), entrée None sous le seuil ou si la question est ambiguë
+        """
+        if not len(self.row_entries):
+            return None, 0.0
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self.vectors @ query
+        best = int(np.argmax(scores))
+        entry, score = int(self.row_entries[best]), float(scores[best])
+        others = scores[self.row_entries != entry]
+        if score < self.threshold or (len(others) and score - float(others.max()) < self.margin):
+            return None, score
+        return self.entries[entry], score
+
+
+def is_faq_candidate(text: str) -> bool:
+    """Phrase assez courte pour être une question de FAQ."""
+    return 0 < len(text.split()) <= FAQ_ROUTER_MAX_WORDS
+
+
+def has_faq_router(persist_dir: Path) -> bool:
+    return (Path(persist_dir) / ROUTER_FILE).exists()
@@ -0,0 +1,279 @@
+"""
+Analyse rapide des expressions de date/heure de rendez-vous en français.
+
+Les formulations courantes ("demain à 15h", "mardi prochain 10h30", "le 2 juillet
+à 14h", "le 2/11 à 10h", "2026-11-02T10:00") sont reconnues par des expressions
+régulières précompilées. L'analyse du texte normalisé est mémorisée (LRU) par
+couple (texte, date de référence) ; seule la combinaison finale avec l'heure
+courante est recalculée. dateparser, beaucoup plus lent, ne sert que pour les
+textes non reconnus.
+
+Les dates renvoyées sont naïves (heure locale du cabinet), comme celles de
+dateparser.
+"""
+
+import re
+import logging
+import unicodedata
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'expressions analysées conservées en mémoire
+PARSE_CACHE_SIZE = 1024
+
+# Paramètres de dateparser (textes non reconnus) : 'fr' pour interpréter les dates
+# en français, PREFER_DATES_FROM 'future' pour que "samedi" désigne le samedi à venir
+DATEPARSER_LANGUAGES = ['fr']
+DATEPARSER_SETTINGS = {'PREFER_DATES_FROM': 'future'}
+
+_WEEKDAYS = {'lundi': 0, 'mardi': 1, 'mercredi': 2, 'jeudi': 3, 'vendredi': 4, 'samedi': 5, 'dimanche': 6}
+_MONTHS = {
+    'janvier': 1, 'janv': 1, 'fevrier': 2, 'fevr': 2, 'fev': 2, 'mars': 3, 'avril': 4, 'avr': 4,
+    'mai': 5, 'juin': 6, 'juillet': 7, 'juil': 7, 'aout': 8, 'septembre': 9, 'sept': 9,
+    'octobre': 10, 'oct': 10, 'novembre': 11, 'nov': 11, 'decembre': 12, 'dec': 12,
+}
+_RELATIVE_DAYS = {"aujourd'hui": 0, 'aujourdhui': 0, 'demain': 1, 'apres-demain': 2, 'apres demain': 2}
+
+
+def _alternation(words) -> str:
+    # Les mots les plus longs d'abord ("apres-demain" avant "demain")
+    return "|".join(sorted(words, key=len, reverse=True))
+
+
+_RELATIVE_RE = re.compile(r"\b(?P<rel>" + _alternation(_RELATIVE_DAYS) + r")\b")
+_WEEKDAY_RE = re.compile(
+    r"\b(?:(?P<this>ce)\s+)?(?P<prefix>prochain\s+)?(?P<wd>" + _alternation(_WEEKDAYS) + r")\b"
+    r"(?P<next>\s+(?:prochain|qui vient))?"
+)
+_DATE_RE = re.compile(
+    r"\b(?P<d>[0-3]?\d)(?:er)?\s+(?P<month>" + _alternation(_MONTHS) + r")\.?(?:\s+(?P<y>\d{4}))?\b"
+)
+_NUMERIC_DATE_RE = re.compile(r"\b(?P<d>[0-3]?\d)/(?P<mo>[01]?\d)(?:/(?P<y>\d{2}|\d{4}))?\b")
+_ISO_RE = re.compile(r"\b(?P<y>\d{4})-(?P<mo>\d{2})-(?P<d>\d{2})(?:[t ](?P<h>\d{2}):(?P<m>\d{2}))?")
+
+_TIME_RE = re.compile(
+    r"(?:\b(?P<h>[01]?\d|2[0-3])\s*(?:heures?|h)(?:\s*(?P<m>[0-5]\d)\b)?|\b(?P<hc>[01]?\d|2[0-3]):(?P<mc>[0-5]\d)\b"
+    r"|\b(?P<noon>midi)\b)"
+    r"(?:\s*(?P<frac>et quart|et demie?|moins le quart))?"
+    r"(?:\s*(?P<period>du matin|de l'apres[- ]midi|du soir))?"
+)
+# Expression reconnue mais qui ne désigne aucune date valide
+_INVALID: Tuple[Optional[date], Optional[time], bool] = (None, None, False)
+# Expressions relatives à l'heure courante ("dans 2 heures") : laissées à dateparser
+_UNSUPPORTED_RE = re.compile(r"\bdans\b")
+# Jour désigné autrement que par les expressions ci-dessus ("le 15", "la semaine
+# prochaine", "mardi en huit") : laissé à dateparser plutôt que compris comme aujourd'hui
+_UNPARSED_DAY_RE = re.compile(
+    r"\ble\s+[0-3]?\d(?:er)?\b(?!\s*(?:heures?|h|:))|\bsemaine\b|\bmois\b|\bweek-?end\b|\ben (?:huit|quinze)\b"
+)
+
+
+def normalize_text(text: str) -> str:
+    """Minuscules sans accents, apostrophes et espaces uniformisés."""
+    text = unicodedata.normalize('NFKD', text.lower().replace('’', "'"))
+    return " ".join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+def _last(pattern: re.Pattern, text: str) -> Optional[re.Match]:
+    # Dernière occurrence : dans "de demain 14h à vendredi 16h", la cible est à la fin
+    match = None
+    for match in pattern.finditer(text):
+        pass
+    return match
+
+
+def _parse_time(match: re.Match) -> Optional[time]:
+    if match.group('noon'):
+        hour, minute = 12, 0
+    elif match.group('hc'):
+        hour, minute = int(match.group('hc')), int(match.group('mc'))
+    else:
+        hour, minute = int(match.group('h')), int(match.group('m') or 0)
+
+    frac = match.group('frac')
+    if frac == 'et quart':
+        minute += 15
+    elif frac and frac.startswith('et demi'):
+        minute += 30
+    elif frac == 'moins le quart':
+        hour, minute = hour - 1, minute + 45
+    if match.group('period') in ("de l'apres-midi", "de l'apres midi", 'du soir') and hour < 12:
+        hour += 12
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return time(hour, minute)
+
+
+def _next_weekday(today: date, weekday: int, allow_today: bool) -> date:
+    days_ahead = (weekday - today.weekday()) % 7
+    if days_ahead == 0 and not allow_today:
+        days_ahead = 7
+    return today + timedelta(days=days_ahead)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_components(text: str, today: date) -> Optional[Tuple[Optional[date], Optional[time], bool]]:
+    """
+    Analyse un texte normalisé relativement à la date du jour.
+
+    Returns:
+        (jour, heure, année implicite) ; None si aucune expression n'est reconnue.
+        Une date impossible ("31/02") est reconnue mais sans jour ni heure.
+    """
+    if _UNSUPPORTED_RE.search(text):
+        return None
+
+    day: Optional[date] = None
+    implicit_year = False
+    parsed_time: Optional[time] = None
+
+    iso = _last(_ISO_RE, text)
+    if iso:
+        try:
+            day = date(int(iso.group('y')), int(iso.group('mo')), int(iso.group('d')))
+        except ValueError:
+            return _INVALID
+        if iso.group('h'):
+            parsed_time = time(int(iso.group('h')), int(iso.group('m')))
+        # L'heure de l'ISO ne doit pas être relue par _TIME_RE
+        text = text[:iso.start()] + text[iso.end():]
+
+    if day is None:
+        explicit = _last(_DATE_RE, text)
+        numeric = None if explicit else _last(_NUMERIC_DATE_RE, text)
+        dated = explicit or numeric
+        if dated:
+            month = _MONTHS[dated.group('month')] if explicit else int(dated.group('mo'))
+            year = dated.group('y')
+            implicit_year = year is None
+            year = today.year if year is None else int(year) + (2000 if len(year) == 2 else 0)
+            try:
+                day = date(year, month, int(dated.group('d')))
+            except ValueError:
+                return _INVALID
+            text = text[:dated.start()] + text[dated.end():]
+
+    if day is None and _UNPARSED_DAY_RE.search(text):
+        return None
+
+    if day is None:
+        relative = _last(_RELATIVE_RE, text)
+        weekday = _last(_WEEKDAY_RE, text)
+        # L'expression la plus à droite l'emporte
+        if relative and (weekday is None or relative.start() > weekday.start()):
+            day = today + timedelta(days=_RELATIVE_DAYS[relative.group('rel')])
+        elif weekday:
+            # "mardi" dit un mardi désigne la semaine suivante, "ce mardi" le jour même
+            next_week = bool(weekday.group('next') or weekday.group('prefix'))
+            day = _next_weekday(today, _WEEKDAYS[weekday.group('wd')], allow_today=bool(weekday.group('this')))
+            if next_week and day == today:
+                day += timedelta(days=7)
+
+    if parsed_time is None:
+        time_match = _last(_TIME_RE, text)
+        if time_match:
+            parsed_time = _parse_time(time_match)
+            if parsed_time is None:
+                return _INVALID
+
+    if day is None and parsed_time is None:
+        return None
+    return day, parsed_time, implicit_year
+
+
+def parse_appointment_datetime(text: str, reference: Optional[datetime] = None) -> Tuple[bool, Optional[datetime]]:
+    """
+    Analyse rapide, sans dateparser.
+
+    Args:
+        text: Texte contenant la date/heure (ex: "demain à 15h")
+        reference: Instant de référence (par défaut maintenant)
+
+    Returns:
+        (reconnu, date/heure). Une date sans heure est reconnue mais renvoie None :
+        un rendez-vous a besoin d'une heure.
+    """
+    reference = reference or datetime.now()
+    components = _parse_components(normalize_text(text), reference.date())
+    if components is None:
+        return False, None
+
+    day, parsed_time, implicit_year = components
+    if parsed_time is None:
+        return True, None
+    if day is None:
+        # Heure seule : aujourd'hui si elle n'est pas passée, sinon demain
+        day = reference.date() if parsed_time > reference.time() else reference.date() + timedelta(days=1)
+
+    result = datetime.combine(day, parsed_time)
+    if implicit_year and result < reference:
+        # "le 2 juillet" déjà passé cette année : l'an prochain
+        try:
+            result = result.replace(year=result.year + 1)
+        except ValueError:
+            return True, None
+    return True, result
+
+
+def parse_mentioned_day(text: str, reference: Optional[datetime] = None) -> Optional[date]:
+    """
+    Jour cité dans un texte, même sans heure ("mardi prochain", "le 2 juillet").
+
+    Sert à anticiper la lecture de l'agenda pendant que l'appelant parle : une
+    heure seule, sans jour, renvoie None.
+    """
+    reference = reference or datetime.now()
+    components = _parse_components(normalize_text(text), reference.date())
+    if components is None or components[0] is None:
+        return None
+    day, _, implicit_year = components
+    if implicit_year and day < reference.date():
+        try:
+            day = day.replace(year=day.year + 1)
+        except ValueError:
+            return None
+    return day
+
+
+def parse_french_datetime(text: str, reference: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Date/heure d'un rendez-vous exprimée en français, ou None.
+
+    Les formulations courantes sont analysées par `parse_appointment_datetime` ;
+    les autres sont confiées à dateparser (dates futures préférées).
+    """
+    recognized, result = parse_appointment_datetime(text, reference)
+    if recognized:
+        return result
+
+    import dateparser
+
+    settings = dict(DATEPARSER_SETTINGS)
+    if reference is not None:
+        settings['RELATIVE_BASE'] = reference
+    logger.debug(f"Falling back to dateparser for: {text}")
+    return dateparser.parse(text, languages=DATEPARSER_LANGUAGES, settings=settings)
+
+
+def preload_date_parser() -> None:
+    """
+    Importe dateparser et charge ses données de langue française.
+
+    Appelé au prewarm : sans cela, le premier texte non reconnu d'un processus
+    paie l'import et le chargement des données pendant l'appel.
+    """
+    import dateparser
+
+    dateparser.parse("demain à 14h30", languages=DATEPARSER_LANGUAGES, settings=DATEPARSER_SETTINGS)
+
+
+def cache_info():
+    """Statistiques du cache d'analyse (hits, misses, maxsize, currsize)."""
+    return _parse_components.cache_info()
+
+
+def clear_cache() -> None:
+    _parse_components.cache_clear()
@@ -0,0 +1,129 @@
+"""
+Profil du temps d'import au démarrage de l'agent.
+
+Rejoue dans un interpréteur neuf lancé avec `-X importtime` les imports du
+processus principal du worker (`import agent`), puis ceux préchargés une fois
+dans le forkserver et hérités par les job processes (PRELOAD_MODULES), et
+affiche pour chaque phase la répartition du temps par paquet. Signale aussi les
+modules lourds (DEFERRED_MODULES) chargés par le processus principal alors
+qu'ils doivent attendre le prewarm ou le premier usage.
+
+Usage :
+    python agent.py profile-imports [--top 25]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+_PHASE_MARKER = "--- import phase ---"
+
+# Modules lourds chargés au prewarm ou au premier usage, jamais par `import agent`
+DEFERRED_MODULES = (
+    "llama_index",
+    "googleapiclient.discovery",
+    "dateparser",
+    "transformers",
+    "sentence_transformers",
+    "torch",
+)
+
+
+def _package(module: str) -> str:
+    """Regroupe un module sous son paquet (les plugins LiveKit sont distingués un à un)."""
+    parts = module.split('.')
+    if parts[:2] == ['livekit', 'plugins'] and len(parts) > 2:
+        return '.'.join(parts[:3])
+    return parts[0]
+
+
+def _parse_importtime(lines: Sequence[str]) -> List[Dict[str, int]]:
+    """Temps propre (µs) par paquet, une table par phase séparée par _PHASE_MARKER."""
+    phases: List[Dict[str, int]] = [defaultdict(int)]
+    for line in lines:
+        if line.strip() == _PHASE_MARKER:
+            phases.append(defaultdict(int))
+            continue
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _cumulative, module = line[len('import time:'):].split('|', 2)
+        phases[-1][_package(module.strip())] += int(self_us)
+    return phases
+
+
+def profile_imports(phases: Sequence[Tuple[str, List[str]]]) -> List[Tuple[str, Dict[str, int]]]:
+    """
+    Mesure les imports de chaque phase dans un sous-processus `python -X importtime`.
+
+    Args:
+        phases: (nom de la phase, modules importés) dans l'ordre d'exécution
+
+    Returns:
+        (nom de la phase, temps propre en µs par paquet) pour chaque phase
+    """
+    script = f"\nimport sys\nsys.stderr.write({_PHASE_MARKER!r} + '\\n')\n".join(
+        "\n".join(f"import {module}" for module in modules) for _, modules in phases
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=Path(__file__).parent,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import profiling failed:\n{result.stderr[-2000:]}")
+    timings = _parse_importtime(result.stderr.splitlines())
+    return [(name, timing) for (name, _), timing in zip(phases, timings)]
+
+
+def eager_imports(modules: Sequence[str], deferred: Sequence[str] = DEFERRED_MODULES) -> List[str]:
+    """
+    Modules différés chargés par l'import de `modules` dans un interpréteur neuf.
+
+    Args:
+        modules: Modules importés (ex: ["agent"])
+        deferred: Modules (et leurs sous-modules) qui ne doivent pas être chargés
+
+    Returns:
+        Les entrées de `deferred` effectivement chargées (liste vide si aucune)
+    """
+    script = "\n".join(f"import {module}" for module in modules)
+    script += "\nimport sys, json\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=Path(__file__).parent,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import check failed:\n{result.stderr[-2000:]}")
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return [name for name in deferred if any(m == name or m.startswith(name + '.') for m in loaded)]
+
+
+def main(argv: Optional[Sequence[str]] = None, preload_modules: Sequence[str] = ()) -> None:
+    parser = argparse.ArgumentParser(prog="agent.py profile-imports", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--top', type=int, default=25, help="Nombre de paquets affichés par phase")
+    args = parser.parse_args(argv)
+
+    phases = [("processus principal (import agent)", ["agent"])]
+    if preload_modules:
+        phases.append(("forkserver (préchargé pour les job processes)", list(preload_modules)))
+
+    for name, timing in profile_imports(phases):
+        total = sum(timing.values())
+        print(f"\n📊 {name} : {total / 1000:.0f} ms")
+        for package, self_us in sorted(timing.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+            print(f"   {self_us / 1000:8.1f} ms  {100 * self_us / (total or 1):5.1f} %  {package}")
+
+    eager = eager_imports(["agent"])
+    if eager:
+        print(f"\n⚠️  Chargés par le processus principal au lieu du prewarm : {', '.join(eager)}")
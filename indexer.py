@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Indexation incrémentale du dossier docs/.
+
+Chaque document et chaque extrait (chunk) est identifié par l'empreinte SHA-256
+de son contenu. Une mise à jour ne ré-embarque que les extraits nouveaux ou
+modifiés, supprime ceux des documents retirés, puis publie une nouvelle
+génération de l'index :
+
+    query-engine-storage/
+        CURRENT                 # nom de la génération active
+        generations/<gen>/      # docstore, index store, vecteurs, index BM25, routeur FAQ, manifeste
+
+La génération est écrite à côté de l'active puis `CURRENT` est remplacé
+atomiquement : les workers en cours rechargent la nouvelle génération à chaud
+(voir `LazyIndex.reload_if_changed`) sans redémarrage.
+
+Les fichiers sont lus et découpés un par un ; les extraits à embarquer partent
+par lots vers un pool de processus (voir `embedding_pipeline.py`) pendant que la
+lecture continue. Chaque lot embarqué est écrit aussitôt dans la génération en
+cours (vecteurs dans `vectors.npy`, extraits sans embedding dans le docstore) :
+seuls les textes des extraits restent en mémoire, pas leurs embeddings.
+
+Usage :
+    python indexer.py [--docs-dir docs] [--persist-dir query-engine-storage] [--full]
+                      [--workers N] [--batch-size N]
+"""
+
+import os
+import json
+import time
+import shutil
+import fcntl
+import hashlib
+import logging
+import argparse
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from llama_index.core import Settings, SimpleDirectoryReader, StorageContext
+from llama_index.core.data_structs import IndexDict
+from llama_index.core.graph_stores import SimpleGraphStore
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+
+from bm25_index import BM25Index
+from embedding_pipeline import EMBED_BATCH_SIZE, EMBED_WORKERS, EmbeddingPipeline
+from faq_router import FAQRouter, paraphrases_file
+from knowledge_base import (
+    CURRENT_FILE,
+    DOCS_DIR,
+    EMBED_MODEL_NAME,
+    GENERATIONS_DIR,
+    PERSIST_DIR,
+    VECTOR_DTYPE,
+    VECTOR_FORMAT,
+    current_generation,
+    load_embed_model,
+    resolve_store_dir,
+)
+from mmap_vector_store import (
+    JSON_VECTOR_STORE_FILE,
+    MmapVectorStore,
+    VectorWriter,
+    export_to_json_store,
+    has_mmap_vectors,
+)
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "index_manifest.json"
+# Nombre de générations conservées (l'active incluse) pour les workers encore en lecture
+KEEP_GENERATIONS = 2
+
+
+class IndexUpdateReport:
+    """Bilan d'une mise à jour incrémentale."""
+
+    def __init__(self):
+        self.generation: Optional[str] = None
+        self.documents = Counter()
+        self.chunks = Counter()
+        self.duration = 0.0
+        self.embed_duration = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Extraits embarqués par seconde."""
+        return self.chunks['embedded'] / self.embed_duration if self.embed_duration else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"génération {self.generation} en {self.duration:.2f}s - "
+            f"documents : {self.documents['unchanged']} inchangés, {self.documents['changed']} modifiés/ajoutés, "
+            f"{self.documents['removed']} supprimés - "
+            f"extraits : {self.chunks['reused']} réutilisés, {self.chunks['embedded']} embarqués "
+            f"({self.throughput:.1f}/s), {self.chunks['removed']} supprimés"
+        )
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _file_metadata(path: str) -> Dict[str, str]:
+    # Métadonnées indépendantes de la machine : les empreintes restent stables entre déploiements
+    return {"file_name": Path(path).name}
+
+
+@contextmanager
+def _exclusive_lock(persist_dir: Path):
+    persist_dir.mkdir(parents=True, exist_ok=True)
+    with open(persist_dir / ".indexer.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def iter_documents(docs_dir: Path) -> Iterator[Tuple[str, Document]]:
+    """Lit les documents de docs/ un fichier à la fois, dans l'ordre des chemins relatifs."""
+    reader = SimpleDirectoryReader(docs_dir, recursive=True, file_metadata=_file_metadata)
+    for path in sorted(reader.input_files):
+        relative = str(Path(path).relative_to(docs_dir))
+        parts = reader.load_file(path, _file_metadata, reader.file_extractor)
+        # Un fichier peut produire plusieurs documents (pages PDF) : ils sont fusionnés
+        yield relative, Document(
+            text="\n\n".join(part.text for part in parts),
+            metadata=_file_metadata(path),
+            id_=relative,
+        )
+
+
+def _load_previous(store_dir: Optional[Path]) -> tuple:
+    """Manifeste et embeddings (par empreinte d'extrait, lignes de la matrice mappée) de la génération active."""
+    if store_dir is None or not (store_dir / MANIFEST_FILE).exists():
+        return {}, {}
+    with open(store_dir / MANIFEST_FILE, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("embed_model") != EMBED_MODEL_NAME:
+        logger.info("Embedding model changed: full re-indexing")
+        return {}, {}
+
+    if has_mmap_vectors(store_dir):
+        store = MmapVectorStore.from_persist_dir(store_dir)
+        vectors = {node_id: store.matrix[i] for i, node_id in enumerate(store.node_ids)}
+    else:
+        with open(store_dir / JSON_VECTOR_STORE_FILE, encoding='utf-8') as f:
+            vectors = json.load(f)["embedding_dict"]
+
+    # Pas de copie : les lignes mappées ne sont lues qu'à l'écriture de la nouvelle génération
+    embeddings = {
+        chunk_hash: vectors[node_id]
+        for chunk_hash, node_id in manifest.get("chunks", {}).items()
+        if node_id in vectors
+    }
+    return manifest, embeddings
+
+
+class _GenerationWriter:
+    """
+    Nouvelle génération écrite au fil de l'indexation dans un dossier temporaire.
+
+    Les nœuds sont ajoutés par lots dès que leur embedding est connu : le vecteur
+    part dans vectors.npy, le nœud sans embedding dans le docstore (comme le fait
+    VectorStoreIndex). Seul `default__vector_store.json` n'est pas écrit, sauf
+    avec RAG_VECTOR_FORMAT=json.
+    """
+
+    def __init__(self, generations: Path, batch_size: int):
+        generations.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir = Path(tempfile.mkdtemp(dir=generations, prefix=".tmp-"))
+        self.batch_size = max(1, batch_size)
+        self.vectors = VectorWriter(self.tmp_dir, VECTOR_DTYPE)
+        self.storage_context = StorageContext(
+            docstore=SimpleDocumentStore(),
+            index_store=SimpleIndexStore(),
+            vector_stores={},
+            graph_store=SimpleGraphStore(),
+        )
+        self.index_struct = IndexDict()
+        # Extraits réutilisés en attente d'écriture, avec l'embedding de la génération précédente
+        self._reused: List[Tuple[BaseNode, object]] = []
+
+    def add(self, nodes: List[BaseNode]) -> None:
+        """Écrit un lot de nœuds embarqués, puis libère leurs embeddings."""
+        self.vectors.add([node.node_id for node in nodes], [node.embedding for node in nodes])
+        for node in nodes:
+            node.embedding = None
+            self.index_struct.add_node(node, text_id=node.node_id)
+        self.storage_context.docstore.add_documents(nodes, allow_update=True)
+
+    def add_reused(self, node: BaseNode, embedding) -> None:
+        self._reused.append((node, embedding))
+        if len(self._reused) >= self.batch_size:
+            self._flush_reused()
+
+    def _flush_reused(self) -> None:
+        if self._reused:
+            nodes = [node for node, _ in self._reused]
+            self.vectors.add([node.node_id for node in nodes], [embedding for _, embedding in self._reused])
+            self._reused = []
+            for node in nodes:
+                self.index_struct.add_node(node, text_id=node.node_id)
+            self.storage_context.docstore.add_documents(nodes, allow_update=True)
+
+    def finish(self, docs_dir: Path, manifest: dict) -> Path:
+        """Écrit les fichiers restants de la génération (docstore, index BM25, routeur FAQ, manifeste)."""
+        self._flush_reused()
+        self.vectors.close()
+        if VECTOR_FORMAT == "json":
+            export_to_json_store(self.tmp_dir)
+        self.storage_context.index_store.add_index_struct(self.index_struct)
+        self.storage_context.persist(persist_dir=self.tmp_dir)
+        BM25Index.from_nodes(self.storage_context.docstore.docs.values()).save(self.tmp_dir)
+        FAQRouter.build(docs_dir, load_embed_model()).save(self.tmp_dir)
+        with open(self.tmp_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        return self.tmp_dir
+
+    def discard(self) -> None:
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+def _publish(persist_dir: Path, tmp_dir: Path, manifest: dict) -> str:
+    """Renomme la génération écrite dans tmp_dir puis bascule CURRENT atomiquement."""
+    generations = persist_dir / GENERATIONS_DIR
+    generation = time.strftime("%Y%m%d-%H%M%S") + f"-{manifest['hash'][:8]}"
+    os.replace(tmp_dir, generations / generation)
+
+    fd, tmp_current = tempfile.mkstemp(dir=persist_dir, prefix=".CURRENT.")
+    with os.fdopen(fd, 'w') as f:
+        f.write(generation)
+    os.replace(tmp_current, persist_dir / CURRENT_FILE)
+
+    # Nettoyage des anciennes générations
+    existing = sorted(p for p in generations.iterdir() if not p.name.startswith('.'))
+    for old in existing[:-KEEP_GENERATIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    return generation
+
+
+def update_index(
+    docs_dir: Path = DOCS_DIR,
+    persist_dir: Path = PERSIST_DIR,
+    full: bool = False,
+    workers: int = EMBED_WORKERS,
+    batch_size: int = EMBED_BATCH_SIZE
+) -> IndexUpdateReport:
+    """
+    Met à jour l'index de façon incrémentale et publie une nouvelle génération.
+
+    Args:
+        docs_dir: Dossier des documents sources
+        persist_dir: Dossier de persistance de l'index
+        full: Ignore la génération active et ré-embarque tout
+        workers: Nombre de processus d'embedding
+        batch_size: Nombre d'extraits par lot d'embedding
+
+    Returns:
+        IndexUpdateReport (generation=None si rien n'a changé)
+    """
+    started = time.perf_counter()
+    report = IndexUpdateReport()
+    docs_dir, persist_dir = Path(docs_dir), Path(persist_dir)
+    splitter = Settings.node_parser
+
+    with _exclusive_lock(persist_dir):
+        active_dir = resolve_store_dir(persist_dir) if current_generation(persist_dir) else None
+        previous, embeddings = ({}, {}) if full else _load_previous(active_dir)
+        previous_docs = previous.get("documents", {})
+
+        chunk_manifest: Dict[str, str] = {}
+        doc_manifest: Dict[str, str] = {}
+        writer = _GenerationWriter(persist_dir / GENERATIONS_DIR, batch_size)
+
+        try:
+            # Les extraits à embarquer partent par lots pendant la lecture des fichiers suivants
+            with EmbeddingPipeline(workers=workers, batch_size=batch_size, on_embedded=writer.add) as pipeline:
+                for relative, document in iter_documents(docs_dir):
+                    doc_hash = _sha256(document.text)
+                    doc_manifest[relative] = doc_hash
+                    report.documents['unchanged' if previous_docs.get(relative) == doc_hash else 'changed'] += 1
+
+                    occurrences = Counter()
+                    for node in splitter.get_nodes_from_documents([document]):
+                        chunk_hash = _sha256(node.get_content(metadata_mode=MetadataMode.EMBED))
+                        occurrences[chunk_hash] += 1
+                        # Identifiant stable : même extrait au même endroit -> même nœud
+                        node.id_ = _sha256(f"{relative}:{chunk_hash}:{occurrences[chunk_hash]}")[:32]
+                        embedding = embeddings.get(chunk_hash)
+                        if embedding is None:
+                            pipeline.submit(node)
+                            report.chunks['embedded'] += 1
+                        else:
+                            writer.add_reused(node, embedding)
+                            report.chunks['reused'] += 1
+                        chunk_manifest.setdefault(chunk_hash, node.node_id)
+            report.embed_duration = pipeline.elapsed
+        except BaseException:
+            writer.discard()
+            raise
+
+        report.documents['removed'] = len(set(previous_docs) - set(doc_manifest))
+        report.chunks['removed'] = len(set(previous.get("chunks", {})) - set(chunk_manifest))
+
+        # Les questions types du routeur FAQ (celles de cette base documentaire) font partie de la génération
+        faq_file = paraphrases_file(docs_dir)
+        faq_hash = _sha256(faq_file.read_text(encoding='utf-8')) if faq_file.exists() else None
+        manifest = {
+            "embed_model": EMBED_MODEL_NAME,
+            "documents": doc_manifest,
+            "chunks": chunk_manifest,
+            "faq_paraphrases": faq_hash,
+        }
+        manifest["hash"] = _sha256(json.dumps([doc_manifest, sorted(chunk_manifest), faq_hash], sort_keys=True))
+        if active_dir is not None and previous.get("hash") == manifest["hash"]:
+            writer.discard()
+            logger.info("Index already up to date")
+            report.duration = time.perf_counter() - started
+            return report
+
+        try:
+            tmp_dir = writer.finish(docs_dir, manifest)
+        except BaseException:
+            writer.discard()
+            raise
+        report.generation = _publish(persist_dir, tmp_dir, manifest)
+
+    report.duration = time.perf_counter() - started
+    logger.info(f"Index updated: {report}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs-dir', type=Path, default=DOCS_DIR)
+    parser.add_argument('--persist-dir', type=Path, default=PERSIST_DIR)
+    parser.add_argument('--full', action='store_true', help="Ré-embarque tous les extraits")
+    parser.add_argument('--workers', type=int, default=EMBED_WORKERS, help="Processus d'embedding")
+    parser.add_argument('--batch-size', type=int, default=EMBED_BATCH_SIZE, help="Extraits par lot")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = update_index(
+        args.docs_dir, args.persist_dir, full=args.full, workers=args.workers, batch_size=args.batch_size
+    )
+    if report.generation:
+        print(f"✅ Index publié : {report}")
+    else:
+        print("✅ Index déjà à jour, aucune nouvelle génération publiée.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Base de connaissances RAG (LlamaIndex) construite à partir du dossier docs/.
+
+Le modèle d'embedding et l'index sont des ressources de processus : ils sont
+chargés au prewarm du worker (ou au premier appel de `query_info`), jamais à
+l'import du module. LlamaIndex lui-même n'est importé qu'à ce moment : le
+processus principal du worker n'en a pas besoin.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, List, Optional
+
+from model_bundle import model_spec
+
+if TYPE_CHECKING:
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.base.base_retriever import BaseRetriever
+    from llama_index.core.base.embeddings.base import BaseEmbedding
+    from llama_index.core.schema import NodeWithScore
+
+    from bm25_index import BM25Index
+    from faq_router import FAQRouter
+
+logger = logging.getLogger(__name__)
+
+THIS_DIR = Path(__file__).parent
+DOCS_DIR = THIS_DIR / "docs"
+PERSIST_DIR = THIS_DIR / "query-engine-storage"
+# Fichier désignant la génération active de l'index (écrit par indexer.py)
+CURRENT_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+
+# Modèle utilisé à la fois pour construire l'index et pour les requêtes (déclaré dans model_manifest.json)
+EMBED_MODEL_NAME = model_spec("embedding")["repo_id"]
+# Exécution du modèle : "torch" (HuggingFace fp32) ou "onnx" (ONNX Runtime int8, sans PyTorch)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+
+# Format des vecteurs chargés : "mmap" (matrice NumPy partagée entre processus) ou "json"
+VECTOR_FORMAT = os.getenv("RAG_VECTOR_FORMAT", "mmap")
+# Précision de la matrice exportée : "float32" ou "float16"
+VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+
+# Mode de query_info : "synthesis" (LLM de synthèse LlamaIndex) ou "retrieval" (extraits bruts)
+RAG_MODE = os.getenv("RAG_MODE", "synthesis")
+# Nombre d'extraits récupérés et budget de tokens renvoyé au LLM de session en mode "retrieval"
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "800"))
+# Recherche : "hybrid" (index lexical BM25 + vecteurs, voir bm25_index.py) ou "vector"
+RAG_RETRIEVER = os.getenv("RAG_RETRIEVER", "hybrid")
+# Poids de la similarité vectorielle dans la fusion hybride (0 = BM25 seul, 1 = vecteurs seuls)
+RAG_HYBRID_ALPHA = float(os.getenv("RAG_HYBRID_ALPHA", "0.5"))
+# Intervalle (secondes) de vérification d'une nouvelle génération publiée par indexer.py
+RAG_RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", "30"))
+
+_embed_model: Optional["BaseEmbedding"] = None
+_embed_lock = threading.Lock()
+
+
+def create_embed_model(backend: str = EMBED_BACKEND) -> "BaseEmbedding":
+    """Instancie le modèle d'embedding avec le backend demandé."""
+    # Imports différés : le backend ONNX ne doit pas charger PyTorch
+    if backend == "onnx":
+        from onnx_embedding import OnnxEmbedding
+        return OnnxEmbedding.from_pretrained(EMBED_MODEL_NAME)
+    if backend == "torch":
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        return HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def load_embed_model() -> "BaseEmbedding":
+    """Charge le modèle d'embedding une fois par processus et l'enregistre dans Settings."""
+    global _embed_model
+    from llama_index.core import Settings
+
+    with _embed_lock:
+        if _embed_model is None:
+            started = time.perf_counter()
+            _embed_model = create_embed_model()
+            Settings.embed_model = _embed_model
+            logger.info(
+                f"Embedding model {EMBED_MODEL_NAME} ({EMBED_BACKEND}) loaded in {time.perf_counter() - started:.2f}s"
+            )
+    return _embed_model
+
+
+def current_generation(persist_dir: Path = PERSIST_DIR) -> Optional[str]:
+    """Nom de la génération active publiée par indexer.py, None pour un store à plat."""
+    try:
+        return (Path(persist_dir) / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def generation_dir(persist_dir: Path, generation: Optional[str]) -> Path:
+    """Dossier des fichiers d'une génération (persist_dir lui-même pour un store à plat)."""
+    if generation is None:
+        return Path(persist_dir)
+    return Path(persist_dir) / GENERATIONS_DIR / generation
+
+
+def resolve_store_dir(persist_dir: Path = PERSIST_DIR) -> Path:
+    """Dossier contenant les fichiers de l'index actif."""
+    return generation_dir(persist_dir, current_generation(persist_dir))
+
+
+def ensure_generation(persist_dir: Path = PERSIST_DIR, docs_dir: Path = DOCS_DIR) -> Optional[str]:
+    """Génération active, construite depuis docs/ au premier lancement."""
+    generation = current_generation(persist_dir)
+    if generation is None:
+        # Premier lancement, ou store à plat historique (construit sans le modèle
+        # d'embedding courant) : indexe tous les fichiers du dossier docs
+        from indexer import update_index
+        update_index(docs_dir, persist_dir)
+        generation = current_generation(persist_dir)
+    return generation
+
+
+def load_index(
+    persist_dir: Path = PERSIST_DIR,
+    docs_dir: Path = DOCS_DIR,
+    store_dir: Optional[Path] = None
+) -> "VectorStoreIndex":
+    """
+    Charge l'index persisté, ou le construit depuis docs/ au premier lancement.
+
+    Args:
+        persist_dir: Dossier de persistance de l'index
+        docs_dir: Dossier des documents à indexer
+        store_dir: Dossier de la génération à charger (défaut : génération active)
+
+    Returns:
+        VectorStoreIndex prêt à être interrogé
+    """
+    from llama_index.core import StorageContext, load_index_from_storage
+
+    from mmap_vector_store import MmapVectorStore, export_from_json_store, has_mmap_vectors
+
+    embed_model = load_embed_model()
+    started = time.perf_counter()
+
+    if store_dir is None:
+        store_dir = generation_dir(persist_dir, ensure_generation(persist_dir, docs_dir))
+    if VECTOR_FORMAT == "mmap":
+        if not has_mmap_vectors(store_dir):
+            # Conversion unique du vector store JSON historique
+            export_from_json_store(store_dir, VECTOR_DTYPE)
+        storage_context = StorageContext.from_defaults(
+            persist_dir=store_dir,
+            vector_store=MmapVectorStore.from_persist_dir(store_dir),
+        )
+    else:
+        storage_context = StorageContext.from_defaults(persist_dir=store_dir)
+    index = load_index_from_storage(storage_context, embed_model=embed_model)
+    logger.info(f"RAG index loaded from {store_dir.name} in {time.perf_counter() - started:.2f}s")
+    return index
+
+
+def load_lexical_index(store_dir: Path, docstore) -> "BM25Index":
+    """
+    Charge l'index BM25 d'une génération, ou le construit en mémoire depuis le
+    docstore (génération publiée avant l'index lexical). Une génération publiée
+    n'est jamais modifiée : relancer indexer.py pour persister l'index BM25.
+    """
+    from bm25_index import BM25Index, has_bm25_index
+
+    if has_bm25_index(store_dir):
+        lexical = BM25Index.load(store_dir)
+        # Index lexical désaccordé avec le docstore chargé : reconstruit
+        if all(node_id in docstore.docs for node_id in lexical.node_ids):
+            return lexical
+    logger.info(f"No usable BM25 index in {store_dir}: built in memory, run indexer.py to persist it")
+    return BM25Index.from_nodes(docstore.docs.values())
+
+
+def load_faq_router(store_dir: Path, docs_dir: Path = DOCS_DIR) -> Optional["FAQRouter"]:
+    """Routeur FAQ publié par indexer.py avec la génération, None s'il est désactivé ou absent."""
+    from faq_router import FAQ_ROUTER_ENABLED, FAQRouter, has_faq_router, has_paraphrases
+
+    if not FAQ_ROUTER_ENABLED:
+        return None
+    # Sans questions types propres à cette base (ex: cabinet sans faq_paraphrases.json), pas de routage,
+    # même si une génération plus ancienne a été construite avec celles d'une autre base
+    if not has_paraphrases(docs_dir):
+        logger.info(f"No FAQ paraphrases for {docs_dir}: FAQ router disabled")
+        return None
+    if not has_faq_router(store_dir):
+        logger.info(f"No FAQ router in {store_dir}: run indexer.py to build it")
+        return None
+    return FAQRouter.load(store_dir)
+
+
+def create_retriever(index: "VectorStoreIndex", lexical: Optional["BM25Index"], top_k: int = RAG_TOP_K) -> "BaseRetriever":
+    """Retriever de query_info : hybride si l'index lexical est chargé, sinon vectoriel."""
+    vector_retriever = index.as_retriever(similarity_top_k=top_k)
+    if lexical is None:
+        return vector_retriever
+    from bm25_index import HybridRetriever
+    return HybridRetriever(vector_retriever, lexical, index.docstore, top_k, RAG_HYBRID_ALPHA)
+
+
+def format_retrieved_chunks(nodes: List["NodeWithScore"], token_budget: int = RAG_TOKEN_BUDGET) -> str:
+    """
+    Met en forme les extraits récupérés pour le LLM de session.
+
+    Les extraits sont dédupliqués (même nœud ou même texte), gardés par score
+    décroissant et tronqués pour respecter le budget de tokens.
+
+    Args:
+        nodes: Résultats du retriever
+        token_budget: Nombre maximum de tokens renvoyés
+
+    Returns:
+        Extraits précédés de leur score de pertinence, un par paragraphe
+    """
+    from llama_index.core.utils import get_tokenizer
+
+    tokenizer = get_tokenizer()
+    seen = set()
+    chunks: List[str] = []
+    remaining = token_budget
+
+    for result in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+        text = result.node.get_content().strip()
+        key = " ".join(text.lower().split())
+        if not text or result.node.node_id in seen or key in seen:
+            continue
+        seen.update((result.node.node_id, key))
+
+        header = f"[pertinence {result.score or 0.0:.2f}] "
+        tokens = tokenizer(header + text)
+        if len(tokens) > remaining:
+            if remaining < 20:
+                break
+            # Dernier extrait tronqué pour tenir dans le budget
+            while len(tokens) > remaining:
+                text = text[:len(text) * remaining // (len(tokens) + 1)].rsplit(" ", 1)[0] + "…"
+                tokens = tokenizer(header + text)
+        chunks.append(header + text)
+        # Le séparateur entre extraits compte aussi
+        remaining -= len(tokens) + 1
+        if remaining <= 0:
+            break
+
+    return "\n\n".join(chunks) if chunks else "Aucune information trouvée dans la base documentaire."
+
+
+class LoadedIndex:
+    """Index d'une génération et ses compagnons (BM25, routeur FAQ), chargés ensemble."""
+
+    def __init__(
+        self,
+        index: "VectorStoreIndex",
+        generation: Optional[str],
+        lexical: Optional["BM25Index"] = None,
+        faq_router: Optional["FAQRouter"] = None
+    ):
+        self.index = index
+        self.generation = generation
+        self.lexical = lexical
+        self.faq_router = faq_router
+
+
+class LazyIndex:
+    """
+    Index chargé au prewarm, ou à défaut lors de la première requête.
+
+    Lorsqu'indexer.py publie une nouvelle génération, elle est rechargée à chaud
+    (vérification au plus toutes les RAG_RELOAD_INTERVAL secondes). L'index, le
+    BM25 et le routeur FAQ sont remplacés ensemble : `asnapshot()` renvoie
+    toujours trois objets de la même génération.
+    """
+
+    def __init__(
+        self,
+        persist_dir: Path = PERSIST_DIR,
+        docs_dir: Path = DOCS_DIR,
+        reload_interval: float = RAG_RELOAD_INTERVAL
+    ):
+        self.persist_dir = persist_dir
+        self.docs_dir = docs_dir
+        self.reload_interval = reload_interval
+        self._loaded: Optional[LoadedIndex] = None
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._reload_listeners: List[Callable[[], None]] = []
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded is not None
+
+    @property
+    def generation(self) -> Optional[str]:
+        return self._loaded.generation if self._loaded else None
+
+    @property
+    def lexical(self) -> Optional["BM25Index"]:
+        """Index BM25 de la génération chargée (RAG_RETRIEVER="hybrid")."""
+        return self._loaded.lexical if self._loaded else None
+
+    @property
+    def faq_router(self) -> Optional["FAQRouter"]:
+        """Routeur des questions fréquentes de la génération chargée (FAQ_ROUTER=1, voir faq_router.py)."""
+        return self._loaded.faq_router if self._loaded else None
+
+    def add_reload_listener(self, listener: Callable[[], None]) -> None:
+        """Enregistre un rappel exécuté après chaque rechargement (ex: vider un cache)."""
+        self._reload_listeners.append(listener)
+
+    def _load(self) -> None:
+        # Génération lue une seule fois : index, BM25 et routeur FAQ viennent du même dossier
+        generation = ensure_generation(self.persist_dir, self.docs_dir)
+        store_dir = generation_dir(self.persist_dir, generation)
+        index = load_index(self.persist_dir, self.docs_dir, store_dir)
+        lexical = load_lexical_index(store_dir, index.docstore) if RAG_RETRIEVER == "hybrid" else None
+        # Publication en une seule affectation : un lecteur ne voit jamais deux générations mêlées
+        self._loaded = LoadedIndex(index, generation, lexical, load_faq_router(store_dir, self.docs_dir))
+
+    def snapshot(self) -> LoadedIndex:
+        """Renvoie l'index et ses compagnons, en les chargeant si nécessaire (bloquant)."""
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self._load()
+        return self._loaded
+
+    async def asnapshot(self) -> LoadedIndex:
+        """Comme snapshot(), sans bloquer la boucle d'événements, après contrôle d'une nouvelle génération."""
+        if self._loaded is None:
+            return await asyncio.to_thread(self.snapshot)
+        await self.reload_if_changed()
+        return self._loaded
+
+    def get(self) -> "VectorStoreIndex":
+        """Renvoie l'index, en le chargeant si nécessaire (bloquant)."""
+        return self.snapshot().index
+
+    async def aget(self) -> "VectorStoreIndex":
+        """Renvoie l'index sans bloquer la boucle d'événements lors du premier chargement."""
+        return (await self.asnapshot()).index
+
+    async def reload_if_changed(self) -> bool:
+        """Recharge l'index si une nouvelle génération a été publiée. True si rechargé."""
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return False
+        self._checked_at = time.monotonic()
+        generation = current_generation(self.persist_dir)
+        if generation is None or generation == self.generation:
+            return False
+
+        def reload() -> None:
+            with self._lock:
+                if current_generation(self.persist_dir) != self.generation:
+                    self._load()
+
+        previous = self.generation
+        await asyncio.to_thread(reload)
+        logger.info(f"RAG index hot-reloaded: generation {previous} -> {self.generation}")
+        for listener in self._reload_listeners:
+            listener()
+        return True
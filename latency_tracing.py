@@ -0,0 +1,416 @@
+"""
+Traçage de la latence de chaque tour de parole de l'agent vocal.
+
+Pour chaque tour (du moment où l'appelant se tait jusqu'au premier son de la
+réponse), `TurnTracer` relève à partir des événements de l'AgentSession :
+
+- transcript : fin de parole -> transcription finale (STT)
+- turn_detection : fin de parole -> décision de fin de tour (VAD + détecteur de tour)
+- turn_hook : exécution de `Agent.on_user_turn_completed`
+- llm_ttft : temps jusqu'au premier token du LLM (première génération du tour)
+- tool:<nom> : durée de chaque outil appelé (`traced_tool`)
+- calendar:<opération> : durée de chaque requête HTTP à l'API Google Calendar
+  ("events.patch", "freebusy.query", "batch"...) ; le nombre de mesures est le
+  nombre de requêtes
+- tts_ttfb : temps jusqu'au premier paquet audio de la synthèse vocale
+- response : fin de parole -> début de la réponse parlée (latence perçue)
+- speculation_saved:<type> : temps gagné par un résultat spéculatif réutilisé
+
+Les issues des exécutions spéculatives (speculation.py) sont comptées à part :
+réutilisées (hit), absentes ou inutilisables (miss), annulées, gaspillées.
+
+Chaque tour terminé est ajouté en JSON à `<LATENCY_TRACE_DIR>/turns.jsonl`, et
+les quantiles p50/p95/p99 des dernières mesures du processus sont réécrits au
+format texte Prometheus dans `<LATENCY_TRACE_DIR>/latency-<pid>.prom` (lisible
+par le textfile collector de node_exporter).
+
+Conformément au RGPD, seules des durées et des noms d'outils sont enregistrés :
+ni transcription, ni argument d'outil.
+
+Usage (agrégation d'un fichier de traces) :
+    python latency_tracing.py [traces/turns.jsonl]
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import functools
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+THIS_DIR = Path(__file__).parent
+
+# Dossier des traces de latence ("" = traçage désactivé)
+LATENCY_TRACE_DIR = os.getenv("LATENCY_TRACE_DIR", str(THIS_DIR / "traces"))
+# Nombre de mesures conservées par étape pour le calcul des quantiles
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "1000"))
+# Fréquence (en tours) de réécriture du fichier Prometheus
+LATENCY_EXPORT_EVERY = int(os.getenv("LATENCY_EXPORT_EVERY", "10"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Ordre d'affichage des étapes ; les outils ("tool:<nom>") suivent
+STAGES = ("transcript", "turn_detection", "turn_hook", "llm_ttft", "tts_ttfb", "response")
+TRACE_FILE = "turns.jsonl"
+METRIC_NAME = "voice_agent_latency_seconds"
+SPECULATION_METRIC = "voice_agent_speculation_total"
+# Étapes détaillées ("préfixe:nom") : label Prometheus portant le nom
+_DETAIL_LABELS = {"tool": "tool", "calendar": "operation", "speculation_saved": "kind"}
+
+# Traceur de la session en cours : les outils s'exécutent dans des tâches créées
+# par la session, qui héritent de ce contexte
+_current_tracer: ContextVar[Optional["TurnTracer"]] = ContextVar("latency_tracer", default=None)
+
+
+def quantile(sorted_values: Sequence[float], q: float) -> float:
+    """Quantile par interpolation linéaire d'une liste triée non vide."""
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _stage_order(stage: str):
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+
+class LatencyStats:
+    """Dernières mesures (secondes) par étape et quantiles p50/p95/p99 ; partagé par les sessions du processus."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._sums: Dict[str, float] = {}
+        # (type, issue) -> nombre d'exécutions spéculatives
+        self.speculation: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+            self._sums[stage] = self._sums.get(stage, 0.0) + seconds
+
+    def count_speculation(self, kind: str, outcome: str) -> None:
+        with self._lock:
+            self.speculation[(kind, outcome)] = self.speculation.get((kind, outcome), 0) + 1
+
+    def add_turn(self, turn: Dict[str, Any]) -> None:
+        """Ajoute les durées d'un tour tel qu'enregistré dans le JSONL."""
+        for stage in STAGES:
+            if turn.get(stage) is not None:
+                self.add(stage, turn[stage])
+        for tool in turn.get("tools", []):
+            self.add(f"tool:{tool['name']}", tool["duration"])
+        for request in turn.get("calendar", []):
+            self.add(f"calendar:{request['operation']}", request["duration"])
+        for speculation in turn.get("speculation", []):
+            self.count_speculation(speculation["kind"], speculation["outcome"])
+            if speculation.get("saved") is not None:
+                self.add(f"speculation_saved:{speculation['kind']}", speculation["saved"])
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """{étape: {"count", "sum", "p50", "p95", "p99"}} trié dans l'ordre des étapes."""
+        with self._lock:
+            snapshot = {stage: sorted(values) for stage, values in self._samples.items() if values}
+            counts, sums = dict(self._counts), dict(self._sums)
+        result = {}
+        for stage in sorted(snapshot, key=_stage_order):
+            values = snapshot[stage]
+            result[stage] = {"count": counts[stage], "sum": sums[stage]}
+            for q in QUANTILES:
+                result[stage][f"p{int(q * 100)}"] = quantile(values, q)
+        return result
+
+    def to_prometheus(self, labels: Optional[Dict[str, str]] = None) -> str:
+        """Export au format texte Prometheus (summary, quantiles sur la fenêtre glissante)."""
+        base = "".join(f',{key}="{value}"' for key, value in (labels or {}).items())
+        lines = [
+            f"# HELP {METRIC_NAME} Latence par étape d'un tour de parole de l'agent vocal",
+            f"# TYPE {METRIC_NAME} summary",
+        ]
+        for stage, stats in self.summary().items():
+            prefix, _, name = stage.partition(":")
+            if name and prefix in _DETAIL_LABELS:
+                stage_labels = f'stage="{prefix}",{_DETAIL_LABELS[prefix]}="{name}"{base}'
+            else:
+                stage_labels = f'stage="{stage}"{base}'
+            for q in QUANTILES:
+                lines.append(f'{METRIC_NAME}{{{stage_labels},quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f"{METRIC_NAME}_sum{{{stage_labels}}} {stats['sum']:.6f}")
+            lines.append(f"{METRIC_NAME}_count{{{stage_labels}}} {stats['count']}")
+        with self._lock:
+            speculation = sorted(self.speculation.items())
+        if speculation:
+            lines.append(f"# HELP {SPECULATION_METRIC} Exécutions spéculatives d'outils par issue")
+            lines.append(f"# TYPE {SPECULATION_METRIC} counter")
+            for (kind, outcome), count in speculation:
+                lines.append(f'{SPECULATION_METRIC}{{kind="{kind}",outcome="{outcome}"{base}}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def format_table(self) -> str:
+        rows = [f"   {'étape':28} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for stage, stats in self.summary().items():
+            rows.append(
+                f"   {stage:28} {stats['count']:6d} "
+                + " ".join(f"{stats[f'p{int(q * 100)}'] * 1000:6.0f}ms" for q in QUANTILES)
+            )
+        with self._lock:
+            speculation = sorted(self.speculation.items())
+        if speculation:
+            rows.append("   spéculation : " + ", ".join(f"{kind} {outcome} {count}" for (kind, outcome), count in speculation))
+        return "\n".join(rows)
+
+
+class LatencySink:
+    """Écrit les tours terminés en JSONL et l'agrégat du processus au format Prometheus."""
+
+    def __init__(self, trace_dir: Optional[str] = LATENCY_TRACE_DIR, export_every: int = LATENCY_EXPORT_EVERY):
+        self.trace_dir = Path(trace_dir) if trace_dir else None
+        self.export_every = max(1, export_every)
+        self.stats = LatencyStats()
+        self._lock = threading.Lock()
+        self._pending_exports = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.trace_dir is not None
+
+    @property
+    def prometheus_path(self) -> Optional[Path]:
+        return self.trace_dir / f"latency-{os.getpid()}.prom" if self.trace_dir else None
+
+    def record(self, turn: Dict[str, Any]) -> None:
+        self.stats.add_turn(turn)
+        if not self.enabled:
+            return
+        line = json.dumps(turn, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                self.trace_dir.mkdir(parents=True, exist_ok=True)
+                # Une seule écriture en mode ajout par ligne : les processus du worker partagent le fichier
+                with open(self.trace_dir / TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                logger.warning(f"Could not write latency trace: {e}")
+                return
+            self._pending_exports += 1
+            if self._pending_exports >= self.export_every:
+                self._export_locked()
+
+    def flush(self) -> None:
+        """Réécrit le fichier Prometheus (fin de session)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._export_locked()
+
+    def _export_locked(self) -> None:
+        self._pending_exports = 0
+        path = self.prometheus_path
+        tmp_path = path.with_suffix(".prom.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(self.stats.to_prometheus({"pid": str(os.getpid())}), encoding="utf-8")
+            # Remplacement atomique : le collecteur ne lit jamais un fichier à moitié écrit
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not export latency metrics: {e}")
+
+
+_default_sink: Optional[LatencySink] = None
+
+
+def get_latency_sink() -> LatencySink:
+    """Sink partagé par toutes les sessions du processus."""
+    global _default_sink
+    if _default_sink is None:
+        _default_sink = LatencySink()
+    return _default_sink
+
+
+class TurnTracer:
+    """
+    Regroupe par tour de parole les métriques émises par une AgentSession.
+
+    Un tour commence à la décision de fin de tour de l'utilisateur (EOUMetrics)
+    et se termine au tour suivant ou à la fermeture de la session. Les métriques
+    LLM/TTS de la réponse (y compris celles qui suivent un appel d'outil) sont
+    rattachées au tour en cours.
+    """
+
+    def __init__(self, session_id: str, sink: Optional[LatencySink] = None):
+        self.session_id = session_id
+        self.sink = sink or get_latency_sink()
+        self._turn: Optional[Dict[str, Any]] = None
+        self._turn_count = 0
+        self._speech_ended_at: Optional[float] = None
+
+    def attach(self, session) -> None:
+        """Abonne le traceur aux événements de la session et l'active pour les outils."""
+        from livekit.agents.metrics import EOUMetrics, LLMMetrics, TTSMetrics
+
+        _current_tracer.set(self)
+
+        @session.on("metrics_collected")
+        def _on_metrics(ev) -> None:
+            metrics = ev.metrics
+            if isinstance(metrics, EOUMetrics):
+                self._start_turn(metrics)
+            elif isinstance(metrics, LLMMetrics):
+                self._on_llm(metrics.ttft)
+            elif isinstance(metrics, TTSMetrics):
+                self._on_tts(metrics.ttfb)
+
+        @session.on("user_state_changed")
+        def _on_user_state(ev) -> None:
+            if ev.old_state == "speaking" and ev.new_state == "listening":
+                self._speech_ended_at = ev.created_at
+
+        @session.on("agent_state_changed")
+        def _on_agent_state(ev) -> None:
+            if ev.new_state == "speaking":
+                self._on_speaking(ev.created_at)
+
+        @session.on("close")
+        def _on_close(ev) -> None:
+            self.close()
+
+    def _start_turn(self, metrics) -> None:
+        self._finish_turn()
+        self._turn_count += 1
+        self._turn = {
+            "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            "session": self.session_id,
+            "turn": self._turn_count,
+            "transcript": metrics.transcription_delay,
+            "turn_detection": metrics.end_of_utterance_delay,
+            "turn_hook": metrics.on_user_turn_completed_delay,
+            "llm_ttft": None,
+            "llm_calls": 0,
+            "tools": [],
+            "calendar": [],
+            "speculation": [],
+            "tts_ttfb": None,
+            "response": None,
+        }
+
+    def _on_llm(self, ttft: float) -> None:
+        if self._turn is None:
+            return
+        self._turn["llm_calls"] += 1
+        # ttft vaut -1 pour une génération annulée avant le premier token
+        if self._turn["llm_ttft"] is None and ttft >= 0:
+            self._turn["llm_ttft"] = ttft
+
+    def _on_tts(self, ttfb: float) -> None:
+        if self._turn is not None and self._turn["tts_ttfb"] is None and ttfb >= 0:
+            self._turn["tts_ttfb"] = ttfb
+
+    def _on_speaking(self, started_at: float) -> None:
+        if self._turn is None or self._turn["response"] is not None or self._speech_ended_at is None:
+            return
+        self._turn["response"] = max(0.0, started_at - self._speech_ended_at)
+
+    def record_tool(self, name: str, duration: float, ok: bool = True) -> None:
+        if self._turn is None:
+            # Outil appelé hors tour utilisateur (ex: à l'accueil) : agrégé seulement
+            self.sink.stats.add(f"tool:{name}", duration)
+            return
+        self._turn["tools"].append({"name": name, "duration": duration, "ok": ok})
+
+    def record_calendar(self, operation: str, duration: float) -> None:
+        if self._turn is None:
+            self.sink.stats.add(f"calendar:{operation}", duration)
+            return
+        self._turn["calendar"].append({"operation": operation, "duration": duration})
+
+    def record_speculation(self, kind: str, outcome: str, saved: Optional[float] = None) -> None:
+        """
+        Issue d'une exécution spéculative. Les réutilisations et échecs (hit/miss)
+        sont rattachés au tour en cours ; les annulations et le travail gaspillé,
+        survenus pendant que l'appelant parle encore, sont seulement comptés.
+        """
+        if self._turn is None or outcome not in ("hit", "miss"):
+            self.sink.stats.count_speculation(kind, outcome)
+            return
+        self._turn["speculation"].append({"kind": kind, "outcome": outcome, "saved": saved})
+
+    def _finish_turn(self) -> None:
+        if self._turn is not None:
+            self.sink.record(self._turn)
+            self._turn = None
+
+    def close(self) -> None:
+        self._finish_turn()
+        self.sink.flush()
+        if self._turn_count:
+            logger.info(f"Latency summary after {self._turn_count} turns:\n{self.sink.stats.format_table()}")
+
+
+def traced_tool(func):
+    """
+    Mesure la durée d'un outil et l'attribue au tour en cours.
+
+    À placer sous `@function_tool` : la signature et la docstring sont conservées.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            result = await func(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            tracer = _current_tracer.get()
+            if tracer is not None:
+                tracer.record_tool(func.__name__, time.perf_counter() - started, ok)
+    return wrapper
+
+
+def record_calendar_request(operation: str, duration: float) -> None:
+    """Durée d'une requête à l'API Calendar : rattachée au tour en cours, sinon à l'agrégat du processus."""
+    tracer = _current_tracer.get()
+    if tracer is not None:
+        tracer.record_calendar(operation, duration)
+    else:
+        get_latency_sink().stats.add(f"calendar:{operation}", duration)
+
+
+def load_turns(path: Path) -> Iterable[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_file", nargs="?", default=str(Path(LATENCY_TRACE_DIR or THIS_DIR / "traces") / TRACE_FILE))
+    parser.add_argument("--prometheus", action="store_true", help="Affiche l'agrégat au format Prometheus")
+    args = parser.parse_args(argv)
+
+    stats = LatencyStats(window=10**9)
+    turns = 0
+    for turn in load_turns(Path(args.trace_file)):
+        stats.add_turn(turn)
+        turns += 1
+
+    if args.prometheus:
+        print(stats.to_prometheus(), end="")
+        return
+    print(f"📊 {turns} tours dans {args.trace_file}")
+    print(stats.format_table())
+
+
+if __name__ == "__main__":
+    main()
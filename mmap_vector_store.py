@@ -0,0 +1,232 @@
+"""
+Vector store en lecture seule adossé à une matrice NumPy mappée en mémoire.
+
+Les embeddings de `query-engine-storage` sont écrits par indexer.py dans une
+matrice contiguë (float32 ou float16, lignes normalisées) ouverte avec
+`mmap_mode='r'` : tous les processus du worker partagent alors les mêmes pages
+physiques au lieu de désérialiser chacun leur copie de
+`default__vector_store.json`, qui n'est plus écrit qu'avec RAG_VECTOR_FORMAT=json.
+La recherche top-k est un produit matrice-vecteur unique.
+
+Usage (conversion manuelle) :
+    python mmap_vector_store.py [--dtype float16] [--persist-dir query-engine-storage]
+"""
+
+import json
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.npy"
+IDS_FILE = "vector_ids.json"
+JSON_VECTOR_STORE_FILE = "default__vector_store.json"
+
+# Nombre de lignes converties en float32 à la fois pour une matrice float16
+_BLOCK_ROWS = 16384
+
+
+def has_mmap_vectors(persist_dir: Path) -> bool:
+    return (Path(persist_dir) / VECTORS_FILE).exists() and (Path(persist_dir) / IDS_FILE).exists()
+
+
+class VectorWriter:
+    """
+    Écriture de la matrice par lots, dans l'ordre d'arrivée des embeddings.
+
+    Les lignes normalisées sont ajoutées à un fichier temporaire du dossier : la
+    mémoire reste bornée au lot courant quel que soit le nombre de vecteurs.
+    `close()` écrit vectors.npy (copie par blocs) et vector_ids.json.
+
+    Args:
+        persist_dir: Dossier de persistance de l'index
+        dtype: "float32" ou "float16"
+    """
+
+    def __init__(self, persist_dir: Path, dtype: str = "float32"):
+        self.persist_dir = Path(persist_dir)
+        self.dtype = np.dtype(dtype)
+        self.node_ids: List[str] = []
+        self._dim = 0
+        self._rows = tempfile.TemporaryFile(dir=self.persist_dir, prefix=".vectors.")
+
+    def add(self, node_ids: List[str], embeddings: Any) -> None:
+        """Ajoute les vecteurs d'un lot (lignes de `embeddings` dans l'ordre de `node_ids`)."""
+        if not node_ids:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(node_ids), -1)
+        if self._dim and matrix.shape[1] != self._dim:
+            raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match {self._dim}")
+        self._dim = matrix.shape[1]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._rows.write((matrix / np.where(norms == 0, 1, norms)).astype(self.dtype).tobytes())
+        self.node_ids.extend(node_ids)
+
+    def close(self) -> None:
+        """Écrit vectors.npy et vector_ids.json, puis supprime le fichier temporaire."""
+        header = {
+            'descr': np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order': False,
+            'shape': (len(self.node_ids), self._dim),
+        }
+
+        def write_matrix(f) -> None:
+            np.lib.format.write_array_header_1_0(f, header)
+            self._rows.seek(0)
+            shutil.copyfileobj(self._rows, f)
+
+        try:
+            atomic_write(self.persist_dir / VECTORS_FILE, write_matrix)
+            atomic_write(self.persist_dir / IDS_FILE, lambda f: f.write(json.dumps(self.node_ids).encode('utf-8')))
+        finally:
+            self._rows.close()
+        logger.info(f"Exported {len(self.node_ids)} vectors ({self.dtype}) to {self.persist_dir / VECTORS_FILE}")
+
+
+def write_vectors(persist_dir: Path, node_ids: List[str], embeddings: Any, dtype: str = "float32") -> None:
+    """
+    Écrit la matrice normalisée et l'ordre des identifiants dans persist_dir.
+
+    Args:
+        persist_dir: Dossier de persistance de l'index
+        node_ids: Identifiants des nœuds, dans l'ordre des lignes
+        embeddings: Matrice (ou liste de vecteurs) des embeddings
+        dtype: "float32" ou "float16"
+    """
+    writer = VectorWriter(persist_dir, dtype)
+    writer.add(node_ids, embeddings)
+    writer.close()
+
+
+def export_from_json_store(persist_dir: Path, dtype: str = "float32") -> None:
+    """Convertit `default__vector_store.json` (SimpleVectorStore) au format mappé."""
+    with open(Path(persist_dir) / JSON_VECTOR_STORE_FILE, encoding='utf-8') as f:
+        embedding_dict = json.load(f)["embedding_dict"]
+    node_ids = list(embedding_dict)
+    write_vectors(persist_dir, node_ids, [embedding_dict[node_id] for node_id in node_ids], dtype)
+
+
+def export_to_json_store(persist_dir: Path, target_dir: Optional[Path] = None) -> None:
+    """Écrit `default__vector_store.json` (SimpleVectorStore) depuis le format mappé (RAG_VECTOR_FORMAT=json)."""
+    from llama_index.core.vector_stores import SimpleVectorStore
+    from llama_index.core.vector_stores.simple import SimpleVectorStoreData
+
+    store = MmapVectorStore.from_persist_dir(persist_dir)
+    embedding_dict = {
+        node_id: store.matrix[i].astype(np.float32).tolist() for i, node_id in enumerate(store.node_ids)
+    }
+    json_store = SimpleVectorStore(data=SimpleVectorStoreData(embedding_dict=embedding_dict))
+    json_store.persist(str(Path(target_dir or persist_dir) / JSON_VECTOR_STORE_FILE))
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Vector store en lecture seule : matrice mappée + produit scalaire vectorisé."""
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+
+    _matrix: Any = PrivateAttr()
+    _node_ids: List[str] = PrivateAttr()
+    _positions: dict = PrivateAttr()
+
+    def __init__(self, matrix: Any, node_ids: List[str], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._matrix = matrix
+        self._node_ids = node_ids
+        self._positions = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: Path) -> "MmapVectorStore":
+        persist_dir = Path(persist_dir)
+        matrix = np.load(persist_dir / VECTORS_FILE, mmap_mode='r')
+        with open(persist_dir / IDS_FILE, encoding='utf-8') as f:
+            node_ids = json.load(f)
+        return cls(matrix, node_ids)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    @property
+    def matrix(self) -> Any:
+        return self._matrix
+
+    @property
+    def node_ids(self) -> List[str]:
+        return self._node_ids
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        raise NotImplementedError("MmapVectorStore is read-only; rebuild the store to add nodes")
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        raise NotImplementedError("MmapVectorStore is read-only; rebuild the store to delete nodes")
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        # Les fichiers sont déjà persistés par VectorWriter
+        return None
+
+    def scores(self, query_embedding: List[float]) -> Any:
+        """Similarité cosinus de la requête avec toutes les lignes de la matrice."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        # Copie normalisée : le vecteur de l'appelant (ex: tableau NumPy float32) reste intact
+        query = query / (np.linalg.norm(query) or 1.0)
+        if self._matrix.dtype == np.float32:
+            return self._matrix @ query
+        # float16 : conversion par blocs pour garder le produit en BLAS sans copier toute la matrice
+        return np.concatenate([
+            self._matrix[i:i + _BLOCK_ROWS].astype(np.float32) @ query
+            for i in range(0, len(self._node_ids), _BLOCK_ROWS)
+        ]) if self._node_ids else np.empty(0, dtype=np.float32)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise NotImplementedError("Metadata filters are not supported by MmapVectorStore")
+
+        scores = self.scores(query.query_embedding)
+        candidates = np.arange(len(scores))
+        if query.node_ids:
+            candidates = np.array([self._positions[n] for n in query.node_ids if n in self._positions], dtype=int)
+            scores = scores[candidates]
+
+        k = min(query.similarity_top_k, len(scores))
+        if k == 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._node_ids[candidates[i]] for i in top],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convertit le vector store JSON au format mappé en mémoire.")
+    parser.add_argument('--persist-dir', type=Path, default=Path(__file__).parent / "query-engine-storage")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export_from_json_store(args.persist_dir, args.dtype)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Bundle local et reproductible de tous les modèles utilisés par l'agent.
+
+`model_manifest.json` liste chaque modèle (embedding, détecteur de fin de tour,
+VAD Silero, données NLTK). La commande `fetch` les télécharge dans MODEL_BUNDLE_DIR,
+effectue les conversions demandées (export ONNX int8 de l'embedding), puis
+vérifie l'empreinte SHA-256 de chaque fichier contre `model_manifest.lock.json`.
+Le lock fige aussi le commit HuggingFace résolu pour chaque modèle : les fetch
+suivants téléchargent ce commit, pas la branche du manifeste. Sans lock, le
+premier fetch le crée (à commiter).
+
+À l'import d'agent.py, `activate_bundle()` fait pointer les caches HuggingFace et
+NLTK vers le bundle et active le mode hors ligne strict : aucun téléchargement ni
+requête vers le hub pendant les appels. `require_bundle()` arrête le worker au
+démarrage si MODEL_OFFLINE=1 et que le bundle n'est pas prêt.
+
+Usage :
+    python model_bundle.py fetch [--update-lock]   # télécharge, convertit, vérifie
+    python model_bundle.py verify                  # revérifie les empreintes du bundle
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+THIS_DIR = Path(__file__).parent
+MANIFEST_PATH = THIS_DIR / "model_manifest.json"
+LOCK_PATH = THIS_DIR / "model_manifest.lock.json"
+BUNDLE_DIR = Path(os.getenv("MODEL_BUNDLE_DIR", THIS_DIR / "models"))
+# Marqueur écrit après une vérification réussie (empreinte du manifeste + du lock)
+BUNDLE_MARKER = "bundle.json"
+# "1" : l'agent refuse de démarrer sans bundle valide et n'accède jamais au hub,
+# "0" : téléchargements autorisés, "auto" : hors ligne strict si le bundle est prêt
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "auto")
+
+# Durées de chargement par modèle au démarrage du processus (voir `timed`)
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> List[dict]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)["models"]
+
+
+def model_spec(name: str, path: Path = MANIFEST_PATH) -> dict:
+    """Entrée du manifeste pour le modèle `name`."""
+    for spec in load_manifest(path):
+        if spec["name"] == name:
+            return spec
+    raise KeyError(f"Model {name!r} is not declared in {path.name}")
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_lock() -> dict:
+    if not LOCK_PATH.exists():
+        return {}
+    with open(LOCK_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _manifest_hash() -> str:
+    content = MANIFEST_PATH.read_bytes() + (LOCK_PATH.read_bytes() if LOCK_PATH.exists() else b'')
+    return hashlib.sha256(content).hexdigest()
+
+
+def bundle_environment(bundle_dir: Path = BUNDLE_DIR, offline: bool = False) -> None:
+    """
+    Fait pointer les caches de modèles vers le bundle.
+
+    Doit être appelé avant tout import de huggingface_hub / transformers / nltk,
+    qui lisent ces variables à l'import.
+    """
+    os.environ["HF_HOME"] = str(bundle_dir / "huggingface")
+    os.environ["NLTK_DATA"] = str(bundle_dir / "nltk_data")
+    if offline:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+        os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
+
+
+def _bundle_files(bundle_dir: Path) -> Iterator[Path]:
+    # Les snapshots HuggingFace sont des liens vers blobs/ : seuls les fichiers réels sont hachés
+    for path in sorted(bundle_dir.rglob('*')):
+        if path.is_file() and not path.is_symlink() and path.name != BUNDLE_MARKER and '.locks' not in path.parts:
+            yield path
+
+
+def compute_checksums(bundle_dir: Path = BUNDLE_DIR) -> Dict[str, str]:
+    return {str(path.relative_to(bundle_dir)): _sha256_file(path) for path in _bundle_files(bundle_dir)}
+
+
+def verify_bundle(bundle_dir: Path = BUNDLE_DIR) -> List[str]:
+    """Compare le bundle au lock ; renvoie la liste des écarts (vide si conforme)."""
+    if not LOCK_PATH.exists():
+        return [f"{LOCK_PATH.name} is missing: run 'python model_bundle.py fetch'"]
+    expected = _load_lock()["files"]
+    actual = compute_checksums(bundle_dir)
+    errors = [f"missing: {name}" for name in sorted(set(expected) - set(actual))]
+    errors += [f"unexpected: {name}" for name in sorted(set(actual) - set(expected))]
+    errors += [f"checksum mismatch: {name}" for name in sorted(expected) if name in actual and actual[name] != expected[name]]
+    return errors
+
+
+def _fetch_huggingface(spec: dict, bundle_dir: Path, revision: Optional[str]) -> Optional[str]:
+    from huggingface_hub import snapshot_download
+
+    # Dossier snapshots/<commit> : son nom est le commit résolu, enregistré dans le lock
+    snapshot = snapshot_download(
+        spec["repo_id"], revision=revision or spec.get("revision", "main"), allow_patterns=spec.get("allow_patterns")
+    )
+    if spec.get("convert") == "onnx-int8":
+        from onnx_embedding import export_onnx_model
+        export_onnx_model(spec["repo_id"], bundle_dir / "onnx", quantize=True)
+    return Path(snapshot).name
+
+
+def _fetch_livekit_plugin(spec: dict, bundle_dir: Path, revision: Optional[str]) -> None:
+    import importlib
+    from livekit.agents import Plugin
+
+    importlib.import_module(spec["module"])
+    for plugin in Plugin.registered_plugins:
+        if plugin.package == spec["module"]:
+            plugin.download_files()
+
+
+def _fetch_nltk(spec: dict, bundle_dir: Path, revision: Optional[str]) -> None:
+    import nltk
+
+    for package in spec["packages"]:
+        if not nltk.download(package, download_dir=os.environ["NLTK_DATA"], quiet=True):
+            raise RuntimeError(f"NLTK download failed: {package}")
+
+
+_FETCHERS = {
+    "huggingface": _fetch_huggingface,
+    "livekit-plugin": _fetch_livekit_plugin,
+    "nltk": _fetch_nltk,
+}
+
+
+def fetch_bundle(bundle_dir: Path = BUNDLE_DIR, update_lock: bool = False) -> None:
+    """
+    Télécharge et convertit tous les modèles du manifeste, puis vérifie le lock.
+
+    Les modèles HuggingFace sont téléchargés au commit enregistré dans le lock.
+    Le lock est (ré)écrit avec les commits résolus et les empreintes du bundle
+    s'il est absent ou si `update_lock` est demandé (révisions du manifeste).
+    """
+    update_lock = update_lock or not LOCK_PATH.exists()
+    locked_revisions = {} if update_lock else _load_lock().get("revisions", {})
+    revisions: Dict[str, str] = {}
+
+    bundle_dir.mkdir(parents=True, exist_ok=True)
+    bundle_environment(bundle_dir, offline=False)
+    for spec in load_manifest():
+        started = time.perf_counter()
+        revision = _FETCHERS[spec["type"]](spec, bundle_dir, locked_revisions.get(spec["name"]))
+        if revision:
+            revisions[spec["name"]] = revision
+        logger.info(f"Model {spec['name']} fetched in {time.perf_counter() - started:.2f}s")
+
+    if update_lock:
+        with open(LOCK_PATH, 'w', encoding='utf-8') as f:
+            json.dump({"revisions": revisions, "files": compute_checksums(bundle_dir)}, f, indent=1, sort_keys=True)
+            f.write("\n")
+        logger.info(f"{LOCK_PATH.name} written: commit it to pin these model revisions")
+
+    errors = verify_bundle(bundle_dir)
+    if errors:
+        raise RuntimeError("Model bundle verification failed:\n  " + "\n  ".join(errors))
+    with open(bundle_dir / BUNDLE_MARKER, 'w', encoding='utf-8') as f:
+        json.dump({"manifest_hash": _manifest_hash(), "created": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+
+
+def bundle_ready(bundle_dir: Path = BUNDLE_DIR) -> bool:
+    """True si le bundle a été vérifié contre le manifeste et le lock actuels."""
+    marker = bundle_dir / BUNDLE_MARKER
+    if not marker.exists():
+        return False
+    with open(marker, encoding='utf-8') as f:
+        return json.load(f).get("manifest_hash") == _manifest_hash()
+
+
+def activate_bundle(bundle_dir: Path = BUNDLE_DIR, offline: str = MODEL_OFFLINE) -> bool:
+    """
+    Utilise le bundle local au démarrage de l'agent.
+
+    Ne lève jamais d'exception (appelé à l'import d'agent.py) : l'absence de bundle
+    en mode hors ligne strict est signalée par `require_bundle()`. En mode "0" ou
+    "auto", les caches par défaut restent utilisés quand le bundle n'est pas prêt.
+
+    Returns:
+        True si le bundle est actif
+    """
+    ready = bundle_ready(bundle_dir)
+    if ready or offline == "1":
+        # Mode strict sans bundle : aucun téléchargement possible avant l'arrêt du worker
+        bundle_environment(bundle_dir, offline=offline != "0")
+    else:
+        logger.warning(f"Model bundle {bundle_dir} not ready: models will be downloaded on demand")
+    return ready
+
+
+def require_bundle(bundle_dir: Path = BUNDLE_DIR, offline: str = MODEL_OFFLINE) -> None:
+    """Lève une RuntimeError au démarrage du worker si MODEL_OFFLINE=1 et que le bundle n'est pas prêt."""
+    if offline == "1" and not bundle_ready(bundle_dir):
+        raise RuntimeError(
+            f"Model bundle {bundle_dir} is missing or outdated: run 'python model_bundle.py fetch' "
+            "(or set MODEL_OFFLINE=auto to allow downloads)"
+        )
+
+
+@contextmanager
+def timed(name: str):
+    """Mesure le chargement d'un modèle au démarrage et l'ajoute à STARTUP_TIMINGS."""
+    started = time.perf_counter()
+    yield
+    STARTUP_TIMINGS[name] = time.perf_counter() - started
+    logger.info(f"Model {name} ready in {STARTUP_TIMINGS[name]:.2f}s")
+
+
+def log_startup_timings() -> None:
+    summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in STARTUP_TIMINGS.items())
+    logger.info(f"Startup timings: {summary} (total {sum(STARTUP_TIMINGS.values()):.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['fetch', 'verify'])
+    parser.add_argument('--bundle-dir', type=Path, default=BUNDLE_DIR)
+    parser.add_argument('--update-lock', action='store_true', help="Réenregistre commits et empreintes dans le lock")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == 'fetch':
+        fetch_bundle(args.bundle_dir, update_lock=args.update_lock)
+        print(f"✅ Bundle prêt : {args.bundle_dir}")
+        return
+
+    errors = verify_bundle(args.bundle_dir)
+    if errors:
+        print("❌ Bundle non conforme :\n  " + "\n  ".join(errors))
+        sys.exit(1)
+    print(f"✅ Bundle conforme : {args.bundle_dir}")
+
+
+if __name__ == "__main__":
+    main()
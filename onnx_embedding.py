@@ -0,0 +1,204 @@
+"""
+Backend d'embedding ONNX Runtime quantifié int8, pour les workers sans GPU.
+
+Le modèle sentence-transformers est exporté une fois en ONNX puis quantifié
+dynamiquement en int8 (poids des couches linéaires). À l'exécution, seuls
+`onnxruntime` et `tokenizers` sont chargés : ni PyTorch ni transformers.
+Le pooling (moyenne masquée) et la normalisation L2 reproduisent ceux du modèle
+sentence-transformers, ce qui garde les vecteurs compatibles avec l'index.
+
+`OnnxEmbedding` est un `BaseEmbedding` LlamaIndex : il s'utilise tel quel dans
+`Settings.embed_model` (voir `EMBED_BACKEND` dans knowledge_base.py).
+
+Usage (export manuel, nécessite torch et transformers) :
+    python onnx_embedding.py [--output-dir models/onnx] [--no-quantize]
+"""
+
+import os
+import time
+import asyncio
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from model_bundle import BUNDLE_DIR
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODELS_DIR = BUNDLE_DIR / "onnx"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+# Longueur maximale de séquence du modèle sentence-transformers
+MAX_SEQ_LENGTH = 128
+# Threads ONNX Runtime par session (0 = valeur par défaut d'ONNX Runtime)
+ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))
+
+
+def model_dir_for(model_name: str, output_dir: Path = ONNX_MODELS_DIR) -> Path:
+    return Path(output_dir) / model_name.replace("/", "__")
+
+
+def export_onnx_model(model_name: str, output_dir: Path = ONNX_MODELS_DIR, quantize: bool = True) -> Path:
+    """
+    Exporte le modèle HuggingFace en ONNX (et sa version int8) avec son tokenizer.
+
+    Args:
+        model_name: Identifiant HuggingFace du modèle sentence-transformers
+        output_dir: Dossier racine des modèles exportés
+        quantize: Produit aussi model.int8.onnx par quantification dynamique
+
+    Returns:
+        Dossier contenant les fichiers exportés
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    started = time.perf_counter()
+    target = model_dir_for(model_name, output_dir)
+    target.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(target)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    class Encoder(torch.nn.Module):
+        # Entrées nommées explicitement : la signature de forward() varie selon les versions de transformers
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    sample = tokenizer(["exemple"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(),
+            (sample["input_ids"], sample["attention_mask"]),
+            str(target / MODEL_FILE),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=14,
+            dynamo=False,
+        )
+    if quantize:
+        quantize_dynamic(str(target / MODEL_FILE), str(target / QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
+    logger.info(f"Exported {model_name} to ONNX in {time.perf_counter() - started:.2f}s ({target})")
+    return target
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """Embedding sentence-transformers exécuté par ONNX Runtime (int8 par défaut)."""
+
+    model_dir: str = Field(description="Dossier du modèle exporté par export_onnx_model")
+    quantized: bool = Field(default=True, description="Utilise model.int8.onnx plutôt que model.onnx")
+    max_length: int = Field(default=MAX_SEQ_LENGTH)
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+
+    def __init__(
+        self,
+        model_dir: Path,
+        model_name: str = "unknown",
+        quantized: bool = True,
+        max_length: int = MAX_SEQ_LENGTH,
+        threads: int = ONNX_THREADS,
+        **kwargs: Any
+    ) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        super().__init__(
+            model_dir=str(model_dir), model_name=model_name, quantized=quantized, max_length=max_length, **kwargs
+        )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = Path(model_dir) / (QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        self._session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+
+        self._tokenizer = Tokenizer.from_file(str(Path(model_dir) / TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length)
+        self._tokenizer.enable_padding()
+
+    @classmethod
+    def from_pretrained(
+        cls,
+        model_name: str,
+        output_dir: Path = ONNX_MODELS_DIR,
+        quantized: bool = True,
+        **kwargs: Any
+    ) -> "OnnxEmbedding":
+        """Charge le modèle exporté, en l'exportant d'abord s'il est absent."""
+        model_dir = model_dir_for(model_name, output_dir)
+        if not (model_dir / (QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)).exists():
+            export_onnx_model(model_name, output_dir, quantize=quantized)
+        return cls(model_dir, model_name=model_name, quantized=quantized, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        (hidden,) = self._session.run(None, {"input_ids": input_ids, "attention_mask": attention_mask})
+
+        # Moyenne des états des tokens réels (hors padding), puis normalisation L2
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._encode([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        # Inférence ONNX dans un thread : la boucle d'événements (audio, autres appels) n'est pas bloquée
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+
+def main():
+    from knowledge_base import EMBED_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Exporte le modèle d'embedding en ONNX (int8).")
+    parser.add_argument('--model', default=EMBED_MODEL_NAME)
+    parser.add_argument('--output-dir', type=Path, default=ONNX_MODELS_DIR)
+    parser.add_argument('--no-quantize', action='store_true', help="N'exporte que le modèle fp32")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    target = export_onnx_model(args.model, args.output_dir, quantize=not args.no_quantize)
+    for path in sorted(target.glob("*.onnx")):
+        print(f"✅ {path} ({path.stat().st_size / 1e6:.1f} Mo)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Rattachement des rendez-vous à un patient.
+
+À la création, chaque rendez-vous reçoit une clé patient dérivée du nom et du
+numéro de téléphone donnés par l'appelant, stockée dans les propriétés étendues
+privées de l'événement (`extendedProperties.private.patient_key`). Le nom est
+normalisé (casse, accents, ordre prénom/nom) et le numéro réduit à ses chiffres
+au format national ; la clé est un HMAC-SHA256 de ces valeurs, avec le secret
+PATIENT_KEY_SECRET du .env : ni le nom ni le numéro n'apparaissent en clair dans
+l'agenda ou dans l'index, et sans le secret, la clé ne peut pas être retrouvée
+en essayant tous les numéros. Changer le secret détache les rendez-vous
+existants de leurs patients.
+
+`PatientIndex` associe une clé patient à ses rendez-vous triés par début : le
+report et l'annulation trouvent « mon rendez-vous de mardi » en une recherche,
+quelle que soit la taille de l'agenda.
+"""
+
+import os
+import re
+import hmac
+import hashlib
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from availability_cache import to_aware
+from fr_datetime import normalize_text
+
+# Secret des clés patient (HMAC), à garder stable et hors du dépôt
+PATIENT_KEY_SECRET = os.getenv('PATIENT_KEY_SECRET', '')
+# Propriété étendue privée des événements qui porte la clé patient
+PATIENT_KEY_PROPERTY = 'patient_key'
+# Nombre de chiffres d'un numéro de téléphone au format national
+_PHONE_DIGITS = 10
+
+Interval = Tuple[datetime, datetime, str]
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """Numéro au format national ("+33 6 12 34 56 78" -> "0612345678"), None s'il est incomplet."""
+    digits = re.sub(r'\D', '', phone or '')
+    if digits.startswith('0033'):
+        digits = '0' + digits[4:]
+    elif digits.startswith('33') and len(digits) == _PHONE_DIGITS + 1:
+        digits = '0' + digits[2:]
+    return digits if len(digits) == _PHONE_DIGITS else None
+
+
+def require_patient_key_secret() -> None:
+    """Lève une RuntimeError au démarrage du worker si PATIENT_KEY_SECRET n'est pas défini."""
+    if not PATIENT_KEY_SECRET:
+        raise RuntimeError("PATIENT_KEY_SECRET environment variable not set")
+
+
+def patient_key(name: str, phone: str) -> Optional[str]:
+    """
+    Clé patient d'un appelant.
+
+    Args:
+        name: Prénom et nom, dans n'importe quel ordre
+        phone: Numéro de téléphone, dans n'importe quel format
+
+    Returns:
+        HMAC hexadécimal, ou None si le nom ou le numéro manque
+
+    Raises:
+        RuntimeError: PATIENT_KEY_SECRET n'est pas défini
+    """
+    words = sorted(re.findall(r"[a-z]+", normalize_text(name or '')))
+    digits = normalize_phone(phone)
+    if not words or digits is None:
+        return None
+    require_patient_key_secret()
+    message = f"{' '.join(words)}\0{digits}".encode()
+    return hmac.new(PATIENT_KEY_SECRET.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def event_patient_key(event: Dict[str, Any]) -> Optional[str]:
+    """Clé patient d'un événement de l'API Calendar, s'il en porte une."""
+    return event.get('extendedProperties', {}).get('private', {}).get(PATIENT_KEY_PROPERTY)
+
+
+def patient_properties(key: str) -> Dict[str, Any]:
+    """Champ `extendedProperties` d'un événement rattaché à ce patient."""
+    return {'private': {PATIENT_KEY_PROPERTY: key}}
+
+
+class PatientIndex:
+    """Rendez-vous de chaque patient triés par début, adressables par identifiant d'événement."""
+
+    def __init__(self):
+        self._by_patient: Dict[str, List[Interval]] = {}
+        self._by_id: Dict[str, Tuple[str, Interval]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def clear(self) -> None:
+        self._by_patient.clear()
+        self._by_id.clear()
+
+    def upsert(self, event_id: str, key: str, start: datetime, end: datetime) -> None:
+        self.remove(event_id)
+        interval = (to_aware(start), to_aware(end), event_id)
+        insort(self._by_patient.setdefault(key, []), interval)
+        self._by_id[event_id] = (key, interval)
+
+    def remove(self, event_id: str) -> None:
+        entry = self._by_id.pop(event_id, None)
+        if entry is None:
+            return
+        key, interval = entry
+        intervals = self._by_patient[key]
+        del intervals[bisect_left(intervals, interval)]
+        if not intervals:
+            del self._by_patient[key]
+
+    def apply_event(self, event: Dict[str, Any], start: Optional[datetime], end: Optional[datetime]) -> None:
+        """Répercute un événement de l'API Calendar (créé, modifié ou supprimé) dans l'index."""
+        key = event_patient_key(event)
+        if key is None or event.get('status') == 'cancelled' or start is None or end is None:
+            self.remove(event['id'])
+        else:
+            self.upsert(event['id'], key, start, end)
+
+    def find(self, key: str, start: datetime, end: datetime) -> List[Interval]:
+        """Rendez-vous du patient qui commencent dans [start, end), triés par début."""
+        intervals = self._by_patient.get(key, [])
+        lo = bisect_left(intervals, (to_aware(start),))
+        hi = bisect_left(intervals, (to_aware(end),))
+        return intervals[lo:hi]
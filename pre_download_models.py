@@ -1,27 +1,17 @@
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-import nltk
+from model_bundle import BUNDLE_DIR, fetch_bundle
+import logging
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     print("Début du téléchargement des modèles. Cela peut prendre quelques minutes...")
 
-    # 1. Forcer le téléchargement du modèle d'embedding
-    print("Téléchargement du modèle sentence-transformer...")
+    # Tous les modèles déclarés dans model_manifest.json (embedding, détecteur de fin
+    # de tour, VAD, données NLTK), vérifiés contre model_manifest.lock.json
     try:
-        HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        print("...modèle sentence-transformer téléchargé avec succès.")
+        fetch_bundle(BUNDLE_DIR)
     except Exception as e:
-        print(f"Une erreur est survenue lors du téléchargement du modèle sentence-transformer : {e}")
+        print(f"Une erreur est survenue lors de la préparation du bundle de modèles : {e}")
+        raise SystemExit(1)
 
-
-    # 2. Forcer le téléchargement du tokenizer NLTK
-    print("\nTéléchargement du tokenizer NLTK 'punkt'...")
-    try:
-        nltk.download('punkt', quiet=True)
-        print("...tokenizer NLTK téléchargé avec succès.")
-    except Exception as e:
-        print(f"Une erreur est survenue lors du téléchargement de NLTK 'punkt' : {e}")
-
-
-    print("\nTous les modèles nécessaires ont été téléchargés et mis en cache.")
+    print(f"\nTous les modèles nécessaires sont dans {BUNDLE_DIR}.")
     print("Vous pouvez maintenant lancer l'agent principal avec 'python agent.py'.")
-
@@ -1,29 +1,80 @@
+from livekit.agents import RunContext
 from livekit.agents.llm import function_tool
-from llama_index.core.query_engine import BaseQueryEngine
+from latency_tracing import traced_tool
 from calendar_service import get_calendar_service
-from datetime import datetime, timedelta
+from availability_cache import TIMEZONE
+from fr_datetime import normalize_text, parse_appointment_datetime, parse_mentioned_day
+from patients import patient_key
+from slot_finder import find_free_slots, parse_slot_preferences
+from speculation import current_speculation
+from datetime import datetime, timedelta, time as dt_time
+import re
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-INSTRUCTIONS = """
+# Horizon (en semaines) et nombre de créneaux proposés par find_available_slots
+SLOT_SEARCH_WEEKS = 3
+SLOT_SUGGESTIONS = 3
+
+_WEEKDAY_NAMES = ['lundi', 'mardi', 'mercredi', 'jeudi', 'vendredi', 'samedi', 'dimanche']
+
+GREETING = "Bonjour ! Vous êtes en ligne avec l’assistant vocal de notre cabinet de kinésithérapie. Comment puis-je vous aider ?"
+# Annonces prononcées dès l'appel de l'outil, pendant la lecture et l'écriture dans l'agenda
+BOOKING_ACK = "Un instant, je vérifie ce créneau."
+RESCHEDULE_ACK = "Un instant, je regarde votre rendez-vous."
+# Nom ou numéro de téléphone manquant : le rendez-vous ne peut pas être rattaché au patient
+IDENTITY_REQUIRED = "Pour cela, j'ai besoin de vos prénom, nom et numéro de téléphone."
+# Appel adressé à un cabinet inconnu du worker : refusé avant toute prise de rendez-vous
+UNKNOWN_TENANT_REPLY = "Je suis désolé, ce cabinet n'est pas joignable par cette ligne pour le moment. Merci de le contacter directement. Au revoir."
+OUT_OF_SCOPE_REPLY = "Je suis désolé, je ne peux pas répondre à cette question. Je peux uniquement répondre à des questions concernant le cabinet de kinésithérapie, la prise de rendez-vous, ou votre suivi de soins."
+
+# Phrases prononcées telles quelles : synthétisées une seule fois (tts_cache.py).
+# Les réponses des outils ci-dessous y figurent phrase par phrase ; les phrases
+# qui contiennent une date restent synthétisées à chaque appel.
+CACHED_PHRASES = [
+    GREETING,
+    OUT_OF_SCOPE_REPLY,
+    BOOKING_ACK,
+    RESCHEDULE_ACK,
+    IDENTITY_REQUIRED,
+    "Parfait !",
+    "Vous recevrez une confirmation par email.",
+    "Pouvez-vous choisir un autre horaire ?",
+    "Je n'ai pas pu comprendre la date et l'heure souhaitées. Pouvez-vous préciser, par exemple 'demain à 14h' ?",
+    "Je n'ai pas pu comprendre la nouvelle date souhaitée. Pouvez-vous préciser, par exemple 'vendredi à 16h' ?",
+    "Je ne trouve aucun rendez-vous à reporter. Souhaitez-vous prendre un nouveau rendez-vous ?",
+    "Je ne trouve aucun rendez-vous à annuler.",
+    "Pouvez-vous préciser lequel vous souhaitez annuler ?",
+    "Pouvez-vous préciser lequel vous souhaitez reporter ?",
+    "Souhaitez-vous élargir vos disponibilités ?",
+    "Une erreur technique s'est produite. Veuillez réessayer ou contacter directement le cabinet.",
+    "Une erreur technique s'est produite lors du report. Veuillez réessayer.",
+    "Une erreur technique s'est produite lors de l'annulation. Veuillez réessayer.",
+    "Une erreur technique s'est produite lors de la recherche de créneaux. Veuillez réessayer.",
+    "Une erreur s'est produite lors de l'annulation. Veuillez réessayer.",
+]
+
+INSTRUCTIONS = f"""
     You are the voice assistant for a physiotherapy clinic (“cabinet de kinésithérapie”).
     Your goal is to welcome callers, collect their basic information, then answer their questions
     or transfer them to the appropriate staff member.
 
-    1. GREETING ─ Start every call with this message : "Bonjour ! Vous êtes en ligne avec l’assistant vocal de notre cabinet de kinésithérapie.
-    Comment puis-je vous aider? 
+    1. GREETING ─ Start every call with this message : "{GREETING}"
     Use a friendly, professional tone. 
        
     2. PATIENT INFO COLLECTION
 
        • **For booking an appointment**:
          - Politely ask for the patient's : first name (prénom), last name (nom), phone number (téléphone), and email address.
-         - Once these are collected, call the tool `book_appointment` with the requested appointment details.
+         - Once these are collected, call the tool `book_appointment` with the requested appointment details, the patient's full name and phone number.
 
        • **For cancelling or rescheduling an appointment**:
-         - Ask for: first name (prénom), last name (nom), the date of the appointment to cancel, and if rescheduling, the desired new date/time.
+         - Ask for: first name (prénom), last name (nom), phone number (téléphone), the date of the appointment to cancel or move, and if rescheduling, the desired new date/time.
+         - Pass the patient's full name and phone number to `cancel_appointment` or `reschedule_appointment`: appointments are found from them.
          - If the requested date/time is not available, offer only alternative slots that match the patient’s expressed constraints (for example, if the patient is only available on Tuesdays and Thursdays, do not propose other days; if not available in the morning, do not offer morning slots).
+         - To find alternative slots, call the tool `find_available_slots` once with the patient's constraints instead of checking times one by one.
          - Always consider and respect any preferences stated by the patient regarding days or times.
 
     3. HANDLE REQUEST ─ Once the above info is confirmed, address their question or request.
@@ -52,11 +103,13 @@ INSTRUCTIONS = """
        conversation, call the function tool `query_info` with a concise query.
        Do **not** call it if the answer is already evident from the chat history.
        Limit the returned answer (and therefore your reply) to **800 tokens** maximum.
+       The tool may return raw document excerpts prefixed with a relevance score:
+       answer only from the most relevant excerpts and never read the scores aloud.
 
     8. OUT-OF-SCOPE QUESTIONS ─ If a patient asks a question unrelated to physiotherapy, 
        clinic operations, appointments, or general health, **do NOT attempt to answer**.
        Instead, politely reply:
-       "Je suis désolé, je ne peux pas répondre à cette question. Je peux uniquement répondre à des questions concernant le cabinet de kinésithérapie, la prise de rendez-vous, ou votre suivi de soins."
+       "{OUT_OF_SCOPE_REPLY}"
        
        Never attempt to answer questions outside this scope (e.g. weather, politics, sports, jokes, etc.). 
        Do not invent or guess.   
@@ -69,26 +122,111 @@ INSTRUCTIONS = """
 
 
 
+def _acknowledge(context: RunContext, text: str) -> None:
+    # Prononcé pendant que l'outil travaille ; la réponse du LLM, construite sur le
+    # résultat de l'outil, suit dans la file de parole. Hors historique : simple attente.
+    if context is None:
+        return
+    try:
+        context.session.say(text, add_to_chat_ctx=False)
+    except RuntimeError as e:
+        logger.debug(f"Acknowledgement skipped: {e}")
+
+
+def _format_committed(event_start: str) -> str:
+    # Horaire tel qu'enregistré par l'agenda, pas celui demandé
+    start_time = datetime.fromisoformat(event_start.replace('Z', '+00:00'))
+    return start_time.strftime('%d/%m/%Y à %Hh%M')
+
+
+def _start_hhmm(appointment: dict) -> str:
+    start = datetime.fromisoformat(appointment['start'].replace('Z', '+00:00'))
+    return (start.astimezone(TIMEZONE) if start.tzinfo else start).strftime('%H%M')
+
+
+async def _patient_appointments(calendar_service, key: str, which: str, patient_name: str = "") -> list:
+    """
+    Rendez-vous du patient désignés par `which` ("mardi", "mardi à 14h", ou vide
+    pour tous les prochains), en une recherche dans l'index par patient.
+
+    Les rendez-vous pris avant les clés patient n'en portent pas : à défaut, ceux
+    du jour cité sont retrouvés par l'heure citée ou par le nom du patient dans
+    leur titre ou leur description.
+    """
+    day = parse_mentioned_day(which) if which else None
+    if day is None:
+        return await calendar_service.find_patient_appointments(key)
+    start = max(datetime.combine(day, dt_time.min), datetime.now())
+    end = datetime.combine(day, dt_time.max)
+    appointments = await calendar_service.find_patient_appointments(key, start, end)
+    _, at = parse_appointment_datetime(which)
+    if not appointments:
+        return await _untagged_appointments(calendar_service, start, end, at, patient_name)
+    # Plusieurs rendez-vous ce jour-là : l'heure citée départage
+    if len(appointments) > 1 and at is not None:
+        at_time = at.strftime('%H%M')
+        appointments = [apt for apt in appointments if _start_hhmm(apt) == at_time] or appointments
+    return appointments
+
+
+async def _untagged_appointments(calendar_service, start: datetime, end: datetime, at, patient_name: str) -> list:
+    """Rendez-vous sans clé patient de la période, à l'heure citée ou au nom du patient."""
+    name_words = set(re.findall(r"[a-z]+", normalize_text(patient_name)))
+    at_time = at.strftime('%H%M') if at is not None else None
+    matches = []
+    async for apt in calendar_service.get_appointments(start, end):
+        if apt.get('patient_key') or apt['status'] == 'cancelled' or not apt['start']:
+            continue
+        text_words = set(re.findall(r"[a-z]+", normalize_text(f"{apt['title']} {apt['description'] or ''}")))
+        if _start_hhmm(apt) == at_time or (name_words and name_words <= text_words):
+            matches.append(apt)
+    if matches:
+        logger.info(f"Matched {len(matches)} appointments without patient key")
+    return matches
+
+
+def _list_choices(appointments: list) -> str:
+    appointments_list = []
+    for i, apt in enumerate(appointments[:3], 1):  # Limiter à 3 pour la lisibilité
+        appointments_list.append(f"{i}. {_format_committed(apt['start'])}")
+    return "\n".join(appointments_list)
+
 
 @function_tool
-async def book_appointment(details: str) -> str:
+@traced_tool
+async def book_appointment(details: str, patient_name: str, phone: str, context: RunContext = None) -> str:
     """
     Books an appointment based on a natural language query.
     For example: "tomorrow at 2pm" or "July 2nd at 10:30".
+
+    Args:
+        details: Requested date and time of the appointment
+        patient_name: Patient's first and last name
+        phone: Patient's phone number
     """
     try:
+        key = patient_key(patient_name, phone)
+        if key is None:
+            return IDENTITY_REQUIRED
         calendar_service = get_calendar_service()
+        _acknowledge(context, BOOKING_ACK)
         
-        # Parse la date/heure depuis le texte
-        start_datetime = calendar_service.parse_datetime_from_text(details)
+        # Analyse de la date/heure (dateparser en dernier recours, hors boucle) pendant
+        # le rafraîchissement des disponibilités
+        start_datetime, _ = await asyncio.gather(
+            asyncio.to_thread(calendar_service.parse_datetime_from_text, details),
+            calendar_service.refresh_availability(),
+        )
         if not start_datetime:
             return "Je n'ai pas pu comprendre la date et l'heure souhaitées. Pouvez-vous préciser, par exemple 'demain à 14h' ?"
         
         # Durée par défaut de 30 minutes pour un rendez-vous
         end_datetime = start_datetime + timedelta(minutes=30)
         
-        # Vérifier la disponibilité
-        is_available = await calendar_service.check_availability(start_datetime, end_datetime)
+        # Vérifier la disponibilité (agenda du jour éventuellement lu pendant que le patient parlait)
+        speculation = current_speculation()
+        prefetched = await speculation.claim_busy(start_datetime.date()) if speculation else None
+        is_available = await calendar_service.check_availability(start_datetime, end_datetime, prefetched=prefetched)
         if not is_available:
             return f"Le créneau du {start_datetime.strftime('%d/%m/%Y à %Hh%M')} n'est pas disponible. Pouvez-vous choisir un autre horaire ?"
         
@@ -97,10 +235,11 @@ async def book_appointment(details: str) -> str:
             title="Rendez-vous Kinésithérapie",
             start_datetime=start_datetime,
             end_datetime=end_datetime,
-            description="Rendez-vous pris via l'assistant vocal"
+            description="Rendez-vous pris via l'assistant vocal",
+            patient_key=key
         )
         
-        formatted_date = start_datetime.strftime('%d/%m/%Y à %Hh%M')
+        formatted_date = _format_committed(appointment['start'])
         return f"Parfait ! Votre rendez-vous est confirmé pour le {formatted_date}. Vous recevrez une confirmation par email."
         
     except ValueError as e:
@@ -111,33 +250,55 @@ async def book_appointment(details: str) -> str:
         return "Une erreur technique s'est produite. Veuillez réessayer ou contacter directement le cabinet."
 
 @function_tool
-async def reschedule_appointment(details: str) -> str:
+@traced_tool
+async def reschedule_appointment(
+    details: str,
+    patient_name: str,
+    phone: str,
+    current_appointment: str = "",
+    context: RunContext = None
+) -> str:
     """
     Reschedules an existing appointment based on a natural language query.
     For example: "reschedule my appointment from tomorrow at 2pm to next Friday at 4pm".
+
+    Args:
+        details: Desired new date and time
+        patient_name: Patient's first and last name
+        phone: Patient's phone number
+        current_appointment: Date (and time if needed) of the appointment to move, e.g. "mardi" or "mardi à 14h"; empty if not given
     """
     try:
+        key = patient_key(patient_name, phone)
+        if key is None:
+            return IDENTITY_REQUIRED
         calendar_service = get_calendar_service()
+        _acknowledge(context, RESCHEDULE_ACK)
         
-        # Pour simplifier le prototype, on récupère les prochains rendez-vous
-        # et on demande à l'utilisateur de préciser
-        appointments = await calendar_service.get_appointments(max_results=5)
+        # Rendez-vous du patient (index par patient), analyse de la nouvelle date
+        # et rafraîchissement des disponibilités en parallèle
+        appointments, new_datetime, _ = await asyncio.gather(
+            _patient_appointments(calendar_service, key, current_appointment, patient_name),
+            asyncio.to_thread(calendar_service.parse_datetime_from_text, details),
+            calendar_service.refresh_availability(),
+        )
         
         if not appointments:
             return "Je ne trouve aucun rendez-vous à reporter. Souhaitez-vous prendre un nouveau rendez-vous ?"
         
-        # Parse la nouvelle date/heure
-        new_datetime = calendar_service.parse_datetime_from_text(details)
+        if len(appointments) > 1:
+            return f"J'ai trouvé plusieurs rendez-vous :\n{_list_choices(appointments)}\n\nPouvez-vous préciser lequel vous souhaitez reporter ?"
+        
         if not new_datetime:
             return "Je n'ai pas pu comprendre la nouvelle date souhaitée. Pouvez-vous préciser, par exemple 'vendredi à 16h' ?"
         
-        # Pour le prototype, on prend le premier rendez-vous trouvé
-        # Dans une version complète, il faudrait une logique plus sophistiquée
         first_appointment = appointments[0]
         new_end_datetime = new_datetime + timedelta(minutes=30)
         
         # Vérifier la disponibilité du nouveau créneau
-        is_available = await calendar_service.check_availability(new_datetime, new_end_datetime)
+        speculation = current_speculation()
+        prefetched = await speculation.claim_busy(new_datetime.date()) if speculation else None
+        is_available = await calendar_service.check_availability(new_datetime, new_end_datetime, prefetched=prefetched)
         if not is_available:
             return f"Le nouveau créneau du {new_datetime.strftime('%d/%m/%Y à %Hh%M')} n'est pas disponible. Pouvez-vous choisir un autre horaire ?"
         
@@ -148,7 +309,7 @@ async def reschedule_appointment(details: str) -> str:
             new_end_datetime
         )
         
-        formatted_date = new_datetime.strftime('%d/%m/%Y à %Hh%M')
+        formatted_date = _format_committed(updated_appointment['start'])
         return f"Votre rendez-vous a été reporté au {formatted_date}. Vous recevrez une confirmation par email."
         
     except ValueError as e:
@@ -159,44 +320,75 @@ async def reschedule_appointment(details: str) -> str:
         return "Une erreur technique s'est produite lors du report. Veuillez réessayer."
 
 @function_tool
-async def cancel_appointment(details: str) -> str:
+@traced_tool
+async def cancel_appointment(details: str, patient_name: str, phone: str) -> str:
     """
     Cancels an appointment based on a natural language query.
     For example: "the appointment for tomorrow at 2pm".
+
+    Args:
+        details: Date (and time if needed) of the appointment to cancel; may be empty for the next one
+        patient_name: Patient's first and last name
+        phone: Patient's phone number
     """
     try:
+        key = patient_key(patient_name, phone)
+        if key is None:
+            return IDENTITY_REQUIRED
         calendar_service = get_calendar_service()
         
-        # Récupérer les prochains rendez-vous
-        appointments = await calendar_service.get_appointments(max_results=5)
+        # Rendez-vous du patient, au jour cité s'il y en a un
+        appointments = await _patient_appointments(calendar_service, key, details, patient_name)
         
         if not appointments:
             return "Je ne trouve aucun rendez-vous à annuler."
         
-        # Pour le prototype, on affiche les rendez-vous disponibles
         if len(appointments) == 1:
             appointment = appointments[0]
             success = await calendar_service.cancel_appointment(appointment['id'])
             
             if success:
-                start_time = datetime.fromisoformat(appointment['start'].replace('Z', '+00:00'))
-                formatted_date = start_time.strftime('%d/%m/%Y à %Hh%M')
-                return f"Votre rendez-vous du {formatted_date} a été annulé avec succès."
+                return f"Votre rendez-vous du {_format_committed(appointment['start'])} a été annulé avec succès."
             else:
                 return "Une erreur s'est produite lors de l'annulation. Veuillez réessayer."
         else:
             # Plusieurs rendez-vous - demander précision
-            appointments_list = []
-            for i, apt in enumerate(appointments[:3], 1):  # Limiter à 3 pour la lisibilité
-                start_time = datetime.fromisoformat(apt['start'].replace('Z', '+00:00'))
-                formatted_date = start_time.strftime('%d/%m/%Y à %Hh%M')
-                appointments_list.append(f"{i}. {formatted_date}")
-            
-            appointments_text = "\n".join(appointments_list)
-            return f"J'ai trouvé plusieurs rendez-vous :\n{appointments_text}\n\nPouvez-vous préciser lequel vous souhaitez annuler ?"
+            return f"J'ai trouvé plusieurs rendez-vous :\n{_list_choices(appointments)}\n\nPouvez-vous préciser lequel vous souhaitez annuler ?"
         
     except Exception as e:
         logger.error(f"Unexpected error canceling appointment: {e}")
         return "Une erreur technique s'est produite lors de l'annulation. Veuillez réessayer."
 
+@function_tool
+@traced_tool
+async def find_available_slots(preferences: str) -> str:
+    """
+    Finds the next free appointment slots matching the patient's constraints.
+    For example: "only Tuesdays and Thursdays, not in the morning" or "after 5pm".
+    """
+    try:
+        calendar_service = get_calendar_service()
+        constraints = parse_slot_preferences(preferences)
+        
+        # Une seule lecture des créneaux occupés sur tout l'horizon de recherche
+        search_start = datetime.now() + timedelta(hours=1)
+        search_end = search_start + timedelta(weeks=SLOT_SEARCH_WEEKS)
+        busy = await calendar_service.get_busy_intervals(search_start, search_end)
+        
+        slots = find_free_slots(busy, search_start, search_end, constraints, limit=SLOT_SUGGESTIONS)
+        if not slots:
+            return f"Je ne trouve aucun créneau libre correspondant dans les {SLOT_SEARCH_WEEKS} prochaines semaines. Souhaitez-vous élargir vos disponibilités ?"
+        
+        formatted_slots = [
+            f"{_WEEKDAY_NAMES[slot.weekday()]} {slot.strftime('%d/%m à %Hh%M')}" for slot in slots
+        ]
+        return f"Créneaux disponibles : {', '.join(formatted_slots)}."
+        
+    except ValueError as e:
+        logger.error(f"Error finding available slots: {e}")
+        return str(e)
+    except Exception as e:
+        logger.error(f"Unexpected error finding available slots: {e}")
+        return "Une erreur technique s'est produite lors de la recherche de créneaux. Veuillez réessayer."
+
 # (Je peux  en ajouter d'autres pour get_patient_info, etc.)
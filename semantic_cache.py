@@ -0,0 +1,164 @@
+"""
+Cache sémantique des réponses de `query_info`.
+
+Les appelants posent souvent les mêmes questions (tarifs, adresse, documents à
+apporter) avec des mots différents. La question est embarquée une fois ; si elle
+est assez proche (similarité cosinus) d'une question déjà traitée, la réponse
+stockée est renvoyée sans retrieval ni appel LLM de synthèse.
+
+Le cache vit uniquement en mémoire du processus (jamais persisté, cf. règle RGPD)
+et il est vidé dès que le contenu du dossier docs/ change.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Similarité cosinus minimale pour réutiliser une réponse
+DEFAULT_THRESHOLD = float(os.getenv("RAG_CACHE_THRESHOLD", "0.92"))
+# Nombre maximum de réponses conservées (0 désactive le cache)
+DEFAULT_MAX_ENTRIES = int(os.getenv("RAG_CACHE_SIZE", "256"))
+# Durée de vie d'une réponse (secondes)
+DEFAULT_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))
+
+# Intervalle minimal (secondes) entre deux vérifications du dossier docs/
+_DOCS_CHECK_INTERVAL = 30.0
+
+
+def docs_fingerprint(docs_dir: Path) -> Tuple:
+    """Empreinte (chemin, taille, date de modification) de tous les fichiers de docs/."""
+    return tuple(sorted(
+        (str(path), path.stat().st_size, path.stat().st_mtime_ns)
+        for path in Path(docs_dir).rglob('*') if path.is_file()
+    ))
+
+
+class SemanticCache:
+    """
+    Cache LRU/TTL de réponses indexé par l'embedding normalisé de la question.
+
+    Args:
+        embed_model: Modèle d'embedding LlamaIndex (le même que celui de l'index)
+        docs_dir: Dossier surveillé ; tout changement vide le cache
+        threshold: Similarité cosinus minimale pour un succès
+        max_entries: Capacité maximale (éviction LRU au-delà)
+        ttl: Durée de vie d'une réponse en secondes
+    """
+
+    def __init__(
+        self,
+        embed_model: Any,
+        docs_dir: Optional[Path] = None,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL
+    ):
+        self.embed_model = embed_model
+        self.docs_dir = docs_dir
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._vectors: Optional[np.ndarray] = None
+        # emplacement dans _vectors -> (réponse, expiration), ordonné du moins au plus récent
+        self._entries: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()
+        self._free_slots: List[int] = list(range(max_entries))
+        self._fingerprint = docs_fingerprint(docs_dir) if docs_dir else None
+        self._checked_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'size': len(self._entries),
+        }
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries))
+        self.invalidations += 1
+        logger.info("Semantic answer cache invalidated")
+
+    def _check_docs(self) -> None:
+        if self.docs_dir is None or time.monotonic() - self._checked_at < _DOCS_CHECK_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        fingerprint = docs_fingerprint(self.docs_dir)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.clear()
+
+    async def embed(self, query: str) -> List[float]:
+        # Calcul CPU bloquant (les modèles n'offrent pas tous un embedding asynchrone) : exécuté dans un thread
+        return await asyncio.to_thread(self.embed_model.get_query_embedding, query)
+
+    def lookup(self, query_embedding: List[float]) -> Optional[str]:
+        """Renvoie la réponse d'une question similaire, ou None."""
+        self._check_docs()
+        # Une réponse expirée ne doit pas masquer une réponse valide moins proche
+        self._evict_expired()
+        if not self._entries:
+            self.misses += 1
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        slots = list(self._entries)
+        scores = self._vectors[slots] @ query
+        best = int(np.argmax(scores))
+        slot = slots[best]
+        answer, _ = self._entries[slot]
+
+        if scores[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(slot)
+        self.hits += 1
+        logger.info(f"Semantic cache hit (similarity {scores[best]:.3f}), stats: {self.stats()}")
+        return answer
+
+    def store(self, query_embedding: List[float], answer: str) -> None:
+        """Mémorise une réponse, en évinçant la moins récemment utilisée si le cache est plein."""
+        if not self.enabled:
+            return
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+        if not self._free_slots:
+            self._evict_expired()
+        if not self._free_slots:
+            self._evict(next(iter(self._entries)))
+            self.evictions += 1
+        slot = self._free_slots.pop()
+        self._vectors[slot] = query
+        self._entries[slot] = (answer, time.monotonic() + self.ttl)
+
+    def _evict(self, slot: int) -> None:
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for slot in [slot for slot, (_, expires_at) in self._entries.items() if expires_at < now]:
+            self._evict(slot)
@@ -0,0 +1,226 @@
+"""
+Recherche de créneaux libres respectant les contraintes exprimées par le patient.
+
+Les contraintes ("seulement le mardi et le jeudi", "pas le matin", "après 17h")
+sont extraites du texte libre, puis les plages d'ouverture du cabinet sont
+parcourues jour par jour en une seule passe sur l'index des créneaux occupés.
+"""
+
+import re
+import unicodedata
+from datetime import datetime, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from availability_cache import TIMEZONE, BusyIndex, to_aware
+
+# Durée d'un rendez-vous
+SLOT_DURATION = timedelta(minutes=30)
+
+# Horaires d'ouverture du cabinet : jour de la semaine (0 = lundi) -> plages
+OPENING_HOURS: Dict[int, List[Tuple[time, time]]] = {
+    0: [(time(8, 0), time(12, 0)), (time(14, 0), time(19, 0))],
+    1: [(time(8, 0), time(12, 0)), (time(14, 0), time(19, 0))],
+    2: [(time(8, 0), time(12, 0)), (time(14, 0), time(19, 0))],
+    3: [(time(8, 0), time(12, 0)), (time(14, 0), time(19, 0))],
+    4: [(time(8, 0), time(12, 0)), (time(14, 0), time(19, 0))],
+    5: [(time(9, 0), time(12, 0))],
+}
+
+# Moments de la journée reconnus dans les préférences
+DAY_PERIODS: Dict[str, Tuple[time, time]] = {
+    'matin': (time(0, 0), time(12, 0)),
+    'midi': (time(12, 0), time(14, 0)),
+    'apres-midi': (time(12, 0), time(18, 0)),
+    'soir': (time(17, 0), time(23, 59)),
+}
+
+_WEEKDAYS = {
+    'lundi': 0, 'mardi': 1, 'mercredi': 2, 'jeudi': 3, 'vendredi': 4, 'samedi': 5, 'dimanche': 6,
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+_PERIOD_ALIASES = {
+    'matin': 'matin', 'matinee': 'matin', 'morning': 'matin',
+    'midi': 'midi', 'lunch': 'midi',
+    'apres-midi': 'apres-midi', 'aprem': 'apres-midi', 'afternoon': 'apres-midi',
+    'soir': 'soir', 'soiree': 'soir', 'evening': 'soir',
+}
+
+_NEGATION = r"\b(?:pas|sauf|jamais|hors|excepte|ni|not|except|no|nor)\b(?:\W+\w+){0,2}?\W+"
+# "apres-midi" s'écrit aussi sans trait d'union ; les plus longs d'abord ("apres midi" avant "midi")
+_WORD_RE = re.compile(
+    r"(?P<neg>" + _NEGATION + r")?"
+    r"\b(?P<word>" + "|".join(
+        word.replace('-', '[- ]') for word in sorted(list(_WEEKDAYS) + list(_PERIOD_ALIASES), key=len, reverse=True)
+    ) + r")s?\b"
+)
+# Entre deux termes, seuls des liaisons prolongent une négation ("pas lundi ni mardi", "pas le lundi ou le mardi")
+_CONNECTORS_RE = re.compile(r"^(?:[\s']|\b(?:ni|ou|et|or|and|nor|le|la|les|l|the|on)\b)*$")
+# Heure : "17h", "17 heures 30", "17:30", "5pm", "5:30 pm"
+_HOUR = (
+    r"(?P<h>\d{1,2})(?:\s*(?P<unit>heures?|h|:)\s*(?P<m>\d{2})?)?"
+    r"\s*(?P<ampm>am|pm|a\.m\.|p\.m\.)?(?!\w)"
+)
+_BOUND_NEGATION = r"(?P<neg>\b(?:pas|jamais|not|never)\s+)?"
+_AFTER_RE = re.compile(_BOUND_NEGATION + r"\b(?:apres|a partir de|des|after|from)\s+" + _HOUR)
+_BEFORE_RE = re.compile(_BOUND_NEGATION + r"\b(?:avant|jusqu'a|before|until)\s+" + _HOUR)
+
+
+def _normalize(text: str) -> str:
+    """Minuscules sans accents (ex: 'Après-midi' -> 'apres-midi')."""
+    text = unicodedata.normalize('NFKD', text.lower().replace('’', "'"))
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+class SlotConstraints:
+    """Contraintes de jours et d'heures extraites des préférences du patient."""
+
+    def __init__(
+        self,
+        weekdays: Optional[Set[int]] = None,
+        excluded_weekdays: Optional[Set[int]] = None,
+        periods: Optional[List[Tuple[time, time]]] = None,
+        excluded_periods: Optional[List[Tuple[time, time]]] = None,
+        not_before: Optional[time] = None,
+        not_after: Optional[time] = None
+    ):
+        self.weekdays = weekdays or set()
+        self.excluded_weekdays = excluded_weekdays or set()
+        self.periods = periods or []
+        self.excluded_periods = excluded_periods or []
+        self.not_before = not_before
+        self.not_after = not_after
+
+    def accepts_day(self, weekday: int) -> bool:
+        if weekday in self.excluded_weekdays:
+            return False
+        return not self.weekdays or weekday in self.weekdays
+
+    def accepts_time(self, start: time, end: time) -> bool:
+        if self.not_before and start < self.not_before:
+            return False
+        if self.not_after and end > self.not_after:
+            return False
+        if any(start < p_end and end > p_start for p_start, p_end in self.excluded_periods):
+            return False
+        return not self.periods or any(p_start <= start and end <= p_end for p_start, p_end in self.periods)
+
+
+def parse_slot_preferences(text: str) -> SlotConstraints:
+    """
+    Extrait les contraintes de jours et d'heures d'une phrase en langage naturel.
+
+    Args:
+        text: Préférences du patient (ex: "mardi ou jeudi, pas le matin", "après 17h")
+
+    Returns:
+        SlotConstraints (vide si aucune contrainte n'est reconnue)
+    """
+    constraints = SlotConstraints()
+    normalized = _normalize(text or '')
+
+    negating, previous_end = False, 0
+    for match in _WORD_RE.finditer(normalized):
+        word = match.group('word').replace(' ', '-')
+        # La négation porte aussi sur les termes qui suivent, reliés par "ni", "ou", "et"...
+        negating = bool(match.group('neg')) or (
+            negating and _CONNECTORS_RE.match(normalized[previous_end:match.start()]) is not None
+        )
+        negated, previous_end = negating, match.end()
+        if word in _WEEKDAYS:
+            target = constraints.excluded_weekdays if negated else constraints.weekdays
+            target.add(_WEEKDAYS[word])
+        else:
+            period = DAY_PERIODS[_PERIOD_ALIASES[word]]
+            target = constraints.excluded_periods if negated else constraints.periods
+            target.append(period)
+
+    # "après 17h" fixe le début au plus tôt, "pas après 17h" la fin au plus tard (et inversement)
+    for pattern, is_after in ((_AFTER_RE, True), (_BEFORE_RE, False)):
+        for match in pattern.finditer(normalized):
+            bound = _hour(match)
+            if bound is None:
+                continue
+            if is_after != bool(match.group('neg')):
+                constraints.not_before = bound
+            else:
+                constraints.not_after = bound
+            break
+    return constraints
+
+
+def _hour(match: re.Match) -> Optional[time]:
+    """Heure d'une correspondance de _HOUR, None pour un nombre seul ("après 2 semaines")."""
+    if not match.group('unit') and not match.group('ampm'):
+        return None
+    hour, minute = int(match.group('h')), int(match.group('m') or 0)
+    ampm = (match.group('ampm') or '').replace('.', '')
+    if ampm == 'pm' and hour < 12:
+        hour += 12
+    elif ampm == 'am' and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def _align(dt: datetime, step: timedelta) -> datetime:
+    """Arrondit à la demi-heure (ou au pas donné) supérieure."""
+    midnight = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    steps = -(-(dt - midnight) // step)
+    return midnight + steps * step
+
+
+def find_free_slots(
+    busy: BusyIndex,
+    start: datetime,
+    end: datetime,
+    constraints: Optional[SlotConstraints] = None,
+    limit: int = 3,
+    duration: timedelta = SLOT_DURATION,
+    opening_hours: Optional[Dict[int, List[Tuple[time, time]]]] = None
+) -> List[datetime]:
+    """
+    Renvoie les premiers créneaux libres (par ordre chronologique) entre start et end.
+
+    Args:
+        busy: Index des créneaux occupés couvrant la période
+        start: Début de la recherche
+        end: Fin de la recherche
+        constraints: Contraintes de jours/heures du patient
+        limit: Nombre maximum de créneaux renvoyés
+        duration: Durée d'un rendez-vous
+        opening_hours: Plages d'ouverture (par défaut OPENING_HOURS)
+
+    Returns:
+        Liste des débuts de créneaux libres, en heure locale du cabinet (TIMEZONE)
+    """
+    constraints = constraints or SlotConstraints()
+    opening_hours = OPENING_HOURS if opening_hours is None else opening_hours
+    start, end = to_aware(start).astimezone(TIMEZONE), to_aware(end).astimezone(TIMEZONE)
+    slots: List[datetime] = []
+
+    day = start.date()
+    while day <= end.date() and len(slots) < limit:
+        if constraints.accepts_day(day.weekday()):
+            for open_at, close_at in opening_hours.get(day.weekday(), []):
+                range_start = max(datetime.combine(day, open_at, TIMEZONE), start)
+                range_end = min(datetime.combine(day, close_at, TIMEZONE), end)
+                if range_end - range_start < duration:
+                    continue
+                # Les intervalles occupés de la plage, triés, parcourus une seule fois
+                busy_intervals = iter(busy.busy_between(range_start, range_end))
+                current_busy = next(busy_intervals, None)
+                candidate = _align(range_start, duration)
+                while candidate + duration <= range_end and len(slots) < limit:
+                    while current_busy and current_busy[1] <= candidate:
+                        current_busy = next(busy_intervals, None)
+                    if current_busy and current_busy[0] < candidate + duration:
+                        # Saute directement après l'occupation en cours, en heure locale : les
+                        # intervalles de Google Calendar sont en UTC ("Z")
+                        candidate = _align(current_busy[1].astimezone(TIMEZONE), duration)
+                        continue
+                    if constraints.accepts_time(candidate.time(), (candidate + duration).time()):
+                        slots.append(candidate.astimezone(TIMEZONE))
+                    candidate += duration
+        day += timedelta(days=1)
+    return slots
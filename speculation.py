@@ -0,0 +1,315 @@
+"""
+Exécution spéculative des outils pendant que l'appelant parle.
+
+Les transcriptions intermédiaires de Deepgram (`user_input_transcribed`)
+permettent de lancer avant la fin du tour le travail que le LLM demandera
+probablement :
+
+- query_info : embedding de la phrase en cours puis recherche dans la base
+  documentaire ; la réponse est réutilisée si la requête finale du LLM est
+  assez proche (similarité cosinus). En mode "synthesis", la synthèse LLM
+  n'est lancée qu'une fois par tour, sur la transcription finale : une
+  génération annulée a déjà coûté. Les phrases qui citent une date ou parlent
+  de rendez-vous ne déclenchent pas de recherche
+- availability : lecture des créneaux occupés du jour cité ("mardi prochain",
+  "le 2 juillet") ; book_appointment et reschedule_appointment la réutilisent
+  si le rendez-vous demandé tombe ce jour-là
+
+Une transcription doit rester stable SPECULATIVE_DEBOUNCE secondes avant tout
+lancement ; une nouvelle phrase annule la recherche en cours. Chaque exécution
+est comptée dans les traces de latence : réutilisée (hit), absente ou
+inutilisable au moment de l'appel d'outil (miss), annulée (cancelled), terminée
+mais jamais réutilisée (wasted).
+
+Mode optionnel : SPECULATIVE_TOOLS="query_info,availability" (vide = désactivé).
+Rien n'est conservé au-delà de SPECULATIVE_TTL secondes ni écrit sur disque.
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+from datetime import time as dt_time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from fr_datetime import normalize_text, parse_mentioned_day
+
+logger = logging.getLogger(__name__)
+
+# Outils exécutés par anticipation : "query_info", "availability" (vide = mode désactivé)
+SPECULATIVE_TOOLS = {tool.strip() for tool in os.getenv("SPECULATIVE_TOOLS", "").split(",") if tool.strip()}
+# Stabilité (secondes) d'une transcription intermédiaire avant lancement
+SPECULATIVE_DEBOUNCE = float(os.getenv("SPECULATIVE_DEBOUNCE", "0.25"))
+# Nombre minimal de mots avant de lancer une recherche documentaire
+SPECULATIVE_MIN_WORDS = int(os.getenv("SPECULATIVE_MIN_WORDS", "3"))
+# Durée de validité (secondes) d'un résultat spéculatif
+SPECULATIVE_TTL = float(os.getenv("SPECULATIVE_TTL", "15"))
+# Similarité cosinus minimale entre la phrase de l'appelant et la requête du LLM
+SPECULATIVE_RAG_THRESHOLD = float(os.getenv("SPECULATIVE_RAG_THRESHOLD", "0.8"))
+
+QUERY_INFO = "query_info"
+AVAILABILITY = "availability"
+
+# Phrases de prise, report ou annulation de rendez-vous : pas de recherche documentaire anticipée
+_SCHEDULING_RE = re.compile(
+    r"\b(?:rendez-vous|rdv|annul\w*|deplac\w*|report\w*|reserv\w*|creneaux?|disponibles?|dispo)\b"
+)
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+Answerer = Callable[[str, List[float]], Awaitable[str]]
+
+# Spéculation de la session en cours, lue par les outils de prompts.py
+_current: ContextVar[Optional["Speculation"]] = ContextVar("speculation", default=None)
+
+
+def current_speculation() -> Optional["Speculation"]:
+    return _current.get()
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+
+
+class _Pending:
+    """Une exécution spéculative en cours ou terminée."""
+
+    def __init__(self, kind: str, key: Any, task: asyncio.Task, embedding_task: Optional[asyncio.Task] = None):
+        self.kind = kind
+        self.key = key
+        self.task = task
+        # query_info : embedding de la phrase, calculé avant la recherche
+        self.embedding_task = embedding_task
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        task.add_done_callback(self._on_done)
+        if embedding_task is not None:
+            embedding_task.add_done_callback(self._consume_error)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        self.finished_at = time.monotonic()
+        self._consume_error(task)
+
+    def _consume_error(self, task: asyncio.Task) -> None:
+        # Un échec spéculatif n'est signalé qu'à l'outil qui réclame le résultat
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Speculative {self.kind} failed: {task.exception()}")
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.started_at > SPECULATIVE_TTL
+
+    def cancel(self) -> None:
+        self.task.cancel()
+        if self.embedding_task is not None:
+            self.embedding_task.cancel()
+
+    def saved(self) -> float:
+        """Travail déjà fait au moment de l'appel d'outil."""
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class Speculation:
+    """
+    Exécutions spéculatives d'une session, alimentées par les transcriptions intermédiaires.
+
+    Args:
+        tools: Types d'exécution activés (QUERY_INFO, AVAILABILITY)
+        tracer: TurnTracer de la session (comptage des issues)
+    """
+
+    def __init__(self, tools: Set[str] = SPECULATIVE_TOOLS, tracer=None):
+        self.tools = set(tools)
+        self.tracer = tracer
+        self.outcomes: Counter = Counter()
+        self._embed: Optional[Embedder] = None
+        self._answer: Optional[Answerer] = None
+        self._synthesis = False
+        # Synthèse déjà lancée pendant le tour en cours (une au plus)
+        self._synthesis_launched = False
+        self._retrieval: Optional[_Pending] = None
+        self._days: Dict[date, _Pending] = {}
+        self._debounce: Optional[asyncio.Task] = None
+        self._last_text = ""
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tools)
+
+    @property
+    def retrieval_enabled(self) -> bool:
+        return QUERY_INFO in self.tools and self._answer is not None
+
+    def register_retrieval(self, embed: Embedder, answer: Answerer, synthesis: bool = False) -> None:
+        """
+        Branche la recherche documentaire de query_info (voir create_query_info_tool).
+
+        Args:
+            embed: Embedding de la phrase de l'appelant
+            answer: Réponse de query_info pour cette phrase
+            synthesis: `answer` appelle un LLM : une seule exécution par tour, sur la transcription finale
+        """
+        self._embed = embed
+        self._answer = answer
+        self._synthesis = synthesis
+
+    def activate(self) -> None:
+        """Rend la spéculation visible des outils exécutés dans le contexte courant."""
+        _current.set(self)
+
+    def attach(self, session) -> None:
+        """Écoute les transcriptions de la session et rend la spéculation visible des outils."""
+        self.activate()
+
+        @session.on("user_input_transcribed")
+        def _on_transcript(ev) -> None:
+            self.on_transcript(ev.transcript, ev.is_final)
+
+        @session.on("conversation_item_added")
+        def _on_item(ev) -> None:
+            self.end_turn()
+
+        @session.on("close")
+        def _on_close(ev) -> None:
+            self.close()
+
+    # -------------------- lancement --------------------
+
+    def end_turn(self) -> None:
+        """Fin du tour (message ajouté à la conversation) : une nouvelle synthèse est permise."""
+        self._synthesis_launched = False
+
+    def on_transcript(self, text: str, is_final: bool = False) -> None:
+        text = " ".join(text.split())
+        if not self.enabled or not text:
+            return
+        # Une transcription finale identique à la dernière partielle peut encore lancer la synthèse
+        if text == self._last_text and not (is_final and self._synthesis and not self._synthesis_launched):
+            return
+        self._last_text = text
+        if self._debounce is not None:
+            self._debounce.cancel()
+        delay = 0.0 if is_final else SPECULATIVE_DEBOUNCE
+        self._debounce = asyncio.create_task(self._launch_after(text, delay, is_final))
+
+    async def _launch_after(self, text: str, delay: float, is_final: bool = False) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        self._launch(text, is_final)
+
+    def _launch(self, text: str, is_final: bool = False) -> None:
+        for day in [day for day, pending in self._days.items() if pending.expired]:
+            self._discard(self._days.pop(day))
+
+        day = parse_mentioned_day(text)
+        if AVAILABILITY in self.tools and day is not None and day not in self._days:
+            self._days[day] = _Pending(AVAILABILITY, day, asyncio.create_task(self._prefetch_day(day)))
+
+        # Une date ou un mot de gestion de rendez-vous annonce un outil d'agenda, pas query_info
+        question = day is None and not _SCHEDULING_RE.search(normalize_text(text))
+        # Synthèse LLM : une seule par tour, sur la phrase complète
+        allowed = not self._synthesis or (is_final and not self._synthesis_launched)
+        if self.retrieval_enabled and question and allowed and len(text.split()) >= SPECULATIVE_MIN_WORDS:
+            # La phrase a changé : la recherche précédente ne servira plus
+            self._discard(self._retrieval)
+            self._synthesis_launched = self._synthesis
+            embedding_task = asyncio.create_task(self._embed(text))
+            task = asyncio.create_task(self._retrieve(text, embedding_task))
+            self._retrieval = _Pending(QUERY_INFO, text, task, embedding_task)
+
+    async def _retrieve(self, text: str, embedding_task: asyncio.Task) -> str:
+        return await self._answer(text, await embedding_task)
+
+    async def _prefetch_day(self, day: date):
+        from calendar_service import get_calendar_service
+
+        start = datetime.combine(day, dt_time.min)
+        return await get_calendar_service().prefetch_busy_intervals(start, start + timedelta(days=1))
+
+    # -------------------- réutilisation par les outils --------------------
+
+    async def claim_answer(self, query_embedding: List[float]) -> Optional[str]:
+        """Réponse spéculative de query_info si la requête du LLM est assez proche, sinon None."""
+        if not self.retrieval_enabled:
+            return None
+        pending, self._retrieval = self._retrieval, None
+        if pending is None or pending.expired:
+            self._discard(pending)
+            self._record(QUERY_INFO, "miss")
+            return None
+        try:
+            # Embedding de la phrase éventuellement encore en cours : quelques ms au plus
+            similarity = _cosine(query_embedding, await pending.embedding_task)
+            if similarity < SPECULATIVE_RAG_THRESHOLD:
+                self._discard(pending)
+                self._record(QUERY_INFO, "miss")
+                return None
+            saved = pending.saved()
+            answer = await pending.task
+        except Exception as e:
+            logger.warning(f"Speculative retrieval failed: {e}")
+            self._record(QUERY_INFO, "miss")
+            return None
+        logger.info(f"Speculative query_info reused (similarity {similarity:.3f}, {saved * 1000:.0f} ms ahead)")
+        self._record(QUERY_INFO, "hit", saved)
+        return answer
+
+    async def claim_busy(self, day: date):
+        """
+        Créneaux occupés lus par anticipation pour ce jour.
+
+        Returns:
+            BusyIndex du jour, ou None (rien d'anticipé, ou cache local rafraîchi
+            qui répondra directement)
+        """
+        if AVAILABILITY not in self.tools:
+            return None
+        pending = self._days.pop(day, None)
+        if pending is None or pending.expired:
+            self._discard(pending)
+            self._record(AVAILABILITY, "miss")
+            return None
+        try:
+            saved = pending.saved()
+            busy = await pending.task
+        except Exception as e:
+            logger.warning(f"Speculative availability prefetch failed: {e}")
+            self._record(AVAILABILITY, "miss")
+            return None
+        self._record(AVAILABILITY, "hit", saved)
+        return busy
+
+    # -------------------- comptage --------------------
+
+    def _discard(self, pending: Optional[_Pending]) -> None:
+        """Abandonne une exécution : annulée si encore en cours, gaspillée sinon."""
+        if pending is None:
+            return
+        if pending.task.done():
+            self._record(pending.kind, "wasted")
+        else:
+            pending.cancel()
+            self._record(pending.kind, "cancelled")
+
+    def _record(self, kind: str, outcome: str, saved: Optional[float] = None) -> None:
+        self.outcomes[(kind, outcome)] += 1
+        if self.tracer is not None:
+            self.tracer.record_speculation(kind, outcome, saved)
+
+    def close(self) -> None:
+        if self._debounce is not None:
+            self._debounce.cancel()
+        self._discard(self._retrieval)
+        self._retrieval = None
+        for pending in self._days.values():
+            self._discard(pending)
+        self._days.clear()
+        if self.outcomes:
+            summary = ", ".join(f"{kind} {outcome} {n}" for (kind, outcome), n in sorted(self.outcomes.items()))
+            logger.info(f"Speculation summary: {summary}")
@@ -0,0 +1,262 @@
+"""
+Plusieurs cabinets servis par le même pool de workers.
+
+Chaque cabinet (tenant) a son dossier `tenants/<id>/` :
+
+    tenants/<id>/
+        tenant.json             # agenda, praticien, accueil et consignes propres au cabinet
+        docs/                   # base documentaire du cabinet
+        faq_paraphrases.json    # questions types du routeur FAQ (facultatif : sans lui, pas de routage)
+        query-engine-storage/   # index publié par : python indexer.py --docs-dir tenants/<id>/docs
+                                #                    --persist-dir tenants/<id>/query-engine-storage
+
+L'identifiant du cabinet vient des métadonnées de dispatch du job
+(`{"tenant": "<id>"}`), sinon du préfixe du nom de la room (`<id>_...`) ; un
+appel sans cabinet est servi par la configuration par défaut (.env, docs/,
+query-engine-storage/). Un cabinet désigné mais inconnu est refusé
+(UnknownTenantError) : l'appel n'est jamais servi sur l'agenda d'un autre cabinet.
+
+`TenantRegistry` charge les ressources d'un cabinet (index RAG, cache des
+réponses, service d'agenda) au premier appel et les garde dans un LRU : au-delà
+de TENANT_INDEX_BUDGET_MB d'index chargés (taille sur disque des générations
+publiées), les cabinets sans appel en cours les moins récemment servis sont
+libérés. Le modèle d'embedding, le VAD et le
+détecteur de fin de tour restent partagés par tous les cabinets.
+"""
+
+import os
+import re
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from calendar_service import CALENDAR_BACKEND, CalendarBackend, create_calendar_service, use_calendar_service
+from knowledge_base import DOCS_DIR, PERSIST_DIR, LazyIndex, resolve_store_dir
+from prompts import GREETING, INSTRUCTIONS
+from semantic_cache import SemanticCache
+
+logger = logging.getLogger(__name__)
+
+# Dossier des cabinets (un sous-dossier par cabinet)
+TENANTS_DIR = Path(os.getenv("TENANTS_DIR", Path(__file__).parent / "tenants"))
+# Taille sur disque maximale des index de cabinets gardés chargés (Mo) ; le cabinet par défaut n'est jamais libéré
+TENANT_INDEX_BUDGET_MB = float(os.getenv("TENANT_INDEX_BUDGET_MB", "1024"))
+
+TENANT_CONFIG_FILE = "tenant.json"
+DEFAULT_TENANT = "default"
+# Identifiant utilisable comme nom de dossier (pas de chemin relatif dans les métadonnées)
+_TENANT_ID_RE = re.compile(r"^[a-z0-9][a-z0-9-]*$")
+
+
+class UnknownTenantError(LookupError):
+    """Cabinet désigné par l'appel mais absent de TENANTS_DIR (ou identifiant invalide)."""
+
+
+class TenantConfig:
+    """
+    Configuration d'un cabinet.
+
+    Args:
+        tenant_id: Identifiant du cabinet (nom de son dossier)
+        docs_dir: Base documentaire
+        persist_dir: Index publié par indexer.py
+        settings: Contenu de tenant.json (calendar_id, practitioner, greeting, instructions)
+    """
+
+    def __init__(self, tenant_id: str, docs_dir: Path, persist_dir: Path, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.tenant_id = tenant_id
+        self.docs_dir = docs_dir
+        self.persist_dir = persist_dir
+        self.calendar_id: Optional[str] = settings.get("calendar_id")
+        self.practitioner: Optional[str] = settings.get("practitioner")
+        self.greeting: str = settings.get("greeting") or GREETING
+        # Consignes propres au cabinet (horaires, spécialité...) ajoutées aux consignes communes
+        extra = settings.get("instructions")
+        self.instructions: str = f"{INSTRUCTIONS}\n\n{extra}" if extra else INSTRUCTIONS
+
+    @classmethod
+    def default(cls) -> "TenantConfig":
+        """Cabinet unique historique : .env, docs/ et query-engine-storage/."""
+        return cls(DEFAULT_TENANT, DOCS_DIR, PERSIST_DIR)
+
+    def missing_settings(self) -> List[str]:
+        """Réglages d'agenda absents de tenant.json (sinon l'agenda du .env, celui du cabinet par défaut, serait utilisé)."""
+        if CALENDAR_BACKEND == 'sqlite':
+            from db_driver import CALENDAR_SYNC_INTERVAL
+            required = {'practitioner': self.practitioner}
+            if CALENDAR_SYNC_INTERVAL > 0:
+                required['calendar_id'] = self.calendar_id
+        else:
+            required = {'calendar_id': self.calendar_id}
+        return [name for name, value in required.items() if not value]
+
+    @classmethod
+    def load(cls, tenant_id: str, tenants_dir: Path = TENANTS_DIR) -> Optional["TenantConfig"]:
+        """
+        Configuration de tenants/<id>/, None si l'identifiant est invalide ou inconnu.
+
+        Raises:
+            ValueError: tenant.json ne désigne pas l'agenda du cabinet
+        """
+        if not _TENANT_ID_RE.match(tenant_id):
+            return None
+        root = Path(tenants_dir) / tenant_id
+        try:
+            with open(root / TENANT_CONFIG_FILE, encoding='utf-8') as f:
+                settings = json.load(f)
+        except FileNotFoundError:
+            return None
+        config = cls(tenant_id, root / "docs", root / "query-engine-storage", settings)
+        missing = config.missing_settings()
+        if missing:
+            raise ValueError(f"{root / TENANT_CONFIG_FILE} is missing {', '.join(missing)} (calendar backend '{CALENDAR_BACKEND}')")
+        return config
+
+
+class Tenant:
+    """Ressources chargées d'un cabinet : index RAG, cache des réponses et service d'agenda."""
+
+    def __init__(self, config: TenantConfig, embed_model: Any, index: Optional[LazyIndex] = None):
+        self.config = config
+        self.index = index or LazyIndex(persist_dir=config.persist_dir, docs_dir=config.docs_dir)
+        self.answer_cache = SemanticCache(embed_model, docs_dir=config.docs_dir)
+        # Une nouvelle génération de l'index rend les réponses mémorisées obsolètes
+        self.index.add_reload_listener(self.answer_cache.clear)
+        self._calendar: Optional[CalendarBackend] = None
+        self._preload: Optional[asyncio.Task] = None
+        # Appels en cours : un cabinet servi n'est jamais libéré
+        self.active_calls = 0
+
+    @property
+    def tenant_id(self) -> str:
+        return self.config.tenant_id
+
+    @property
+    def calendar(self) -> CalendarBackend:
+        if self._calendar is None:
+            self._calendar = create_calendar_service(self.config.calendar_id, self.config.practitioner)
+        return self._calendar
+
+    def preload(self) -> None:
+        """Charge l'index en tâche de fond (pendant l'accueil) plutôt qu'à la première question."""
+        if self.index.is_loaded or self._preload is not None:
+            return
+
+        def _done(task: asyncio.Task) -> None:
+            if not task.cancelled() and task.exception() is not None:
+                # Nouvelle tentative à la première question (LazyIndex.aget)
+                self._preload = None
+                logger.warning(f"Tenant '{self.tenant_id}' index preload failed: {task.exception()}")
+
+        self._preload = asyncio.get_running_loop().create_task(self.index.aget())
+        self._preload.add_done_callback(_done)
+
+    def index_bytes(self) -> int:
+        """Taille sur disque de l'index chargé (docstore, vecteurs, BM25...), 0 s'il n'est pas chargé."""
+        if not self.index.is_loaded:
+            return 0
+        store_dir = resolve_store_dir(self.config.persist_dir)
+        return sum(path.stat().st_size for path in store_dir.iterdir() if path.is_file())
+
+    def close(self) -> None:
+        if self._calendar is not None:
+            self._calendar.close()
+
+
+class TenantRegistry:
+    """
+    LRU des cabinets chargés par le processus.
+
+    Args:
+        embed_model: Modèle d'embedding partagé par tous les cabinets
+        default: Cabinet par défaut (préchargé, jamais libéré)
+        tenants_dir: Dossier des cabinets
+        index_budget_mb: Taille sur disque maximale des index chargés des autres cabinets
+    """
+
+    def __init__(
+        self,
+        embed_model: Any,
+        default: Tenant,
+        tenants_dir: Path = TENANTS_DIR,
+        index_budget_mb: float = TENANT_INDEX_BUDGET_MB
+    ):
+        self.embed_model = embed_model
+        self.default = default
+        self.tenants_dir = Path(tenants_dir)
+        self.index_budget = index_budget_mb * 1024 * 1024
+        self._tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def resolve(self, job_metadata: Optional[str] = None, room_name: str = "") -> str:
+        """Identifiant du cabinet d'un appel : métadonnées de dispatch, sinon préfixe du nom de la room."""
+        if job_metadata:
+            try:
+                tenant_id = json.loads(job_metadata).get("tenant")
+            except (ValueError, AttributeError):
+                tenant_id = None
+            if tenant_id:
+                return str(tenant_id)
+        prefix = room_name.split("_", 1)[0]
+        if prefix != room_name and _TENANT_ID_RE.match(prefix) and (self.tenants_dir / prefix / TENANT_CONFIG_FILE).exists():
+            return prefix
+        return DEFAULT_TENANT
+
+    def get(self, tenant_id: str) -> Tenant:
+        """
+        Ressources du cabinet, chargées au premier appel.
+
+        Raises:
+            UnknownTenantError: Aucun cabinet de ce nom dans TENANTS_DIR
+            ValueError: tenant.json ne désigne pas l'agenda du cabinet
+        """
+        if tenant_id == DEFAULT_TENANT:
+            return self.default
+        tenant = self._tenants.get(tenant_id)
+        if tenant is not None:
+            self._tenants.move_to_end(tenant_id)
+            return tenant
+        config = TenantConfig.load(tenant_id, self.tenants_dir)
+        if config is None:
+            # Le cabinet par défaut prendrait des rendez-vous dans un autre agenda que celui de l'appelant
+            raise UnknownTenantError(f"Unknown tenant '{tenant_id}'")
+        tenant = self._tenants[tenant_id] = Tenant(config, self.embed_model)
+        logger.info(f"Tenant '{tenant_id}' registered ({len(self._tenants)} loaded)")
+        return tenant
+
+    def acquire(self, tenant_id: str) -> Tenant:
+        """
+        Cabinet d'un nouvel appel : son agenda devient celui de `get_calendar_service()`
+        dans le contexte courant. À rendre avec `release` à la fin de l'appel.
+        """
+        self._evict()
+        tenant = self.get(tenant_id)
+        tenant.active_calls += 1
+        use_calendar_service(None if tenant is self.default else tenant.calendar)
+        return tenant
+
+    def release(self, tenant: Tenant) -> None:
+        tenant.active_calls -= 1
+        self._evict()
+
+    def index_bytes(self) -> int:
+        return sum(tenant.index_bytes() for tenant in self._tenants.values())
+
+    def _evict(self) -> None:
+        # Du moins au plus récemment servi, en épargnant les cabinets en cours d'appel
+        used = self.index_bytes()
+        for tenant_id, tenant in list(self._tenants.items()):
+            if used <= self.index_budget:
+                return
+            if tenant.active_calls:
+                continue
+            used -= tenant.index_bytes()
+            del self._tenants[tenant_id]
+            tenant.close()
+            logger.info(f"Tenant '{tenant_id}' evicted ({used / 1024 / 1024:.0f} MB still loaded)")
@@ -54,15 +54,14 @@ async def test_calendar_service():
         
         # Test 1 : Récupérer les événements existants
         print("📅 Test 1 : Récupération des événements...")
-        appointments = await calendar_service.get_appointments()
+        appointments = [apt async for apt in calendar_service.get_appointments()]
         print(f"✅ {len(appointments)} événements trouvés")
         
         if appointments:
             print("   Derniers événements :")
             for i, apt in enumerate(appointments[:3]):  # Afficher les 3 premiers
-                start = apt.get('start', {}).get('dateTime', 'Date non définie')
-                summary = apt.get('summary', 'Sans titre')
-                print(f"   - {summary} ({start})")
+                start = apt.get('start') or 'Date non définie'
+                print(f"   - {apt['title']} ({start})")
         print()
         
         # Test 2 : Vérifier la disponibilité
@@ -0,0 +1,42 @@
+"""Tests unitaires de la synchronisation de l'agenda SQLite avec Google Calendar (db_driver.py)."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+
+from availability_cache import TIMEZONE  # noqa: E402
+from calendar_service import GoogleCalendarService  # noqa: E402
+from db_driver import SqliteCalendarService  # noqa: E402
+from fakes import FakeCalendarApi  # noqa: E402
+
+
+def test_push_conflict_is_flagged_once_and_not_retried(tmp_path, caplog):
+    async def scenario():
+        api = FakeCalendarApi()
+        start = (datetime.now(TIMEZONE) + timedelta(days=2)).replace(hour=10, minute=0, second=0, microsecond=0)
+        end = start + timedelta(minutes=30)
+        # Créneau pris côté Google par le secrétariat, pas encore rapatrié
+        api.add_event("Secrétariat", start, end)
+        google = GoogleCalendarService(calendar_id="cabinet", service=api)
+        service = SqliteCalendarService(str(tmp_path / "calendar.db"), "cabinet", google=google, sync_interval=0)
+        try:
+            created = await service.create_appointment("Rendez-vous", start, end)
+
+            assert await service._push() == 0
+            requests = sum(api.requests.values())
+            assert await service._push() == 0
+            assert sum(api.requests.values()) == requests
+            row = service._db.execute("SELECT * FROM appointments WHERE id = ?", (created['id'],)).fetchone()
+            assert row['push_conflict'] == 1 and row['dirty'] == 1
+
+            # Une modification locale lève le conflit : le nouveau créneau est envoyé
+            await service.reschedule_appointment(created['id'], start + timedelta(hours=2), end + timedelta(hours=2))
+            assert await service._push() == 1
+        finally:
+            service.close()
+
+    asyncio.run(scenario())
+    assert sum("conflicts with an event in Google Calendar" in record.message for record in caplog.records) == 1
@@ -0,0 +1,48 @@
+"""Tests unitaires des questions types du routeur FAQ par base documentaire (faq_router.py)."""
+
+import json
+import shutil
+
+import pytest
+
+from faq_router import FAQRouter, paraphrases_file
+from knowledge_base import DOCS_DIR, load_faq_router
+
+
+class _CountingEmbedding:
+    """Embeddings déterministes : une dimension par formulation."""
+
+    def get_text_embedding_batch(self, texts):
+        return [[1.0 if i == j else 0.0 for j in range(len(texts))] for i in range(len(texts))]
+
+
+@pytest.fixture
+def tenant_docs(tmp_path):
+    # Cabinet dont la FAQ reprend celle du cabinet par défaut, sans questions types propres
+    docs_dir = tmp_path / "clinic-a" / "docs"
+    shutil.copytree(DOCS_DIR, docs_dir)
+    return docs_dir
+
+
+def test_default_docs_use_repository_paraphrases():
+    assert paraphrases_file(DOCS_DIR) == DOCS_DIR.parent / "faq_paraphrases.json"
+
+
+def test_tenant_without_paraphrases_is_not_routed(tenant_docs, tmp_path):
+    router = FAQRouter.build(tenant_docs, _CountingEmbedding())
+    assert len(router) == 0
+
+    # Génération publiée avec les questions types d'une autre base : ignorée au chargement
+    store_dir = tmp_path / "store"
+    store_dir.mkdir()
+    FAQRouter.build(DOCS_DIR, _CountingEmbedding()).save(store_dir)
+    assert load_faq_router(store_dir, tenant_docs) is None
+
+
+def test_tenant_paraphrases_are_its_own(tenant_docs):
+    paraphrases_file(tenant_docs).write_text(
+        json.dumps({"Consultation générale": ["Combien coûte une consultation ?"]}), encoding='utf-8'
+    )
+    router = FAQRouter.build(tenant_docs, _CountingEmbedding())
+    assert len(router) == 1
+    assert len(router.row_entries) == 2
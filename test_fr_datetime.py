@@ -0,0 +1,47 @@
+"""Tests unitaires de l'analyse rapide des dates de rendez-vous (fr_datetime.py)."""
+
+from datetime import datetime
+
+import pytest
+
+from fr_datetime import parse_appointment_datetime, parse_mentioned_day
+
+# Mercredi 14 octobre 2026, 9h
+REFERENCE = datetime(2026, 10, 14, 9, 0)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("demain à 15h", datetime(2026, 10, 15, 15, 0)),
+    ("demain 14 heures 30", datetime(2026, 10, 15, 14, 30)),
+    ("demain 14 heure 30", datetime(2026, 10, 15, 14, 30)),
+    ("demain 14h30", datetime(2026, 10, 15, 14, 30)),
+    ("mardi prochain 10h30", datetime(2026, 10, 20, 10, 30)),
+    ("le 2 juillet à 14h", datetime(2027, 7, 2, 14, 0)),
+    ("le 2/11 à 10h", datetime(2026, 11, 2, 10, 0)),
+    ("vendredi à 3 heures de l'après-midi", datetime(2026, 10, 16, 15, 0)),
+    ("2026-11-02T10:00", datetime(2026, 11, 2, 10, 0)),
+    ("à 10h", datetime(2026, 10, 14, 10, 0)),
+])
+def test_recognized(text, expected):
+    assert parse_appointment_datetime(text, REFERENCE) == (True, expected)
+
+
+@pytest.mark.parametrize("text", [
+    "le 15 à 10h",
+    "le 1er à 9h",
+    "la semaine prochaine à 10h",
+    "mardi en huit à 10h",
+    "dans 2 heures",
+])
+def test_unparsed_day_left_to_dateparser(text):
+    # Ne doit pas être compris comme aujourd'hui (ou le jour de la semaine cité)
+    assert parse_appointment_datetime(text, REFERENCE) == (False, None)
+
+
+def test_date_without_time():
+    assert parse_appointment_datetime("mardi prochain", REFERENCE) == (True, None)
+    assert parse_mentioned_day("mardi prochain", REFERENCE) == datetime(2026, 10, 20).date()
+
+
+def test_invalid_date():
+    assert parse_appointment_datetime("le 31/02 à 10h", REFERENCE) == (True, None)
@@ -0,0 +1,18 @@
+"""Tests de non-régression du temps de démarrage : imports du processus principal."""
+
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from import_profiler import DEFERRED_MODULES, eager_imports
+
+
+def test_agent_defers_heavy_imports(monkeypatch):
+    # Même en mode hors ligne strict, un bundle absent n'empêche pas l'import (voir require_bundle)
+    monkeypatch.setenv("MODEL_OFFLINE", "1")
+    assert eager_imports(["agent"]) == []
+
+
+def test_eager_imports_reports_deferred_modules():
+    assert eager_imports(["json", "llama_index.core.schema"]) == ["llama_index"]
+    assert "llama_index" in DEFERRED_MODULES
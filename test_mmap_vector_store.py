@@ -0,0 +1,17 @@
+"""Tests unitaires du vector store NumPy mappé en mémoire (mmap_vector_store.py)."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from mmap_vector_store import MmapVectorStore, write_vectors  # noqa: E402
+
+
+def test_scores_do_not_modify_query_embedding(tmp_path):
+    write_vectors(tmp_path, ["a", "b"], [[1.0, 0.0], [0.0, 2.0]])
+    store = MmapVectorStore.from_persist_dir(tmp_path)
+    query = np.array([3.0, 4.0], dtype=np.float32)
+    scores = store.scores(query)
+    assert query.tolist() == [3.0, 4.0]
+    assert np.allclose(scores, [0.6, 0.8])
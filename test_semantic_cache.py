@@ -0,0 +1,43 @@
+"""Tests unitaires du cache sémantique des réponses (semantic_cache.py)."""
+
+import asyncio
+import time
+
+import numpy as np
+
+from fakes import FakeEmbedding
+from semantic_cache import SemanticCache
+
+
+def test_expired_nearest_entry_does_not_hide_valid_one():
+    cache = SemanticCache(FakeEmbedding(), max_entries=4, ttl=0.01, threshold=0.9)
+    cache.store([1.0, 0.0], "périmée")
+    time.sleep(0.02)
+    cache.ttl = 60
+    cache.store([0.95, 0.3], "valide")
+    assert cache.lookup([1.0, 0.0]) == "valide"
+    assert cache.stats()['size'] == 1
+
+
+def test_expired_entries_free_slots_before_lru_eviction():
+    cache = SemanticCache(FakeEmbedding(), max_entries=2, ttl=0.01)
+    cache.store([1.0, 0.0], "a")
+    cache.store([0.0, 1.0], "b")
+    time.sleep(0.02)
+    cache.store([1.0, 1.0], "c")
+    assert cache.evictions == 0
+    assert cache.stats()['size'] == 1
+
+
+def test_lookup_does_not_modify_query():
+    cache = SemanticCache(FakeEmbedding(), max_entries=2)
+    cache.store([3.0, 4.0], "a")
+    query = np.array([3.0, 4.0], dtype=np.float32)
+    assert cache.lookup(query) == "a"
+    assert query.tolist() == [3.0, 4.0]
+
+
+def test_embed_matches_model():
+    model = FakeEmbedding()
+    cache = SemanticCache(model)
+    assert asyncio.run(cache.embed("tarif consultation")) == model.get_query_embedding("tarif consultation")
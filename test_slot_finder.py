@@ -0,0 +1,88 @@
+"""Tests unitaires de l'extraction des préférences de créneaux (slot_finder.py)."""
+
+from datetime import datetime, time, timezone
+
+import pytest
+
+from availability_cache import TIMEZONE, BusyIndex
+from slot_finder import DAY_PERIODS, find_free_slots, parse_slot_preferences
+
+MONDAY, TUESDAY, THURSDAY, FRIDAY = 0, 1, 3, 4
+
+
+@pytest.mark.parametrize("text, not_before, not_after", [
+    ("après 17h", time(17, 0), None),
+    ("pas avant 10h", time(10, 0), None),
+    ("avant 11h30", None, time(11, 30)),
+    ("pas après 17h", None, time(17, 0)),
+    ("jusqu'à 12 heures 30", None, time(12, 30)),
+    ("after 5pm", time(17, 0), None),
+    ("after 5:30 pm", time(17, 30), None),
+    ("before 12am", None, time(0, 0)),
+    ("not before 9am", time(9, 0), None),
+])
+def test_hour_bounds(text, not_before, not_after):
+    constraints = parse_slot_preferences(text)
+    assert constraints.not_before == not_before
+    assert constraints.not_after == not_after
+
+
+def test_bare_number_is_not_an_hour():
+    constraints = parse_slot_preferences("après 2 semaines")
+    assert constraints.not_before is None
+
+
+@pytest.mark.parametrize("text", [
+    "pas lundi ni mardi",
+    "pas le lundi ou le mardi",
+    "ni lundi ni mardi",
+])
+def test_negation_carries_across_connectors(text):
+    constraints = parse_slot_preferences(text)
+    assert constraints.excluded_weekdays == {MONDAY, TUESDAY}
+    assert constraints.weekdays == set()
+
+
+def test_negation_stops_at_comma():
+    constraints = parse_slot_preferences("pas le matin, mardi de préférence")
+    assert constraints.weekdays == {TUESDAY}
+    assert constraints.excluded_periods == [DAY_PERIODS['matin']]
+
+
+def test_required_days_and_excluded_period():
+    constraints = parse_slot_preferences("mardi ou jeudi, pas le matin")
+    assert constraints.weekdays == {TUESDAY, THURSDAY}
+    assert constraints.excluded_periods == [DAY_PERIODS['matin']]
+
+
+@pytest.mark.parametrize("text", ["l'après-midi", "l'après midi", "l’apres midi", "in the afternoon"])
+def test_afternoon_is_not_lunch(text):
+    constraints = parse_slot_preferences(text)
+    assert constraints.periods == [DAY_PERIODS['apres-midi']]
+
+
+def test_combined_preferences():
+    constraints = parse_slot_preferences("dès 14h, pas le vendredi")
+    assert constraints.not_before == time(14, 0)
+    assert constraints.excluded_weekdays == {FRIDAY}
+
+
+def test_no_preferences():
+    constraints = parse_slot_preferences("")
+    assert constraints.accepts_day(MONDAY)
+    assert constraints.accepts_time(time(8, 0), time(8, 30))
+
+
+def test_slots_after_utc_busy_interval_stay_local():
+    # Intervalle occupé renvoyé en UTC par Google Calendar : 08:00-08:45 à Paris (heure d'été)
+    busy = BusyIndex()
+    busy.upsert("evt", datetime(2026, 6, 1, 6, 0, tzinfo=timezone.utc), datetime(2026, 6, 1, 6, 45, tzinfo=timezone.utc))
+    start = datetime(2026, 6, 1, 8, 0, tzinfo=TIMEZONE)
+    end = datetime(2026, 6, 1, 12, 0, tzinfo=TIMEZONE)
+
+    slots = find_free_slots(busy, start, end)
+    assert [slot.strftime("%H:%M") for slot in slots] == ["09:00", "09:30", "10:00"]
+    assert all(slot.tzinfo == TIMEZONE for slot in slots)
+
+    before_nine = find_free_slots(busy, start, end, parse_slot_preferences("avant 9h"))
+    assert before_nine == []
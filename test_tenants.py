@@ -0,0 +1,40 @@
+"""Tests unitaires de la résolution des cabinets (tenants.py)."""
+
+import json
+
+import pytest
+
+pytest.importorskip("livekit.agents")
+
+from fakes import FakeEmbedding, FakeIndex  # noqa: E402
+from tenants import DEFAULT_TENANT, Tenant, TenantConfig, TenantRegistry, UnknownTenantError  # noqa: E402
+
+
+@pytest.fixture
+def registry(tmp_path):
+    clinic = tmp_path / "clinic-a"
+    clinic.mkdir()
+    (clinic / "tenant.json").write_text(json.dumps({"calendar_id": "clinic-a@group", "practitioner": "a"}))
+    embed_model = FakeEmbedding()
+    default = Tenant(TenantConfig.default(), embed_model, index=FakeIndex())
+    return TenantRegistry(embed_model, default, tenants_dir=tmp_path)
+
+
+@pytest.mark.parametrize("tenant_id", ["clinic-b", "../etc"])
+def test_unknown_tenant_is_refused(registry, tenant_id):
+    with pytest.raises(UnknownTenantError):
+        registry.acquire(tenant_id)
+    assert registry.default.active_calls == 0
+
+
+def test_known_and_default_tenants(registry):
+    tenant = registry.get("clinic-a")
+    assert tenant is not registry.default
+    assert tenant.config.calendar_id == "clinic-a@group"
+    assert registry.get(DEFAULT_TENANT) is registry.default
+
+
+def test_metadata_tenant_is_kept_even_if_unknown(registry):
+    # Le refus est décidé par get() : resolve() ne doit pas retomber sur le cabinet par défaut
+    assert registry.resolve(json.dumps({"tenant": "clinic-b"}), "room") == "clinic-b"
+    assert registry.resolve(None, "clinic-b_call") == DEFAULT_TENANT
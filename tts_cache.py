@@ -0,0 +1,269 @@
+"""
+Cache audio des phrases fixes prononcées par l'agent.
+
+L'accueil, le refus des questions hors sujet et les phrases fixes des outils
+(voir CACHED_PHRASES dans prompts.py) sont synthétisés une seule fois par voix
+et modèle ElevenLabs, puis servis depuis des fichiers WAV mappés en mémoire :
+pas d'appel TTS, premier audio immédiat.
+
+Le texte à prononcer est découpé en phrases au fil de l'eau. Une phrase du
+cache est servie telle quelle ; les autres (dates, noms, réponses du LLM) sont
+synthétisées normalement, dans l'ordre. Tant que le début d'une phrase peut
+encore correspondre à une phrase du cache, son texte est retenu ; dès qu'il
+ne le peut plus, il part vers le TTS sans attendre la fin de la phrase.
+
+Remplissage : `python agent.py build-tts-cache` (hors ligne), sinon en tâche
+de fond au premier appel d'un processus. Seules les phrases fixes sont
+stockées, jamais le contenu de la conversation.
+"""
+
+import os
+import re
+import mmap
+import wave
+import asyncio
+import hashlib
+import logging
+from bisect import bisect_left
+from contextlib import aclosing
+from typing import AsyncGenerator, AsyncIterable, Dict, Iterable, List, Optional
+
+from livekit import rtc
+from livekit.agents import Agent, utils
+
+logger = logging.getLogger(__name__)
+
+# Dossier des phrases synthétisées ("" = cache désactivé)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./tts_cache")
+# Synthèse en tâche de fond des phrases absentes au premier appel d'un processus
+TTS_CACHE_FILL = os.getenv("TTS_CACHE_FILL", "1") == "1"
+# Durée (ms) des trames audio servies depuis le cache
+FRAME_MS = 20
+
+# Fin de phrase : ponctuation finale suivie d'un espace ("Parfait ! Votre...")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def phrase_key(text: str) -> str:
+    """Clé de correspondance : espaces et apostrophes uniformisés."""
+    return " ".join(text.replace("’", "'").split())
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END_RE.split(text.strip()) if sentence]
+
+
+class _CachedPhrase:
+    """Audio PCM 16 bits d'une phrase, mappé en mémoire depuis son fichier WAV."""
+
+    def __init__(self, path: str):
+        with wave.open(path, "rb") as wav:
+            self.sample_rate = wav.getframerate()
+            self.num_channels = wav.getnchannels()
+            size = wav.getnframes() * self.num_channels * wav.getsampwidth()
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Données PCM en fin de fichier (WAV écrit par PhraseCache.fill)
+        self._data = memoryview(self._mmap)[len(self._mmap) - size:]
+
+    @property
+    def duration(self) -> float:
+        return len(self._data) / (2 * self.num_channels * self.sample_rate)
+
+    async def frames(self) -> AsyncGenerator[rtc.AudioFrame, None]:
+        # Trames découpées sans copie dans la zone mappée
+        step = self.sample_rate * FRAME_MS // 1000 * self.num_channels * 2
+        for start in range(0, len(self._data), step):
+            chunk = self._data[start:start + step]
+            yield rtc.AudioFrame(chunk, self.sample_rate, self.num_channels, len(chunk) // (2 * self.num_channels))
+
+
+class PhraseCache:
+    """
+    Phrases fixes synthétisées pour une voix et un modèle TTS.
+
+    Args:
+        voice_id: Voix ElevenLabs (fait partie de la clé du cache)
+        model: Modèle ElevenLabs (fait partie de la clé du cache)
+        phrases: Textes fixes, découpés en phrases mises en cache séparément
+        cache_dir: Dossier des fichiers WAV ("" = cache désactivé)
+    """
+
+    def __init__(self, voice_id: str, model: str, phrases: Iterable[str], cache_dir: str = TTS_CACHE_DIR):
+        self.voice_id = voice_id
+        self.model = model
+        self.cache_dir = cache_dir
+        # Clé normalisée -> texte envoyé au TTS
+        self._texts: Dict[str, str] = {}
+        for phrase in phrases:
+            for sentence in split_sentences(phrase):
+                self._texts.setdefault(phrase_key(sentence), sentence)
+        self._audio: Dict[str, _CachedPhrase] = {}
+        # Clés disponibles triées, pour tester un début de phrase par bisection
+        self._keys: List[str] = []
+        self._fill_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.cache_dir) and bool(self._audio)
+
+    @property
+    def missing(self) -> List[str]:
+        return [text for key, text in self._texts.items() if key not in self._audio]
+
+    def path(self, key: str) -> str:
+        digest = hashlib.sha1(f"{self.voice_id}\0{self.model}\0{key}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.wav")
+
+    def load(self) -> int:
+        """Mappe en mémoire les phrases déjà synthétisées. Renvoie le nombre de phrases disponibles."""
+        if not self.cache_dir:
+            return 0
+        for key in self._texts:
+            path = self.path(key)
+            if key in self._audio or not os.path.exists(path):
+                continue
+            try:
+                self._audio[key] = _CachedPhrase(path)
+            except (OSError, EOFError, wave.Error) as e:
+                logger.warning(f"Ignoring unreadable TTS cache file {path}: {e}")
+        self._keys = sorted(self._audio)
+        logger.info(f"TTS phrase cache: {len(self._audio)}/{len(self._texts)} phrases available")
+        return len(self._audio)
+
+    def lookup(self, sentence: str) -> Optional[_CachedPhrase]:
+        return self._audio.get(phrase_key(sentence))
+
+    def could_match(self, prefix: str) -> bool:
+        """Vrai si ce début de phrase peut encore devenir une phrase du cache."""
+        key = phrase_key(prefix)
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i].startswith(key)
+
+    # -------------------- remplissage --------------------
+
+    async def fill(self, tts) -> int:
+        """
+        Synthétise et enregistre les phrases absentes.
+
+        Args:
+            tts: Instance TTS livekit de la même voix et du même modèle
+
+        Returns:
+            Nombre de phrases ajoutées
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Phrases éventuellement écrites entre-temps par un autre processus
+        self.load()
+        written = 0
+        for text in self.missing:
+            async with tts.synthesize(text) as stream:
+                frames = [ev.frame async for ev in stream]
+            if not frames:
+                continue
+            key = phrase_key(text)
+            self._write(self.path(key), rtc.combine_audio_frames(frames))
+            self._audio[key] = _CachedPhrase(self.path(key))
+            written += 1
+        self._keys = sorted(self._audio)
+        logger.info(f"TTS phrase cache: {written} phrases synthesized")
+        return written
+
+    @staticmethod
+    def _write(path: str, frame: rtc.AudioFrame) -> None:
+        # Écriture atomique : un autre processus ne lit jamais un fichier partiel
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with wave.open(tmp_path, "wb") as wav:
+            wav.setnchannels(frame.num_channels)
+            wav.setsampwidth(2)
+            wav.setframerate(frame.sample_rate)
+            wav.writeframes(bytes(frame.data))
+        os.replace(tmp_path, path)
+
+    def fill_in_background(self, tts) -> None:
+        """Lance la synthèse des phrases absentes sans bloquer l'appel en cours (une fois par processus)."""
+        if not TTS_CACHE_FILL or not self.cache_dir or not self.missing or self._fill_task is not None:
+            return
+
+        def _done(task: asyncio.Task) -> None:
+            self._fill_task = None
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"TTS phrase cache fill failed: {task.exception()}")
+
+        self._fill_task = asyncio.create_task(self.fill(tts))
+        self._fill_task.add_done_callback(_done)
+
+
+async def cached_tts_node(
+    agent: Agent, text: AsyncIterable[str], model_settings, cache: PhraseCache
+) -> AsyncGenerator[rtc.AudioFrame, None]:
+    """
+    tts_node de l'agent : phrases du cache servies directement, le reste
+    synthétisé par le TTS de la session, dans l'ordre du texte.
+    """
+    # Suite ordonnée de sources audio (audio du cache ou synthèse en cours), None = fin
+    parts: asyncio.Queue = asyncio.Queue()
+
+    async def split_text() -> None:
+        live: Optional[utils.aio.Chan] = None
+        buffer = ""
+        # Phrase en cours déjà confiée au TTS : son texte suit sans attendre
+        streaming = False
+
+        def synthesize(chunk: str) -> None:
+            nonlocal live
+            if live is None:
+                live = utils.aio.Chan()
+                parts.put_nowait(Agent.default.tts_node(agent, live, model_settings))
+            live.send_nowait(chunk)
+
+        def serve(cached: _CachedPhrase) -> None:
+            nonlocal live
+            if live is not None:
+                live.close()
+                live = None
+            parts.put_nowait(cached.frames())
+
+        try:
+            async for chunk in text:
+                buffer += chunk
+                while buffer:
+                    end = _SENTENCE_END_RE.search(buffer)
+                    if streaming:
+                        cut = end.end() if end else len(buffer)
+                        synthesize(buffer[:cut])
+                        buffer = buffer[cut:]
+                        streaming = end is None
+                    elif end is not None:
+                        sentence, buffer = buffer[:end.end()], buffer[end.end():]
+                        cached = cache.lookup(sentence)
+                        if cached is not None:
+                            serve(cached)
+                        else:
+                            synthesize(sentence)
+                    elif not cache.could_match(buffer):
+                        synthesize(buffer)
+                        buffer = ""
+                        streaming = True
+                    else:
+                        break
+            if buffer.strip():
+                cached = None if streaming else cache.lookup(buffer)
+                if cached is not None:
+                    serve(cached)
+                else:
+                    synthesize(buffer)
+        finally:
+            if live is not None:
+                live.close()
+            parts.put_nowait(None)
+
+    producer = asyncio.create_task(split_text())
+    try:
+        while (part := await parts.get()) is not None:
+            async with aclosing(part):
+                async for frame in part:
+                    yield frame
+        await producer
+    finally:
+        await utils.aio.cancel_and_wait(producer)